@@ -0,0 +1,21 @@
+from django.utils.functional import SimpleLazyObject
+
+from .roles import get_user_role
+
+
+class RoleMiddleware:
+    """
+    Set ``request.role`` to the role of ``request.user`` ('admin', 'support',
+    'client' or None when anonymous).
+
+    The role is resolved on first use, so for API views it reflects the user
+    that DRF authenticated (DRF assigns that user to the underlying
+    HttpRequest). Compare it with ``==``/``in``; it is a lazy object, so an
+    ``is None`` test never matches.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: get_user_role(request.user))
+        return self.get_response(request)
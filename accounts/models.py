@@ -17,6 +17,26 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.role}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the role as loaded so that saves can tell a role change,
+        # which revokes the user's tokens, without reading it again
+        if 'role' in field_names:
+            instance._loaded_role = values[field_names.index('role')]
+        return instance
+
+class TokenRevocation(models.Model):
+    """
+    JWT deny-list entry: tokens of ``user`` issued before ``not_before``
+    are rejected. See accounts/tokens.py.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='token_revocation')
+    not_before = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - tokens before {self.not_before}"
 
 # Signal to create user profile when a new user is created
 # @receiver(post_save, sender=User)
@@ -26,4 +46,6 @@ class UserProfile(models.Model):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # A new user's profile is only created by accounts.signals, after this
+    if hasattr(instance, 'profile'):
+        instance.profile.save()
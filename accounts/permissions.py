@@ -5,30 +5,28 @@ class IsAdmin(permissions.BasePermission):
     Custom permission to only allow admin users to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and hasattr(request.user, 'profile') and request.user.profile.role == 'admin'
+        return request.role == 'admin'
 
 class IsSupport(permissions.BasePermission):
     """
     Custom permission to only allow support users to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and hasattr(request.user, 'profile') and request.user.profile.role == 'support'
+        return request.role == 'support'
 
 class IsClient(permissions.BasePermission):
     """
     Custom permission to only allow client users to access the view.
     """
     def has_permission(self, request, view):
-        return request.user and hasattr(request.user, 'profile') and request.user.profile.role == 'client'
+        return request.role == 'client'
 
 class IsAdminOrSupport(permissions.BasePermission):
     """
     Custom permission to only allow admin or support users to access the view.
     """
     def has_permission(self, request, view):
-        if not request.user or not hasattr(request.user, 'profile'):
-            return False
-        return request.user.profile.role in ['admin', 'support']
+        return request.role in ['admin', 'support']
 
 class IsTicketOwner(permissions.BasePermission):
     """
@@ -0,0 +1,18 @@
+from django.core.exceptions import ObjectDoesNotExist
+
+
+def get_user_role(user):
+    """
+    Return the role of an authenticated user, or None for anonymous users
+    and users without a profile. Users built from JWT claims carry their
+    role in ``token_role``.
+    """
+    if not user or not user.is_authenticated:
+        return None
+    token_role = getattr(user, 'token_role', None)
+    if token_role is not None:
+        return token_role
+    try:
+        return user.profile.role
+    except ObjectDoesNotExist:
+        return None
@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth.models import User
 from .models import UserProfile
+from .tokens import add_user_claims, is_token_revoked
 
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -49,4 +52,22 @@ class RegisterSerializer(serializers.ModelSerializer):
             last_name=validated_data.get('last_name', ''),
             password=validated_data['password']
         )
-        return user
\ No newline at end of file
+        return user
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues tokens carrying the user's username and role, which the API can
+    authenticate without a user lookup (see accounts/tokens.py).
+    """
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+class DenyListTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refuses to refresh tokens that were revoked.
+    """
+    def validate(self, attrs):
+        if is_token_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import UserProfile
+from .tokens import revoke_user_tokens
+
+CREDENTIAL_FIELDS = ('password', 'is_active')
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -12,3 +15,49 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+@receiver(post_init, sender=User)
+def remember_loaded_credentials(sender, instance, **kwargs):
+    """
+    Remember the password and active flag as loaded (for users read from
+    the database), so saves can tell a change without reading them again.
+    Users built from token claims load neither.
+    """
+    instance._loaded_credentials = {
+        field: instance.__dict__[field] for field in CREDENTIAL_FIELDS if field in instance.__dict__
+    }
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_credential_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Tokens carry the user's identity and role, so changing the password or
+    deactivating the account must invalidate the tokens already issued.
+    """
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not set(CREDENTIAL_FIELDS) & set(update_fields):
+        return
+    stored = getattr(instance, '_loaded_credentials', {})
+    if len(stored) < len(CREDENTIAL_FIELDS):
+        stored = User.objects.filter(pk=instance.pk).values(*CREDENTIAL_FIELDS).first()
+    if stored and (stored['password'] != instance.password or (stored['is_active'] and not instance.is_active)):
+        revoke_user_tokens(instance)
+
+@receiver(post_save, sender=User)
+def remember_saved_credentials(sender, instance, raw=False, **kwargs):
+    remember_loaded_credentials(sender, instance)
+
+@receiver(pre_save, sender=UserProfile)
+def revoke_tokens_on_role_change(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if hasattr(instance, '_loaded_role'):
+        stored_role = instance._loaded_role
+    else:
+        stored_role = UserProfile.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+    if stored_role is not None and stored_role != instance.role:
+        revoke_user_tokens(instance.user)
+
+@receiver(post_save, sender=UserProfile)
+def remember_saved_role(sender, instance, raw=False, **kwargs):
+    instance._loaded_role = instance.role
@@ -1,3 +1,77 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .authentication import ProfileJWTAuthentication
+from .models import TokenRevocation, UserProfile
+from .tokens import get_deny_list
+
+
+class JWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', 'agent@example.com', 'password')
+        UserProfile.objects.filter(user=cls.user).update(role='support')
+
+    def setUp(self):
+        cache.clear()
+
+    def obtain_tokens(self):
+        response = APIClient().post('/accounts/api/token/', {'username': 'agent', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def api_client(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def test_token_carries_claims(self):
+        token = AccessToken(self.obtain_tokens()['access'])
+        self.assertEqual(token['username'], 'agent')
+        self.assertEqual(token['role'], 'support')
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_stateless_authentication_runs_no_query(self):
+        access = self.obtain_tokens()['access']
+        request = RequestFactory().get('/api/tickets/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        get_deny_list()
+        with self.assertNumQueries(0):
+            user, token = ProfileJWTAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.username, user.token_role), (self.user.pk, 'agent', 'support'))
+
+    def test_revoked_tokens_are_rejected(self):
+        tokens = self.obtain_tokens()
+        client = self.api_client(tokens['access'])
+        self.assertEqual(client.get('/api/tickets/').status_code, 200)
+
+        self.assertEqual(client.post('/accounts/api/token/revoke/').status_code, 204)
+        self.assertEqual(client.get('/api/tickets/').status_code, 401)
+        response = APIClient().post('/accounts/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        client = self.api_client(self.obtain_tokens()['access'])
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new password')
+        user.save()
+        self.assertEqual(client.get('/api/tickets/').status_code, 401)
+
+    def test_role_change_revokes_tokens(self):
+        client = self.api_client(self.obtain_tokens()['access'])
+        profile = UserProfile.objects.get(user=self.user)
+        profile.role = 'client'
+        profile.save()
+        self.assertEqual(client.get('/api/tickets/').status_code, 401)
+
+    def test_other_changes_keep_tokens_without_reading_the_user_again(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        user.first_name = 'Ada'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse([query['sql'] for query in queries if query['sql'].startswith('SELECT')])
+        self.assertFalse(TokenRevocation.objects.exists())
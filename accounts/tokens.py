@@ -0,0 +1,91 @@
+"""
+JWT claims and revocation.
+
+Tokens issued by ``/accounts/api/token/`` carry the user's ``username`` and
+``role``. With the ``JWT_STATELESS_AUTH`` setting enabled the API builds the
+request user from those claims instead of loading it (see
+accounts.authentication.ProfileJWTAuthentication).
+
+Since such tokens are trusted without a user lookup, revocation works through
+a per-user deny-list: TokenRevocation rows reject every token issued before
+their ``not_before``. The whole list is small (entries older than the longest
+token lifetime are dropped) and is cached for ``JWT_DENY_LIST_CACHE_TIMEOUT``
+seconds. Revoking clears the cache entry; with a per-process cache other
+processes notice within that timeout.
+"""
+import math
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from support_system.query_budget import exempt_from_query_budget
+
+from .models import TokenRevocation
+from .roles import get_user_role
+
+USERNAME_CLAIM = 'username'
+ROLE_CLAIM = 'role'
+
+DENY_LIST_CACHE_KEY = 'accounts:jwt-deny-list'
+
+
+def add_user_claims(token, user):
+    token[USERNAME_CLAIM] = user.get_username()
+    token[ROLE_CLAIM] = get_user_role(user)
+    return token
+
+
+def user_from_claims(token):
+    """
+    Return a User for the token without querying the database. Only the id
+    and username are loaded; any other field is fetched from the database
+    the first time it is read. The role is kept on ``token_role``.
+    """
+    # The id claim is a string; compared to loaded users the pk must not be
+    user_id = User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+    user = User.from_db(None, ['id', 'username'], [user_id, token[USERNAME_CLAIM]])
+    user.token_role = token[ROLE_CLAIM]
+    return user
+
+
+def get_token_lifetime():
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+
+
+def get_deny_list():
+    """
+    Return ``{str(user_id): not_before timestamp}`` for all current
+    revocations (the user id claim is a string).
+    """
+    deny_list = cache.get(DENY_LIST_CACHE_KEY)
+    if deny_list is None:
+        cutoff = timezone.now() - get_token_lifetime()
+        with exempt_from_query_budget():
+            deny_list = {
+                str(user_id): not_before.timestamp()
+                for user_id, not_before in TokenRevocation.objects.filter(
+                    not_before__gt=cutoff
+                ).values_list('user_id', 'not_before')
+            }
+        cache.set(DENY_LIST_CACHE_KEY, deny_list, getattr(settings, 'JWT_DENY_LIST_CACHE_TIMEOUT', 30))
+    return deny_list
+
+
+def is_token_revoked(token):
+    not_before = get_deny_list().get(str(token.get(api_settings.USER_ID_CLAIM)))
+    # Tokens issued in the same second as the revocation are rejected too
+    return not_before is not None and token.get('iat', 0) < math.ceil(not_before)
+
+
+def revoke_user_tokens(user):
+    """
+    Reject all tokens issued to ``user`` so far.
+    """
+    now = timezone.now()
+    TokenRevocation.objects.update_or_create(user=user, defaults={'not_before': now})
+    # No token issued before these can still be valid
+    TokenRevocation.objects.filter(not_before__lte=now - get_token_lifetime()).delete()
+    cache.delete(DENY_LIST_CACHE_KEY)
@@ -2,7 +2,7 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     # API views
-    RegisterAPIView, UserListView, UserDetailView, UserProfileAPIUpdateView,
+    RegisterAPIView, UserListView, UserDetailView, UserProfileAPIUpdateView, TokenRevokeAPIView,
     # Template views
     LoginView, logout_view, RegisterView, ProfileView, ProfileUpdateView
 )
@@ -13,6 +13,7 @@ api_urlpatterns = [
     path('api/register/', RegisterAPIView.as_view(), name='api-register'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeAPIView.as_view(), name='token_revoke'),
     
     # User management endpoints
     path('api/users/', UserListView.as_view(), name='user-list'),
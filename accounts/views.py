@@ -14,6 +14,7 @@ from django.urls import reverse_lazy
 from .models import UserProfile
 from .serializers import UserSerializer, RegisterSerializer
 from .permissions import IsAdmin
+from .tokens import revoke_user_tokens
 from .forms import UserRegistrationForm, UserProfileUpdateForm
 
 # API Views
@@ -22,6 +23,16 @@ class RegisterAPIView(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer
 
+class TokenRevokeAPIView(generics.GenericAPIView):
+    """
+    Log out everywhere: revoke every token issued to the current user.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, *args, **kwargs):
+        revoke_user_tokens(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # Template Views
 class LoginView(FormView):
     template_name = 'accounts/login.html'
@@ -100,27 +111,33 @@ class ProfileView(TemplateView):
         user = self.request.user
         
         # Add ticket statistics based on user role
-        if user.profile.role == 'client':
+        if self.request.role == 'client':
             from tickets.models import Ticket
-            context['tickets_count'] = Ticket.objects.filter(created_by=user).count()
-            context['open_tickets_count'] = Ticket.objects.filter(created_by=user, status__in=['open', 'in_progress', 'pending']).count()
-            context['closed_tickets_count'] = Ticket.objects.filter(created_by=user, status__in=['resolved', 'closed']).count()
+            from tickets.counters import TicketCounts
+            counts = TicketCounts.for_creator(user)
+            context['tickets_count'] = counts.count()
+            context['open_tickets_count'] = counts.count(status=['open', 'in_progress', 'pending'])
+            context['closed_tickets_count'] = counts.count(status=['resolved', 'closed'])
             context['recent_tickets'] = Ticket.objects.filter(created_by=user).order_by('-updated_at')[:5]
         
-        elif user.profile.role == 'support':
+        elif self.request.role == 'support':
             from tickets.models import Ticket
-            context['assigned_tickets_count'] = Ticket.objects.filter(assigned_to=user).count()
-            context['pending_tickets_count'] = Ticket.objects.filter(assigned_to=user, status__in=['open', 'in_progress', 'pending']).count()
-            context['resolved_tickets_count'] = Ticket.objects.filter(assigned_to=user, status__in=['resolved', 'closed']).count()
+            from tickets.counters import TicketCounts
+            counts = TicketCounts.for_assignee(user)
+            context['assigned_tickets_count'] = counts.count(assignee_key=user.pk)
+            context['pending_tickets_count'] = counts.count(assignee_key=user.pk, status=['open', 'in_progress', 'pending'])
+            context['resolved_tickets_count'] = counts.count(assignee_key=user.pk, status=['resolved', 'closed'])
             context['recent_tickets'] = Ticket.objects.filter(assigned_to=user).order_by('-updated_at')[:5]
         
-        elif user.profile.role == 'admin':
+        elif self.request.role == 'admin':
             from tickets.models import Ticket
+            from tickets.counters import ANY, NONE, TicketCounts
             from django.contrib.auth.models import User
-            context['total_tickets_count'] = Ticket.objects.all().count()
+            counts = TicketCounts.for_admin()
+            context['total_tickets_count'] = counts.count(assignee_key=ANY)
             context['users_count'] = User.objects.all().count()
-            context['unassigned_tickets_count'] = Ticket.objects.filter(assigned_to=None).count()
-            context['closed_tickets_count'] = Ticket.objects.filter(status__in=['resolved', 'closed']).count()
+            context['unassigned_tickets_count'] = counts.count(assignee_key=NONE)
+            context['closed_tickets_count'] = counts.count(assignee_key=ANY, status=['resolved', 'closed'])
             context['recent_tickets'] = Ticket.objects.all().order_by('-updated_at')[:5]
         
         return context
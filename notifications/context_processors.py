@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from .unread import get_notification_summary
+
+
+def notifications(request):
+    """
+    Add ``notification_summary`` (the unread count and the most recent
+    notifications, see notifications.unread.get_notification_summary) for
+    logged-in users. It is loaded, usually from the cache, on first use.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'notification_summary': SimpleLazyObject(lambda: get_notification_summary(user))}
@@ -0,0 +1,127 @@
+"""
+Email delivery over reused backend connections.
+
+``send_mail`` opens and closes an SMTP connection for every call. PooledMailer
+keeps one backend connection open across many messages instead and replaces
+it after ``EMAIL_MAX_MESSAGES_PER_CONNECTION`` messages (many servers limit
+the messages per session) or after an error, since a failed send can leave
+the SMTP session in an unknown state. A mailer is not thread-safe: concurrent
+senders each use their own (see notifications.outbox.process_batch).
+
+Queued emails go out as one message per recipient, so recipients don't see
+each other's addresses and a rejected address doesn't block the others.
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from support_system.metrics import EMAIL_SEND_DURATION, EMAIL_SEND_FAILURES
+
+
+def get_max_messages_per_connection():
+    return getattr(settings, 'EMAIL_MAX_MESSAGES_PER_CONNECTION', 100)
+
+
+def personalized_messages(subject, body, from_email, recipients):
+    """
+    Return ``[(recipient, EmailMessage)]`` with one message per recipient.
+    """
+    return [
+        (recipient, EmailMessage(subject, body, from_email, [recipient]))
+        for recipient in recipients
+    ]
+
+
+class DeliveryStats:
+    """
+    Counters for one or more mailers.
+    """
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self.seconds = 0.0
+
+    def merge(self, other):
+        self.sent += other.sent
+        self.failed += other.failed
+        self.connections += other.connections
+        self.seconds += other.seconds
+        return self
+
+    @property
+    def throughput(self):
+        """
+        Messages delivered per second spent sending.
+        """
+        return self.sent / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.sent} sent, {self.failed} failed over {self.connections} connections '
+            f'({self.throughput:.1f} messages/s)'
+        )
+
+
+class PooledMailer:
+    """
+    Send messages over a reused backend connection::
+
+        with PooledMailer() as mailer:
+            for message in messages:
+                mailer.send(message)
+        print(mailer.stats)
+
+    ``backend`` and ``connection_kwargs`` are passed to get_connection().
+    """
+    def __init__(self, backend=None, max_messages_per_connection=None, **connection_kwargs):
+        self.backend = backend
+        self.connection_kwargs = connection_kwargs
+        self.max_messages_per_connection = max_messages_per_connection or get_max_messages_per_connection()
+        self.connection = None
+        self.connection_messages = 0
+        self.stats = DeliveryStats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, message):
+        """
+        Send one message, raising the backend's error if it fails.
+        """
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = get_connection(self.backend, fail_silently=False, **self.connection_kwargs)
+                self.connection.open()
+                self.connection_messages = 0
+                self.stats.connections += 1
+            self.connection.send_messages([message])
+        except Exception as exc:
+            self.stats.failed += 1
+            EMAIL_SEND_DURATION.observe(time.perf_counter() - started, outcome='failed')
+            EMAIL_SEND_FAILURES.inc(error=type(exc).__name__)
+            self.close()
+            raise
+        finally:
+            self.stats.seconds += time.perf_counter() - started
+        EMAIL_SEND_DURATION.observe(time.perf_counter() - started, outcome='sent')
+
+        self.stats.sent += 1
+        self.connection_messages += 1
+        if self.connection_messages >= self.max_messages_per_connection:
+            self.close()
+
+    def close(self):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        try:
+            connection.close()
+        except Exception:
+            # The session is being dropped anyway
+            pass
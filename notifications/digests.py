@@ -0,0 +1,137 @@
+"""
+Email digests.
+
+Users choose on their notification preferences whether notification emails
+are sent immediately (the default) or collected into an hourly or daily
+digest. Emails for digest users are stored as EmailDigestEntry rows instead
+of being queued. ``manage.py send_email_digests``, run every few minutes,
+turns each user's pending entries into a single email once the oldest of
+them has waited for the user's window, so a busy conversation costs a digest
+user at most one email per window. Updates on urgent tickets always go out
+immediately.
+"""
+import textwrap
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import EmailDigestEntry, NotificationPreference
+from .outbox import queue_email, queue_emails
+
+# How long the oldest pending entry waits before the digest is sent. Entries
+# left over from before a user switched back to immediate emails go out on
+# the next run.
+WINDOWS = {
+    NotificationPreference.IMMEDIATE: timedelta(0),
+    NotificationPreference.HOURLY: timedelta(hours=1),
+    NotificationPreference.DAILY: timedelta(days=1),
+}
+
+
+def queue_notification_email(users, subject, message, urgent=False):
+    """
+    Email ``message`` to each of ``users`` (None entries are skipped) that
+    has an address and email notifications enabled. Users who want immediate
+    emails share one queued email, and so does everyone when ``urgent``; the
+    others get a digest entry.
+    """
+    queue_notification_emails([(users, subject, message, urgent)])
+
+
+def queue_notification_emails(emails):
+    """
+    Queue several notification emails, ``[(users, subject, message,
+    urgent)]``, like queue_notification_email but with one insert into the
+    outbox and one into the digest entries. The users' notification
+    preferences should be loaded with them.
+    """
+    immediate_emails = []
+    entries = []
+    for users, subject, message, urgent in emails:
+        immediate = []
+        seen = set()
+        for user in users:
+            if user is None or user.pk in seen or not user.email:
+                continue
+            seen.add(user.pk)
+            try:
+                preferences = user.notification_preferences
+            except NotificationPreference.DoesNotExist:
+                continue
+            if not preferences.email_notifications:
+                continue
+            if urgent or preferences.email_frequency == NotificationPreference.IMMEDIATE:
+                immediate.append(user.email)
+            else:
+                entries.append(EmailDigestEntry(user=user, subject=subject, body=message))
+        if immediate:
+            immediate_emails.append((subject, message, immediate))
+
+    if immediate_emails:
+        queue_emails(immediate_emails)
+    if entries:
+        EmailDigestEntry.objects.bulk_create(entries)
+
+
+def due_digest_users(now=None):
+    """
+    Return the ids of the users whose digest is due.
+    """
+    now = now or timezone.now()
+    due = set()
+    for frequency, window in WINDOWS.items():
+        due.update(
+            EmailDigestEntry.objects.filter(user__notification_preferences__email_frequency=frequency)
+            .values('user_id')
+            .annotate(oldest=Min('created_at'))
+            .filter(oldest__lte=now - window)
+            .values_list('user_id', flat=True)
+        )
+    return sorted(due)
+
+
+def send_digest(user):
+    """
+    Queue one email with all of ``user``'s pending entries and remove them.
+    Returns the number of entries sent.
+    """
+    with transaction.atomic():
+        entries = list(EmailDigestEntry.objects.select_for_update().filter(user=user).order_by('created_at', 'pk'))
+        if not entries:
+            return 0
+        if user.email:
+            if len(entries) == 1:
+                subject, message = entries[0].subject, entries[0].body
+            else:
+                subject = f'{len(entries)} ticket updates'
+                message = render_to_string('notifications/email/digest.txt', {
+                    'user': user,
+                    'entries': [
+                        {
+                            'created_at': entry.created_at,
+                            'subject': entry.subject,
+                            'body': textwrap.dedent(entry.body).strip(),
+                        }
+                        for entry in entries
+                    ],
+                })
+            queue_email(subject, message, [user.email])
+        EmailDigestEntry.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+    return len(entries)
+
+
+def send_due_digests(now=None):
+    """
+    Send every due digest. Returns ``(digests, entries)`` sent.
+    """
+    digests = entries = 0
+    for user in User.objects.filter(pk__in=due_digest_users(now)).order_by('pk'):
+        sent = send_digest(user)
+        if sent:
+            digests += 1
+            entries += sent
+    return digests, entries
@@ -1,10 +1,23 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
 from django.urls import reverse
 
+from .digests import queue_notification_email, queue_notification_emails
+
+def load_recipients(user_ids):
+    """
+    Load the users with ``user_ids`` (None entries are skipped) together with
+    their notification preferences, in one query
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return []
+    return list(User.objects.filter(pk__in=user_ids).select_related('notification_preferences'))
+
 def send_ticket_creation_notification(ticket):
     """
-    Send email notification when a new ticket is created
+    Queue an email notification when a new ticket is created
     """
     subject = f'New Ticket Created: {ticket.title}'
     message = f'''
@@ -18,49 +31,17 @@ def send_ticket_creation_notification(ticket):
     Created by: {ticket.created_by.username}
     '''
     
-    # Get admin users who have email notifications enabled
-    from django.contrib.auth.models import User
-    from .models import NotificationPreference
-    
-    admins = User.objects.filter(
-        profile__role='admin',
-        notification_preferences__email_notifications=True
-    )
-    
-    # Create recipient list
-    recipient_list = []
-    
-    # Add admins to recipient list
-    for admin in admins:
-        if admin.email:
-            recipient_list.append(admin.email)
-    
-    # Add assigned user if they have email notifications enabled
-    if ticket.assigned_to and ticket.assigned_to.email:
-        try:
-            if ticket.assigned_to.notification_preferences.email_notifications:
-                recipient_list.append(ticket.assigned_to.email)
-        except NotificationPreference.DoesNotExist:
-            pass
+    # Admins and the assigned user, each according to their email
+    # preferences
+    recipients = User.objects.filter(
+        Q(profile__role='admin', notification_preferences__email_notifications=True) |
+        Q(pk=ticket.assigned_to_id)
+    ).select_related('notification_preferences')
     
-    # Only send if there are recipients
-    if recipient_list:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            recipient_list,
-            fail_silently=False,
-        )
+    queue_notification_email(recipients, subject, message, urgent=ticket.priority == 'urgent')
 
-def send_ticket_update_notification(ticket, previous_status):
-    """
-    Send email notification when a ticket's status is updated
-    """
-    subject = f'Ticket Status Updated: {ticket.title}'
-    message = f'''
-    A ticket's status has been updated:
-    
+def ticket_update_details(ticket, previous_status):
+    return f'''
     Title: {ticket.title}
     Previous Status: {previous_status}
     New Status: {ticket.get_status_display()}
@@ -68,41 +49,56 @@ def send_ticket_update_notification(ticket, previous_status):
     Category: {ticket.category.name if ticket.category else 'Not specified'}
     Department: {ticket.department.name if ticket.department else 'Not specified'}
     '''
+
+def send_ticket_update_notification(ticket, previous_status):
+    """
+    Queue an email notification when a ticket's status is updated
+    """
+    subject = f'Ticket Status Updated: {ticket.title}'
+    message = f'''
+    A ticket's status has been updated:
+    {ticket_update_details(ticket, previous_status)}'''
     
-    from .models import NotificationPreference
-    
-    # Create recipient list
-    recipient_list = []
-    
-    # Add ticket creator if they have email notifications enabled
-    if ticket.created_by and ticket.created_by.email:
-        try:
-            if ticket.created_by.notification_preferences.email_notifications:
-                recipient_list.append(ticket.created_by.email)
-        except NotificationPreference.DoesNotExist:
-            pass
-    
-    # Add assigned user if they have email notifications enabled
-    if ticket.assigned_to and ticket.assigned_to.email:
-        try:
-            if ticket.assigned_to.notification_preferences.email_notifications:
-                recipient_list.append(ticket.assigned_to.email)
-        except NotificationPreference.DoesNotExist:
-            pass
+    # The ticket creator and the assigned user, each according to their
+    # email preferences
+    recipients = load_recipients([ticket.created_by_id, ticket.assigned_to_id])
     
-    # Only send if there are recipients
-    if recipient_list:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            recipient_list,
-            fail_silently=False,
-        )
+    queue_notification_email(recipients, subject, message, urgent=ticket.priority == 'urgent')
+
+def send_ticket_updates_notification(updates):
+    """
+    Queue the status update emails for several tickets, ``[(ticket,
+    previous_status)]``, with one email per recipient listing all of their
+    updated tickets
+    """
+    # The ticket creator and the assigned user of each ticket
+    updates_by_user = {}
+    for ticket, previous_status in updates:
+        for user in (ticket.created_by, ticket.assigned_to):
+            if user is not None:
+                updates_by_user.setdefault(user.pk, (user, []))[1].append((ticket, previous_status))
+    
+    emails = []
+    for user, user_updates in updates_by_user.values():
+        if len(user_updates) == 1:
+            ticket, previous_status = user_updates[0]
+            subject = f'Ticket Status Updated: {ticket.title}'
+            message = f'''
+    A ticket's status has been updated:
+    {ticket_update_details(ticket, previous_status)}'''
+        else:
+            subject = f'{len(user_updates)} Tickets Updated'
+            message = f'''
+    The status of {len(user_updates)} tickets has been updated:
+    ''' + ''.join(ticket_update_details(ticket, previous_status) for ticket, previous_status in user_updates)
+        urgent = any(ticket.priority == 'urgent' for ticket, previous_status in user_updates)
+        emails.append(([user], subject, message, urgent))
+    
+    queue_notification_emails(emails)
 
 def send_comment_notification(comment):
     """
-    Send email notification when a new comment is added to a ticket
+    Queue an email notification when a new comment is added to a ticket
     """
     ticket = comment.ticket
     subject = f'New Comment on Ticket: {ticket.title}'
@@ -120,33 +116,11 @@ def send_comment_notification(comment):
     View the ticket at: {ticket_url}
     '''
     
-    from .models import NotificationPreference
-    
-    # Create recipient list
-    recipient_list = []
-    
-    # Add ticket creator if they have email notifications enabled and didn't make the comment
-    if ticket.created_by and ticket.created_by.email and ticket.created_by != comment.author:
-        try:
-            if ticket.created_by.notification_preferences.email_notifications:
-                recipient_list.append(ticket.created_by.email)
-        except NotificationPreference.DoesNotExist:
-            pass
-    
-    # Add assigned user if they have email notifications enabled and didn't make the comment
-    if ticket.assigned_to and ticket.assigned_to.email and ticket.assigned_to != comment.author:
-        try:
-            if ticket.assigned_to.notification_preferences.email_notifications:
-                recipient_list.append(ticket.assigned_to.email)
-        except NotificationPreference.DoesNotExist:
-            pass
+    # The ticket creator and the assigned user, except whoever made the
+    # comment, each according to their email preferences
+    recipients = load_recipients([
+        user_id for user_id in (ticket.created_by_id, ticket.assigned_to_id)
+        if user_id != comment.author_id
+    ])
     
-    # Only send if there are recipients
-    if recipient_list:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            recipient_list,
-            fail_silently=False,
-        )
+    queue_notification_email(recipients, subject, message, urgent=ticket.priority == 'urgent')
@@ -0,0 +1,86 @@
+"""
+Fan-out of in-app notifications.
+
+An event (a new ticket, a new comment) notifies several audiences, each
+with its own text: the ticket creator, the assignee, every admin. Fanout
+collects those audiences, reads each recipient queryset as ids in a single
+query and writes all Notification rows with bulk_create, so the cost of an
+event doesn't grow with the number of recipients. Very large audiences are
+streamed and written in chunks of ``NOTIFICATION_FANOUT_CHUNK_SIZE`` rows.
+The recipients' unread counts are raised with one statement per chunk.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+
+from support_system.metrics import NOTIFICATION_FANOUT
+
+from .models import Notification
+from .unread import adjust_unread_counts
+
+
+def get_chunk_size():
+    return getattr(settings, 'NOTIFICATION_FANOUT_CHUNK_SIZE', 1000)
+
+
+class Fanout:
+    """
+    Notifications for one event::
+
+        Fanout('comment_created', link=ticket_url, exclude=[comment.author_id]) \\
+            .add([ticket.created_by_id], 'New Comment on Your Ticket', message) \\
+            .add(User.objects.filter(profile__role='admin'), 'New Comment on Ticket', message) \\
+            .send()
+
+    Every user is notified at most once: when a user belongs to several
+    audiences the one added first wins, so add the most specific first.
+    ``event`` names the event in the fan-out size metric.
+    """
+    def __init__(self, event, link=None, exclude=()):
+        self.event = event
+        self.link = link
+        self.excluded = {pk for pk in exclude if pk is not None}
+        self.audiences = []
+
+    def add(self, recipients, title, message):
+        """
+        Add an audience. ``recipients`` is a User queryset, or an iterable
+        of users or user ids (None entries are skipped).
+        """
+        self.audiences.append((recipients, title, message))
+        return self
+
+    def send(self, chunk_size=None):
+        """
+        Write the notifications and return how many were created.
+        """
+        chunk_size = chunk_size or get_chunk_size()
+        notified = set(self.excluded)
+        batch = []
+        total = 0
+        for recipients, title, message in self.audiences:
+            for user_id in self._user_ids(recipients, chunk_size):
+                if user_id in notified:
+                    continue
+                notified.add(user_id)
+                batch.append(Notification(user_id=user_id, title=title, message=message, link=self.link))
+                if len(batch) >= chunk_size:
+                    total += self._write(batch)
+                    batch = []
+        if batch:
+            total += self._write(batch)
+        # Counted once the rows commit, so a rolled-back event isn't
+        transaction.on_commit(partial(NOTIFICATION_FANOUT.observe, total, event=self.event))
+        return total
+
+    def _write(self, batch):
+        Notification.objects.bulk_create(batch)
+        adjust_unread_counts({notification.user_id: 1 for notification in batch})
+        return len(batch)
+
+    def _user_ids(self, recipients, chunk_size):
+        if isinstance(recipients, QuerySet):
+            return recipients.values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+        return (getattr(recipient, 'pk', recipient) for recipient in recipients if recipient is not None)
@@ -7,7 +7,13 @@ class NotificationPreferencesForm(forms.ModelForm):
     
     class Meta:
         model = NotificationPreference
-        fields = ['email_notifications']
+        fields = ['email_notifications', 'email_frequency']
+        widgets = {
+            'email_frequency': forms.Select(attrs={'class': 'form-select'}),
+        }
+        help_texts = {
+            'email_frequency': "Updates on urgent tickets are always emailed immediately",
+        }
         
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
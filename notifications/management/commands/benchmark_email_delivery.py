@@ -0,0 +1,105 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.delivery import PooledMailer
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP to accept and discard messages. The greeting is delayed
+    by the server's ``connect_delay`` to stand in for the TCP/TLS handshake
+    and banner wait of a real server.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        time.sleep(self.server.connect_delay)
+        self.reply('220 localhost SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.connect_delay = connect_delay
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures email delivery throughput against a local SMTP sink: one '
+        'connection per message (plain send_mail) versus the pooled mailer '
+        'used by the outbox worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Messages to send in each run')
+        parser.add_argument('--connect-delay', type=float, default=5, help='Milliseconds the sink waits before greeting a connection')
+        parser.add_argument('--max-per-connection', type=int, default=None, help='Messages per pooled connection')
+
+    def handle(self, *args, **options):
+        if options['messages'] < 1:
+            raise CommandError('--messages must be at least 1')
+
+        sink = SMTPSink(options['connect_delay'] / 1000)
+        thread = threading.Thread(target=sink.serve_forever, daemon=True)
+        thread.start()
+        connection_kwargs = {'host': '127.0.0.1', 'port': sink.server_address[1]}
+        messages = [
+            EmailMessage(f'Benchmark {i}', 'Benchmark message body', 'support@example.com', [f'user{i}@example.com'])
+            for i in range(options['messages'])
+        ]
+
+        try:
+            started = time.perf_counter()
+            for message in messages:
+                # What send_mail() does for every call
+                get_connection(SMTP_BACKEND, fail_silently=False, **connection_kwargs).send_messages([message])
+            unpooled = time.perf_counter() - started
+
+            with PooledMailer(SMTP_BACKEND, options['max_per_connection'], **connection_kwargs) as mailer:
+                started = time.perf_counter()
+                for message in messages:
+                    mailer.send(message)
+            pooled = time.perf_counter() - started
+        finally:
+            sink.shutdown()
+            sink.server_close()
+
+        count = len(messages)
+        self.stdout.write(f'Connection per message: {count / unpooled:.1f} messages/s ({count} connections)')
+        self.stdout.write(f'Pooled connection:      {count / pooled:.1f} messages/s ({mailer.stats.connections} connections)')
+        if sink.messages != 2 * count:
+            raise CommandError(f'The sink received {sink.messages} of {2 * count} messages')
+        self.stdout.write(self.style.SUCCESS(f'Pooled delivery is {unpooled / pooled:.1f}x faster'))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.retention import purge_range, purge_ranges, retention_cutoffs
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes (or with --archive, archives) notifications past their '
+        'retention: read ones after NOTIFICATION_RETENTION_READ_DAYS days, unread '
+        'ones after NOTIFICATION_RETENTION_UNREAD_DAYS days. Works through the '
+        'table in small id ranges, one short transaction each, pausing between '
+        'them; safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, default=None, help='Keep read notifications this many days')
+        parser.add_argument('--unread-days', type=int, default=None, help='Keep unread notifications this many days')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Ids per batch')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+        parser.add_argument('--start-id', type=int, default=None, help='Start at this id instead of the lowest one')
+        parser.add_argument('--archive', action='store_true', help='Copy notifications to the archive table before deleting them')
+        parser.add_argument('--dry-run', action='store_true', help='Count the expired notifications without removing them')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        read_cutoff, unread_cutoff = retention_cutoffs(
+            read_days=options['read_days'], unread_days=options['unread_days'],
+        )
+        verb = 'archived' if options['archive'] else 'deleted'
+        if options['dry_run']:
+            verb = f'would be {verb}'
+
+        started = time.monotonic()
+        scanned = removed = 0
+        position = None
+        try:
+            for position in purge_ranges(options['batch_size'], options['start_id']):
+                batch_scanned, batch_removed, more = purge_range(
+                    position, options['batch_size'], read_cutoff, unread_cutoff,
+                    archive=options['archive'], dry_run=options['dry_run'],
+                )
+                scanned += batch_scanned
+                removed += batch_removed
+                if batch_removed:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'Up to id {position + options["batch_size"] - 1}: {removed} {verb} '
+                        f'({removed / elapsed:.0f} rows/s)'
+                    )
+                if not more:
+                    break
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f'Interrupted; resume with --start-id {position}'))
+
+        elapsed = time.monotonic() - started
+        rate = removed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully scanned {scanned} notifications: {removed} {verb} in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
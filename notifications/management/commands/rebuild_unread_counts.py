@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from notifications.unread import rebuild_unread_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes every user\'s unread notification count. Needed after '
+        'notifications were changed with queryset update()/delete() or raw SQL, '
+        'which bypass the counters.'
+    )
+
+    def handle(self, *args, **options):
+        users = rebuild_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt unread counts for {users} users'))
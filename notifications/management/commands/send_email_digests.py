@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from notifications.digests import send_due_digests
+
+
+class Command(BaseCommand):
+    help = (
+        'Combines the pending notification emails of users with hourly or '
+        'daily digests into one email per user and queues it for '
+        'send_queued_email. Run it every few minutes, e.g. from cron.'
+    )
+
+    def handle(self, *args, **options):
+        digests, entries = send_due_digests()
+        self.stdout.write(self.style.SUCCESS(f'Successfully queued {digests} digests ({entries} updates)'))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from notifications.delivery import DeliveryStats
+from notifications.outbox import get_outbox_setting, process_batch, requeue_dead
+
+
+class Command(BaseCommand):
+    help = (
+        'Delivers the emails queued in the outbox, retrying failed messages '
+        'with exponential backoff and dead-lettering them after too many '
+        'attempts. Runs until interrupted; several workers can run side by '
+        'side. Use --once to drain the due messages and exit (e.g. from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no messages are due')
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages claimed per batch')
+        parser.add_argument('--concurrency', type=int, default=None, help='Messages sent in parallel')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before a message is dead-lettered')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--requeue-dead', action='store_true', help='Retry all dead-lettered messages first')
+
+    def handle(self, *args, **options):
+        for name in ('batch_size', 'concurrency', 'max_attempts'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        poll_interval = options['poll_interval']
+        if poll_interval is None:
+            poll_interval = get_outbox_setting('POLL_INTERVAL', 5)
+
+        if options['requeue_dead']:
+            count = requeue_dead()
+            self.stdout.write(f'Requeued {count} dead-lettered emails')
+
+        totals = [0, 0, 0]
+        stats = DeliveryStats()
+        try:
+            while True:
+                close_old_connections()
+                claimed, sent, retried, dead, batch_stats = process_batch(
+                    options['batch_size'], options['concurrency'], options['max_attempts'],
+                )
+                if claimed:
+                    totals = [totals[0] + sent, totals[1] + retried, totals[2] + dead]
+                    stats.merge(batch_stats)
+                    self.stdout.write(f'Sent {sent}, retrying {retried}, dead-lettered {dead}: {batch_stats}')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+        if stats.connections:
+            self.stdout.write(f'Messages: {stats}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully sent {totals[0]} emails ({totals[1]} to retry, {totals[2]} dead-lettered)'
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_unread_counts(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadNotificationCount = apps.get_model('notifications', 'UnreadNotificationCount')
+    rows = Notification.objects.filter(read=False).values('user_id').annotate(n=Count('id')).order_by()
+    UnreadNotificationCount.objects.bulk_create(
+        [UnreadNotificationCount(user_id=row['user_id'], count=row['n']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('notifications', '0003_email_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_notification_count', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unreadnotificationcount',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
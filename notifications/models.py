@@ -2,10 +2,22 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 class NotificationPreference(models.Model):
+    IMMEDIATE = 'immediate'
+    HOURLY = 'hourly'
+    DAILY = 'daily'
+    EMAIL_FREQUENCY_CHOICES = (
+        (IMMEDIATE, 'Immediately'),
+        (HOURLY, 'Hourly digest'),
+        (DAILY, 'Daily digest'),
+    )
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_preferences')
     email_notifications = models.BooleanField(default=True)
+    # Updates on urgent tickets are always emailed immediately
+    email_frequency = models.CharField(max_length=10, choices=EMAIL_FREQUENCY_CHOICES, default=IMMEDIATE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -23,8 +35,117 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.title} - {self.user.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the read flag as loaded so that saves can keep the
+        # unread count in step (see notifications/unread.py)
+        if 'read' in field_names:
+            instance._loaded_read = values[field_names.index('read')]
+        return instance
+    
     class Meta:
         ordering = ['-created_at']
+        # Serve the keyset-paginated list (newest first, id as tie-breaker)
+        # and the navbar, for all notifications and for unread ones only
+        indexes = [
+            models.Index(fields=['user', '-created_at', 'id'], name='notification_user_created_idx'),
+            models.Index(
+                fields=['user', '-created_at', 'id'],
+                name='notification_user_unread_idx',
+                condition=models.Q(read=False),
+            ),
+        ]
+
+class ArchivedNotification(models.Model):
+    """
+    A notification moved out of the live table by ``manage.py
+    purge_notifications --archive`` (see notifications/retention.py). Keeps
+    the notification's original id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    link = models.CharField(max_length=255, blank=True, null=True)
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.title} - {self.user.username}"
+
+class UnreadNotificationCount(models.Model):
+    """
+    A user's number of unread notifications, maintained by
+    notifications/unread.py as notifications are created, read and deleted,
+    and their read watermark.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_notification_count')
+    count = models.BigIntegerField(default=0)
+    # Notifications created up to this time are read whatever their read
+    # flag says; set when the user marks all notifications read
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.count} unread"
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox. Rows are written in the same
+    transaction as the change they report and delivered later by
+    ``manage.py send_queued_email`` (see notifications/outbox.py).
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+    
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # When the message is next due: the retry time of a pending message,
+    # or the end of a worker's lease on a message being sent
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+class EmailDigestEntry(models.Model):
+    """
+    A notification email held back for a user's hourly or daily digest
+    (see notifications/digests.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='email_digest_entries')
+    subject = models.TextField()
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.subject} - {self.user.username}"
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='email_digest_user_idx'),
+        ]
 
 @receiver(post_save, sender=User)
 def create_notification_preferences(sender, instance, created, **kwargs):
@@ -0,0 +1,207 @@
+"""
+Transactional email outbox.
+
+Notification emails are not sent while the ticket or comment is being
+saved. ``queue_email`` writes an OutboundEmail row instead, inside the same
+transaction, so a message exists exactly when the change it reports was
+committed, and a slow or failing mail server can't delay or break the
+request.
+
+``manage.py send_queued_email`` drains the outbox:
+
+- Each worker claims a batch of due messages (``SELECT ... FOR UPDATE SKIP
+  LOCKED`` on PostgreSQL, so several workers never claim the same row) and
+  holds a lease of ``EMAIL_OUTBOX_LEASE_SECONDS`` on them. Messages whose
+  worker died are claimed again once the lease runs out.
+- The batch is split between ``EMAIL_OUTBOX_CONCURRENCY`` threads, each
+  sending over one reused backend connection (see notifications.delivery),
+  as one message per recipient.
+- A failed message is retried, to the recipients that failed only, after an exponential backoff starting at
+  ``EMAIL_OUTBOX_RETRY_DELAY`` seconds and capped at
+  ``EMAIL_OUTBOX_MAX_RETRY_DELAY``. After ``EMAIL_OUTBOX_MAX_ATTEMPTS``
+  attempts it is dead-lettered: kept with status 'dead' and its last error
+  until it is requeued with ``send_queued_email --requeue-dead``.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .delivery import DeliveryStats, PooledMailer, personalized_messages
+from .models import OutboundEmail
+
+
+def get_outbox_setting(name, default):
+    return getattr(settings, f'EMAIL_OUTBOX_{name}', default)
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """
+    Add an email to the outbox. Call it inside the transaction that makes
+    the change the email reports.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def queue_emails(emails, from_email=None):
+    """
+    Add ``[(subject, message, recipient_list)]`` to the outbox with one
+    insert.
+    """
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list),
+        )
+        for subject, message, recipient_list in emails
+    ])
+
+
+def retry_delay(attempts):
+    """
+    Return how long to wait before retrying a message that has failed
+    ``attempts`` times: the delay doubles with every attempt, with up to 25%
+    random jitter so that messages that failed together don't all retry at
+    the same moment.
+    """
+    base = get_outbox_setting('RETRY_DELAY', 60)
+    cap = get_outbox_setting('MAX_RETRY_DELAY', 6 * 60 * 60)
+    delay = base * 2 ** max(attempts - 1, 0) * random.uniform(1, 1.25)
+    return timedelta(seconds=min(cap, delay))
+
+
+def claim_batch(batch_size, max_attempts=None):
+    """
+    Lease up to ``batch_size`` due messages to this worker and return them.
+    Each claim counts as an attempt, so a message that keeps crashing its
+    worker is still dead-lettered eventually.
+    """
+    max_attempts = max_attempts or get_outbox_setting('MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    lease = timedelta(seconds=get_outbox_setting('LEASE_SECONDS', 300))
+    due = OutboundEmail.objects.filter(
+        status__in=(OutboundEmail.PENDING, OutboundEmail.SENDING), next_attempt_at__lte=now,
+    )
+    with transaction.atomic():
+        # Leases that ran out on their last attempt
+        due.filter(status=OutboundEmail.SENDING, attempts__gte=max_attempts).update(
+            status=OutboundEmail.DEAD, last_error='Delivery did not finish before the lease expired',
+        )
+        ids = list(
+            due.filter(attempts__lt=max_attempts)
+            .select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboundEmail.objects.filter(pk__in=ids).update(
+            status=OutboundEmail.SENDING, attempts=F('attempts') + 1, next_attempt_at=now + lease,
+        )
+    return list(OutboundEmail.objects.filter(pk__in=ids).order_by('next_attempt_at', 'pk'))
+
+
+def deliver(email, mailer):
+    """
+    Send a queued email to each of its recipients. Returns
+    ``(failed_recipients, error)``; both are empty when all were sent.
+    """
+    failed = []
+    error = ''
+    for recipient, message in personalized_messages(email.subject, email.body, email.from_email, email.recipients):
+        try:
+            mailer.send(message)
+        except Exception as exc:
+            failed.append(recipient)
+            error = f'{type(exc).__name__}: {exc}'
+    return failed, error
+
+
+def deliver_all(emails):
+    """
+    Deliver ``emails`` over one pooled connection. Returns
+    ``([(email, (failed_recipients, error))], stats)``.
+    """
+    with PooledMailer() as mailer:
+        results = [(email, deliver(email, mailer)) for email in emails]
+    return results, mailer.stats
+
+
+def record_results(results, max_attempts=None):
+    """
+    Store the outcome of ``[(email, (failed_recipients, error))]`` and
+    return the number of emails ``(sent, retried, dead)``. Only the failed
+    recipients are kept on emails that are retried.
+    """
+    max_attempts = max_attempts or get_outbox_setting('MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    sent = [email.pk for email, (failed, error) in results if not failed]
+    if sent:
+        OutboundEmail.objects.filter(pk__in=sent).update(
+            status=OutboundEmail.SENT, sent_at=now, last_error='',
+        )
+
+    retried = dead = 0
+    for email, (failed, error) in results:
+        if not failed:
+            continue
+        if email.attempts >= max_attempts:
+            status, next_attempt_at = OutboundEmail.DEAD, now
+            dead += 1
+        else:
+            status, next_attempt_at = OutboundEmail.PENDING, now + retry_delay(email.attempts)
+            retried += 1
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=status, next_attempt_at=next_attempt_at, last_error=error, recipients=failed,
+        )
+    return len(sent), retried, dead
+
+
+def process_batch(batch_size=None, concurrency=None, max_attempts=None):
+    """
+    Claim one batch, deliver it and record the results. Returns
+    ``(claimed, sent, retried, dead, stats)`` where the counts are emails
+    and ``stats`` is the DeliveryStats of the individual messages.
+    """
+    batch_size = batch_size or get_outbox_setting('BATCH_SIZE', 100)
+    concurrency = concurrency or get_outbox_setting('CONCURRENCY', 4)
+    emails = claim_batch(batch_size, max_attempts)
+    if not emails:
+        return 0, 0, 0, 0, DeliveryStats()
+
+    # Only the mail backend runs in the pool; the database work stays on
+    # this thread. Each thread gets its own share of the batch and its own
+    # connection.
+    workers = min(concurrency, len(emails))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(deliver_all, [emails[i::workers] for i in range(workers)]))
+    else:
+        outcomes = [deliver_all(emails)]
+
+    results = []
+    stats = DeliveryStats()
+    for worker_results, worker_stats in outcomes:
+        results.extend(worker_results)
+        stats.merge(worker_stats)
+    return (len(emails),) + record_results(results, max_attempts) + (stats,)
+
+
+def requeue_dead():
+    """
+    Give every dead-lettered message a fresh set of attempts.
+    """
+    return OutboundEmail.objects.filter(status=OutboundEmail.DEAD).update(
+        status=OutboundEmail.PENDING, attempts=0, next_attempt_at=timezone.now(),
+    )
@@ -0,0 +1,149 @@
+"""
+In-process push of notification changes to connected clients.
+
+``/notifications/stream/`` is a Server-Sent Events endpoint served by the
+ASGI application. Each open stream subscribes to the broker for its user and
+waits on an asyncio.Event; an idle connection costs a coroutine and an
+Event, no thread, so one worker holds thousands of them.
+
+Whenever a user's notification summary changes (see
+notifications.unread.invalidate_summaries) the broker wakes that user's
+streams after the change commits. Wake-ups coalesce: a burst of changes
+leads to one re-read of the (cached) summary per stream, which then sends
+the notifications it hasn't sent yet and the unread count if it changed.
+
+The broker only reaches streams of the same process, so run the streams in
+a single ASGI worker, or accept that streams on other workers only catch up
+on their next wake-up.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .unread import get_notification_summary
+
+
+class NotificationBroker:
+    """
+    Subscriptions of open streams by user id. Safe to publish to from any
+    thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """
+        Return an asyncio.Event that is set whenever ``user_id``'s
+        notifications change. Use it from a coroutine.
+        """
+        subscription = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        try:
+            yield subscription[1]
+        finally:
+            with self.lock:
+                self.subscribers[user_id].discard(subscription)
+                if not self.subscribers[user_id]:
+                    del self.subscribers[user_id]
+
+    def publish(self, user_ids):
+        with self.lock:
+            subscriptions = [
+                subscription
+                for user_id in set(user_ids)
+                for subscription in self.subscribers.get(user_id, ())
+            ]
+        for loop, event in subscriptions:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's event loop has shut down
+                pass
+
+    def connection_count(self):
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+
+broker = NotificationBroker()
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.pk,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'read': notification.read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def read_summary(user):
+    """
+    get_notification_summary for the streams. It runs on executor threads
+    outside any request, so connections there are not recycled by the
+    request signals.
+    """
+    close_old_connections()
+    return get_notification_summary(user)
+
+
+async def notification_events(user, last_event_id=None):
+    """
+    Yield Server-Sent Events for ``user``: ``unread`` with the unread count
+    when it changes (and once on connect), ``notification`` for each new
+    notification and a comment every ``NOTIFICATION_STREAM_KEEPALIVE``
+    seconds so proxies keep idle connections open.
+
+    Notifications newer than ``last_event_id`` (the Last-Event-ID a
+    reconnecting EventSource sends) are sent on connect, up to the number
+    kept in the summary.
+    """
+    keepalive = getattr(settings, 'NOTIFICATION_STREAM_KEEPALIVE', 25)
+    # A read-only query: don't queue it behind every other stream (and
+    # request) on the single thread-sensitive executor
+    get_summary = sync_to_async(read_summary, thread_sensitive=False)
+    with broker.subscribe(user.pk) as changed:
+        summary = await get_summary(user)
+        if last_event_id is None:
+            last_event_id = max((notification.pk for notification in summary['recent']), default=0)
+        unread = None
+        yield 'retry: 5000\n\n'
+        while True:
+            new = sorted(
+                (notification for notification in summary['recent'] if notification.pk > last_event_id),
+                key=lambda notification: notification.pk,
+            )
+            for notification in new:
+                last_event_id = notification.pk
+                yield format_event('notification', serialize_notification(notification), notification.pk)
+            if summary['unread'] != unread:
+                unread = summary['unread']
+                yield format_event('unread', {'unread': unread})
+
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            changed.clear()
+            summary = await get_summary(user)
@@ -0,0 +1,99 @@
+"""
+Notification retention.
+
+Read notifications are kept for ``NOTIFICATION_RETENTION_READ_DAYS`` days
+and unread ones for ``NOTIFICATION_RETENTION_UNREAD_DAYS`` days. ``manage.py
+purge_notifications`` removes older ones, optionally moving them to
+ArchivedNotification first.
+
+The table is walked in primary key order, one range of at most
+``batch_size`` ids at a time, each in its own short transaction, so the live
+table is never locked for long and an interrupted run loses nothing:
+running it again starts over from the lowest remaining id. Ids grow with
+created_at, so the walk stops at the first range that ends past the later of
+the two cutoffs.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification
+from .unread import adjust_unread_counts, invalidate_summaries, is_read
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'title', 'message', 'link', 'read', 'created_at')
+
+
+def retention_cutoffs(now=None, read_days=None, unread_days=None):
+    """
+    Return ``(read_cutoff, unread_cutoff)``: notifications created before
+    these are expired.
+    """
+    now = now or timezone.now()
+    if read_days is None:
+        read_days = getattr(settings, 'NOTIFICATION_RETENTION_READ_DAYS', 30)
+    if unread_days is None:
+        unread_days = getattr(settings, 'NOTIFICATION_RETENTION_UNREAD_DAYS', 180)
+    return now - timedelta(days=read_days), now - timedelta(days=unread_days)
+
+
+def is_expired(row, read_cutoff, unread_cutoff):
+    return row['created_at'] < (read_cutoff if row['read'] else unread_cutoff)
+
+
+def purge_range(start, batch_size, read_cutoff, unread_cutoff, archive=False, dry_run=False):
+    """
+    Remove the expired notifications with ids in ``[start, start +
+    batch_size)``. Returns ``(scanned, removed, more)`` where ``more`` is
+    False once no later range can hold expired notifications.
+    """
+    end = start + batch_size
+    with transaction.atomic():
+        # Lock the batch: a mark_read() waiting on these rows finds them
+        # deleted and decrements nothing, one that got there first is seen
+        # here as read, so no unread notification is subtracted twice
+        rows = list(
+            Notification.objects.filter(pk__gte=start, pk__lt=end)
+            .select_for_update(of=('self',))
+            .order_by('pk')
+            .values(*ARCHIVED_FIELDS, last_read_at=F('user__unread_notification_count__last_read_at'))
+        )
+        for row in rows:
+            # Notifications below the user's read watermark expire, and are
+            # archived, as read ones
+            row['read'] = is_read(row['read'], row['created_at'], row.pop('last_read_at'))
+        expired = [row for row in rows if is_expired(row, read_cutoff, unread_cutoff)]
+        if expired and not dry_run:
+            if archive:
+                ArchivedNotification.objects.bulk_create(
+                    [ArchivedNotification(**row) for row in expired],
+                    ignore_conflicts=True,
+                )
+            # A plain DELETE: the per-row post_delete signals would adjust
+            # the unread counts one statement at a time
+            Notification.objects.filter(pk__in=[row['id'] for row in expired])._raw_delete(Notification.objects.db)
+            unread = Counter(row['user_id'] for row in expired if not row['read'])
+            adjust_unread_counts({user_id: -count for user_id, count in unread.items()})
+            invalidate_summaries({row['user_id'] for row in expired if row['read']})
+
+    # Rows created after the later cutoff can't have expired yet, whether
+    # read or not
+    more = not rows or rows[-1]['created_at'] < max(read_cutoff, unread_cutoff)
+    return len(rows), len(expired), more
+
+
+def purge_ranges(batch_size, start=None):
+    """
+    Yield the start of each id range to purge, from ``start`` (default: the
+    lowest id) to the highest id.
+    """
+    bounds = Notification.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    position = max(start or 0, bounds['low'])
+    while position <= bounds['high']:
+        yield position
+        position += batch_size
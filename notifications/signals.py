@@ -1,8 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
+from support_system.metrics import NOTIFICATION_FANOUT
 from tickets.models import Ticket, Comment
+from .fanout import Fanout
 from .models import Notification
+from .unread import adjust_unread_counts, get_read_watermark, invalidate_summaries, is_read
 from .email_utils import send_ticket_creation_notification, send_ticket_update_notification, send_comment_notification
 
 @receiver(post_save, sender=Ticket)
@@ -11,68 +18,67 @@ def ticket_created_notification(sender, instance, created, **kwargs):
     Send notification when a new ticket is created
     """
     if created:
-        # Send email notification
+        # Queue email notification
         send_ticket_creation_notification(instance)
         
-        # Create in-app notification for admin users
-        from django.contrib.auth.models import User
-        admins = User.objects.filter(profile__role='admin')
+        # Create in-app notifications: the assignee (if any) and all admins
         ticket_url = reverse('ticket_detail', kwargs={'pk': instance.pk})
         
-        for admin in admins:
-            Notification.objects.create(
-                user=admin,
-                title='New Ticket Created',
-                message=f'A new ticket "{instance.title}" has been created by {instance.created_by.username}.',
-                link=ticket_url
-            )
-        
-        # If assigned to someone, notify them too
-        if instance.assigned_to:
-            Notification.objects.create(
-                user=instance.assigned_to,
-                title='Ticket Assigned to You',
-                message=f'Ticket "{instance.title}" has been assigned to you.',
-                link=ticket_url
-            )
+        Fanout('ticket_created', link=ticket_url).add(
+            [instance.assigned_to_id],
+            'Ticket Assigned to You',
+            f'Ticket "{instance.title}" has been assigned to you.',
+        ).add(
+            User.objects.filter(profile__role='admin'),
+            'New Ticket Created',
+            f'A new ticket "{instance.title}" has been created by {instance.created_by.username}.',
+        ).send()
 
 @receiver(pre_save, sender=Ticket)
-def ticket_status_changed_notification(sender, instance, **kwargs):
+def ticket_status_changed_notification(sender, instance, raw=False, update_fields=None, **kwargs):
     """
     Send notification when a ticket's status is changed
     """
-    # Check if this is an existing ticket (not a new one)
-    if instance.pk:
-        try:
-            # Get the previous state of the ticket
-            old_instance = Ticket.objects.get(pk=instance.pk)
-            
-            # If status has changed, send notification
-            if old_instance.status != instance.status:
-                # Send email notification
-                send_ticket_update_notification(instance, old_instance.get_status_display())
-                
-                # Create in-app notification for the ticket creator
-                ticket_url = reverse('ticket_detail', kwargs={'pk': instance.pk})
-                
-                # Notify the ticket creator
-                Notification.objects.create(
-                    user=instance.created_by,
-                    title='Ticket Status Updated',
-                    message=f'Your ticket "{instance.title}" status has been changed from {old_instance.get_status_display()} to {instance.get_status_display()}.',
-                    link=ticket_url
-                )
-                
-                # If assigned to someone and they didn't make the change, notify them too
-                if instance.assigned_to and instance.assigned_to != instance.updated_by:
-                    Notification.objects.create(
-                        user=instance.assigned_to,
-                        title='Ticket Status Updated',
-                        message=f'Ticket "{instance.title}" status has been changed from {old_instance.get_status_display()} to {instance.get_status_display()}.',
-                        link=ticket_url
-                    )
-        except Ticket.DoesNotExist:
-            pass  # This shouldn't happen, but just in case
+    # Only existing tickets whose status is being saved; the previous status
+    # is the one the ticket was loaded with, so no query is needed
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    previous_status = instance.loaded_value('status')
+    if previous_status == instance.status:
+        return
+    
+    status_names = dict(Ticket.STATUS_CHOICES)
+    previous_display = status_names.get(previous_status, previous_status)
+    
+    # Queue email notification
+    send_ticket_update_notification(instance, previous_display)
+    
+    # Create in-app notification for the ticket creator
+    ticket_url = reverse('ticket_detail', kwargs={'pk': instance.pk})
+    
+    # Notify the ticket creator
+    Notification.objects.create(
+        user_id=instance.created_by_id,
+        title='Ticket Status Updated',
+        message=f'Your ticket "{instance.title}" status has been changed from {previous_display} to {instance.get_status_display()}.',
+        link=ticket_url
+    )
+    
+    # If assigned to someone and they didn't make the change, notify them
+    # too. Views set ``updated_by`` to the user making the change.
+    updated_by = getattr(instance, 'updated_by', None)
+    notified = 1
+    if instance.assigned_to_id and instance.assigned_to_id != getattr(updated_by, 'pk', None):
+        Notification.objects.create(
+            user_id=instance.assigned_to_id,
+            title='Ticket Status Updated',
+            message=f'Ticket "{instance.title}" status has been changed from {previous_display} to {instance.get_status_display()}.',
+            link=ticket_url
+        )
+        notified += 1
+    transaction.on_commit(partial(NOTIFICATION_FANOUT.observe, notified, event='ticket_status_changed'))
 
 @receiver(post_save, sender=Comment)
 def comment_created_notification(sender, instance, created, **kwargs):
@@ -80,35 +86,54 @@ def comment_created_notification(sender, instance, created, **kwargs):
         ticket = instance.ticket
         ticket_url = reverse('ticket_detail', kwargs={'pk': ticket.pk})
         
-        # Notify the ticket creator if they didn't make the comment
-        if ticket.created_by != instance.author:
-            Notification.objects.create(
-                user=ticket.created_by,
-                title='New Comment on Your Ticket',
-                message=f'A new comment has been added to your ticket "{ticket.title}" by {instance.author.username}.',
-                link=ticket_url
-            )
-        
-        # Notify the assigned support staff if they didn't make the comment
-        if ticket.assigned_to and ticket.assigned_to != instance.author:
-            Notification.objects.create(
-                user=ticket.assigned_to,
-                title='New Comment on Assigned Ticket',
-                message=f'A new comment has been added to ticket "{ticket.title}" by {instance.author.username}.',
-                link=ticket_url
-            )
+        # Notify the ticket creator, the assigned support staff and the
+        # admins, except whoever made the comment
+        author = instance.author.username
         
-        # Notify admins who didn't make the comment
-        from django.contrib.auth.models import User
-        admins = User.objects.filter(profile__role='admin').exclude(id=instance.author.id)
+        Fanout('comment_created', link=ticket_url, exclude=[instance.author_id]).add(
+            [ticket.created_by_id],
+            'New Comment on Your Ticket',
+            f'A new comment has been added to your ticket "{ticket.title}" by {author}.',
+        ).add(
+            [ticket.assigned_to_id],
+            'New Comment on Assigned Ticket',
+            f'A new comment has been added to ticket "{ticket.title}" by {author}.',
+        ).add(
+            User.objects.filter(profile__role='admin'),
+            'New Comment on Ticket',
+            f'A new comment has been added to ticket "{ticket.title}" by {author}.',
+        ).send()
         
-        for admin in admins:
-            Notification.objects.create(
-                user=admin,
-                title='New Comment on Ticket',
-                message=f'A new comment has been added to ticket "{ticket.title}" by {instance.author.username}.',
-                link=ticket_url
-            )
-        
-        # Send email notifications
+        # Queue email notifications
         send_comment_notification(instance)
+
+@receiver(post_save, sender=Notification)
+def update_unread_count(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the user's unread count in step with notifications created or
+    marked (un)read one at a time.
+    """
+    if raw:
+        return
+    if created:
+        previous_read = True
+    else:
+        previous_read = getattr(instance, '_loaded_read', instance.read)
+        # Notifications below the read watermark are read either way
+        if previous_read != instance.read and is_read(False, instance.created_at, get_read_watermark(instance.user_id)):
+            previous_read = instance.read
+    if previous_read != instance.read:
+        adjust_unread_counts({instance.user_id: -1 if instance.read else 1})
+    else:
+        invalidate_summaries([instance.user_id])
+    instance._loaded_read = instance.read
+
+@receiver(post_delete, sender=Notification)
+def remove_unread_count(sender, instance, origin=None, **kwargs):
+    # The count goes away with its user
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    if not is_read(instance.read, instance.created_at, get_read_watermark(instance.user_id)):
+        adjust_unread_counts({instance.user_id: -1})
+    else:
+        invalidate_summaries([instance.user_id])
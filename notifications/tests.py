@@ -1,3 +1,511 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from tickets.models import Ticket
+
+from .delivery import PooledMailer, personalized_messages
+from .digests import queue_notification_email, send_due_digests
+from .models import (
+    ArchivedNotification, EmailDigestEntry, Notification, NotificationPreference, OutboundEmail, UnreadNotificationCount,
+)
+from .outbox import claim_batch, process_batch, queue_email, requeue_dead
+from .push import broker, notification_events
+from .retention import purge_range, purge_ranges, retention_cutoffs
+from .unread import get_notification_summary, get_read_watermark, mark_read, unread_q
+
+
+class PurgeNotificationsTests(TestCase):
+    """
+    With the default retention (read 30 days, unread 180 days) and batches
+    of 4 ids: the first 6 notifications are expired, of the next 3 the read
+    ones are, and the last 3 are kept.
+    """
+    BATCH_SIZE = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'user{index}', f'user{index}@example.com', 'password') for index in range(2)]
+        now = timezone.now()
+        cls.notifications = []
+        for index, age in enumerate([200] * 6 + [60] * 3 + [0] * 3):
+            notification = Notification.objects.create(
+                user=cls.users[index % 2], title=f'Notification {index}', message='Ticket updated', read=index % 3 == 0,
+            )
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(days=age))
+            cls.notifications.append(notification)
+        cls.kept = (
+            [notification.pk for notification in cls.notifications[6:9] if not notification.read]
+            + [notification.pk for notification in cls.notifications[9:]]
+        )
+
+    def assertUnreadCountsMatch(self):
+        for user in self.users:
+            counted = UnreadNotificationCount.objects.filter(user=user).values_list('count', flat=True).first() or 0
+            self.assertEqual(counted, Notification.objects.filter(user=user, read=False).count())
+
+    def remaining(self):
+        return list(Notification.objects.order_by('pk').values_list('pk', flat=True))
+
+    def test_purge(self):
+        read_cutoff, unread_cutoff = retention_cutoffs()
+        removed = 0
+        for position in purge_ranges(self.BATCH_SIZE):
+            scanned, batch_removed, more = purge_range(position, self.BATCH_SIZE, read_cutoff, unread_cutoff)
+            removed += batch_removed
+            if not more:
+                break
+        self.assertEqual(removed, len(self.notifications) - len(self.kept))
+        self.assertEqual(self.remaining(), self.kept)
+        self.assertUnreadCountsMatch()
+
+    def test_dry_run_removes_nothing(self):
+        read_cutoff, unread_cutoff = retention_cutoffs()
+        start = self.notifications[0].pk
+        self.assertEqual(purge_range(start, self.BATCH_SIZE, read_cutoff, unread_cutoff, dry_run=True), (4, 4, True))
+        self.assertEqual(len(self.remaining()), len(self.notifications))
+
+    def test_resume_after_interruption(self):
+        # The first batch runs, then the command is interrupted and started
+        # again from the next range
+        read_cutoff, unread_cutoff = retention_cutoffs()
+        start = self.notifications[0].pk
+        purge_range(start, self.BATCH_SIZE, read_cutoff, unread_cutoff, archive=True)
+        self.assertEqual(self.remaining()[0], self.notifications[4].pk)
+
+        out = StringIO()
+        call_command(
+            'purge_notifications', archive=True, sleep=0, batch_size=self.BATCH_SIZE,
+            start_id=start + self.BATCH_SIZE, stdout=out,
+        )
+        self.assertEqual(self.remaining(), self.kept)
+        self.assertEqual(
+            sorted(ArchivedNotification.objects.values_list('pk', flat=True)),
+            [notification.pk for notification in self.notifications if notification.pk not in self.kept],
+        )
+        self.assertUnreadCountsMatch()
+
+        # Running it again finds nothing left to remove
+        call_command('purge_notifications', archive=True, sleep=0, batch_size=self.BATCH_SIZE, stdout=out)
+        self.assertEqual(self.remaining(), self.kept)
+        self.assertUnreadCountsMatch()
+
+    def test_notification_read_before_the_purge_is_not_counted_twice(self):
+        expired = next(notification for notification in self.notifications[:6] if not notification.read)
+        self.assertEqual(mark_read(expired.user, [expired.pk]), 1)
+        call_command('purge_notifications', sleep=0, batch_size=self.BATCH_SIZE, stdout=StringIO())
+        self.assertEqual(self.remaining(), self.kept)
+        self.assertUnreadCountsMatch()
+
+    def test_unread_retention_shorter_than_read_retention(self):
+        call_command(
+            'purge_notifications', read_days=365, unread_days=30, sleep=0, batch_size=self.BATCH_SIZE, stdout=StringIO(),
+        )
+        # The unread notifications of 200 and 60 days ago are past their
+        # retention; the read ones are kept
+        self.assertEqual(
+            self.remaining(),
+            [notification.pk for notification in self.notifications[:9] if notification.read]
+            + [notification.pk for notification in self.notifications[9:]],
+        )
+        self.assertUnreadCountsMatch()
+
+
+class RejectingBackend(EmailBackend):
+    """
+    The locmem backend, refusing addresses at example.org and counting the
+    connections opened.
+    """
+    opened = 0
+
+    def open(self):
+        RejectingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            refused = [recipient for recipient in message.recipients() if recipient.endswith('@example.org')]
+            if refused:
+                raise SMTPRecipientsRefused({recipient: (550, b'No such user') for recipient in refused})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='notifications.tests.RejectingBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_CONCURRENCY=1,
+)
+class OutboxTests(TestCase):
+    def make_due(self):
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+
+    def test_emails_are_queued_with_the_change_they_report(self):
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password')
+        UserProfile.objects.filter(user=admin).update(role='admin')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Ticket.objects.create(title='Printer is jammed', description='Paper is stuck.', created_by=admin)
+            self.assertTrue(OutboundEmail.objects.exists())
+            raise RuntimeError
+        self.assertFalse(OutboundEmail.objects.exists())
+
+        Ticket.objects.create(title='Printer is jammed', description='Paper is stuck.', created_by=admin)
+        self.assertEqual(list(OutboundEmail.objects.values_list('recipients', flat=True)), [['admin@example.com']])
+        self.assertEqual(mail.outbox, [])
+
+    def test_failed_recipients_are_retried_then_dead_lettered(self):
+        email = queue_email('Ticket updated', 'Body', ['agent@example.com', 'gone@example.org'])
+        self.assertEqual(process_batch()[:4], (1, 0, 1, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['agent@example.com']])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.recipients), (OutboundEmail.PENDING, ['gone@example.org']))
+        self.assertIn('SMTPRecipientsRefused', email.last_error)
+        # Backing off
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(process_batch()[0], 0)
+
+        self.make_due()
+        self.assertEqual(process_batch()[:4], (1, 0, 0, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.DEAD, 2))
+
+        self.assertEqual(requeue_dead(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 0))
+
+    def test_expired_leases_are_claimed_again(self):
+        email = queue_email('Ticket updated', 'Body', ['agent@example.com'])
+        self.assertEqual(claim_batch(10), [email])
+        # Leased to the first worker
+        self.assertEqual(claim_batch(10), [])
+
+        self.make_due()
+        self.assertEqual([claimed.attempts for claimed in claim_batch(10)], [2])
+        # The worker died on the last attempt
+        self.make_due()
+        self.assertEqual(claim_batch(10), [])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.DEAD)
+
+    def test_worker_command(self):
+        for index in range(3):
+            queue_email('Ticket updated', 'Body', [f'agent{index}@example.com'])
+        out = StringIO()
+        call_command('send_queued_email', once=True, stdout=out)
+        self.assertIn('Successfully sent 3 emails (0 to retry, 0 dead-lettered)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.SENT).exists())
+
+
+@override_settings(EMAIL_BACKEND='notifications.tests.RejectingBackend')
+class PooledMailerTests(TestCase):
+    def setUp(self):
+        RejectingBackend.opened = 0
+
+    def message(self, recipient='agent@example.com'):
+        return EmailMessage('Ticket updated', 'Body', 'support@example.com', [recipient])
+
+    def test_connections_are_reused_up_to_the_limit(self):
+        with PooledMailer(max_messages_per_connection=2) as mailer:
+            for _ in range(5):
+                mailer.send(self.message())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(RejectingBackend.opened, 3)
+        self.assertEqual((mailer.stats.sent, mailer.stats.failed, mailer.stats.connections), (5, 0, 3))
+        self.assertGreater(mailer.stats.throughput, 0)
+
+    def test_a_failed_send_replaces_the_connection(self):
+        with PooledMailer() as mailer:
+            mailer.send(self.message())
+            with self.assertRaises(SMTPRecipientsRefused):
+                mailer.send(self.message('gone@example.org'))
+            mailer.send(self.message())
+        self.assertEqual((mailer.stats.sent, mailer.stats.failed, mailer.stats.connections), (2, 1, 2))
+
+    def test_one_message_per_recipient(self):
+        messages = personalized_messages('Ticket updated', 'Body', 'support@example.com', ['a@example.com', 'b@example.com'])
+        self.assertEqual([(recipient, message.to) for recipient, message in messages], [
+            ('a@example.com', ['a@example.com']), ('b@example.com', ['b@example.com']),
+        ])
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_email_delivery', messages=20, connect_delay=0, stdout=out)
+        self.assertIn('Pooled connection:', out.getvalue())
+        self.assertIn('(1 connections)', out.getvalue())
+
+
+class EmailDigestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            frequency: User.objects.create_user(frequency, f'{frequency}@example.com', 'password')
+            for frequency in ('immediate', 'hourly', 'daily')
+        }
+        for frequency, user in cls.users.items():
+            NotificationPreference.objects.filter(user=user).update(email_frequency=frequency)
+
+    def queue(self, count, urgent=False):
+        users = list(User.objects.select_related('notification_preferences').order_by('pk'))
+        for index in range(count):
+            queue_notification_email(users, f'New comment {index}', 'Replaced the printer toner.', urgent=urgent)
+
+    def recipients(self):
+        return sorted(
+            recipient
+            for recipients in OutboundEmail.objects.values_list('recipients', flat=True)
+            for recipient in recipients
+        )
+
+    def test_a_burst_becomes_one_email_per_window(self):
+        self.queue(3)
+        self.assertEqual(self.recipients(), ['immediate@example.com'] * 3)
+        self.assertEqual(EmailDigestEntry.objects.count(), 6)
+
+        now = timezone.now()
+        self.assertEqual(send_due_digests(now), (0, 0))
+        self.assertEqual(send_due_digests(now + timedelta(hours=1)), (1, 3))
+        digest = OutboundEmail.objects.get(recipients=['hourly@example.com'])
+        self.assertEqual(digest.subject, '3 ticket updates')
+        for index in range(3):
+            self.assertIn(f'New comment {index}', digest.body)
+
+        self.assertEqual(send_due_digests(now + timedelta(days=1)), (1, 3))
+        self.assertFalse(EmailDigestEntry.objects.exists())
+
+    def test_urgent_updates_are_sent_immediately(self):
+        self.queue(1, urgent=True)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertEqual(self.recipients(), ['daily@example.com', 'hourly@example.com', 'immediate@example.com'])
+        self.assertFalse(EmailDigestEntry.objects.exists())
+
+    def test_a_single_entry_keeps_its_subject(self):
+        self.queue(1)
+        EmailDigestEntry.objects.update(created_at=timezone.now() - timedelta(days=1))
+        out = StringIO()
+        call_command('send_email_digests', stdout=out)
+        self.assertIn('Successfully queued 2 digests (2 updates)', out.getvalue())
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('subject', flat=True)), ['New comment 0'] * 3,
+        )
+
+
+class UnreadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', 'agent@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def notify(self, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [
+                Notification.objects.create(user=self.user, title='Ticket Status Updated', message='Ticket updated')
+                for _ in range(count)
+            ]
+
+    def unread(self):
+        return get_notification_summary(self.user)['unread']
+
+    def test_count_follows_creates_reads_and_deletes(self):
+        notifications = self.notify(3)
+        self.assertEqual(self.unread(), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_read(self.user, [notifications[0].pk])
+        self.assertEqual(self.unread(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[1].read = True
+            notifications[1].save()
+            # Saving it again changes nothing
+            notifications[1].save()
+        self.assertEqual(self.unread(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[0].delete()
+            notifications[2].delete()
+        self.assertEqual(self.unread(), 0)
+
+    def test_summary_is_cached_until_a_change_commits(self):
+        self.notify()
+        self.unread()
+        with self.assertNumQueries(0):
+            summary = get_notification_summary(self.user)
+        self.assertEqual((summary['unread'], len(summary['recent'])), (1, 1))
+        self.notify()
+        self.assertEqual(self.unread(), 2)
+
+    def test_polling_endpoint_answers_not_modified(self):
+        self.notify()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notification_unread_count'))
+        self.assertEqual(response.json(), {'unread': 1})
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('notification_unread_count'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.notify()
+        response = self.client.get(reverse('notification_unread_count'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json(), {'unread': 2})
+
+    def test_rebuild(self):
+        self.notify(2)
+        UnreadNotificationCount.objects.filter(user=self.user).update(count=7)
+        call_command('rebuild_unread_counts', stdout=StringIO())
+        self.assertEqual(UnreadNotificationCount.objects.get(user=self.user).count, 2)
+
+
+class NotificationStreamTests(TestCase):
+    def notification(self, pk):
+        return Notification(pk=pk, title='Ticket Status Updated', message='Ticket updated', created_at=timezone.now())
+
+    def test_wsgi_requests_are_told_not_to_reconnect(self):
+        self.assertEqual(self.client.get(reverse('notification_stream')).status_code, 204)
+
+    def test_changes_are_published_once_committed(self):
+        user = User.objects.create_user('agent', 'agent@example.com', 'password')
+        with patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.create(user=user, title='Ticket Status Updated', message='Ticket updated')
+                publish.assert_not_called()
+        publish.assert_called_once_with([user.pk])
+
+    @override_settings(NOTIFICATION_STREAM_KEEPALIVE=0.01)
+    async def test_stream(self):
+        user = SimpleNamespace(pk=1)
+        summary = {'unread': 1, 'recent': [self.notification(1)]}
+        with patch('notifications.push.read_summary', lambda user: summary):
+            events = notification_events(user, last_event_id=0)
+            self.assertEqual(await anext(events), 'retry: 5000\n\n')
+            self.assertIn('id: 1\nevent: notification\n', await anext(events))
+            self.assertEqual(await anext(events), 'event: unread\ndata: {"unread": 1}\n\n')
+            self.assertEqual(await anext(events), ': keepalive\n\n')
+            self.assertEqual(broker.connection_count(), 1)
+
+            summary = {'unread': 2, 'recent': [self.notification(2), self.notification(1)]}
+            broker.publish([user.pk])
+            self.assertIn('id: 2\nevent: notification\n', await anext(events))
+            self.assertEqual(await anext(events), 'event: unread\ndata: {"unread": 2}\n\n')
+            await events.aclose()
+        self.assertEqual(broker.connection_count(), 0)
+
+
+@patch('notifications.views.NOTIFICATIONS_PER_PAGE', 2)
+class NotificationListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', 'agent@example.com', 'password')
+        created_at = timezone.now()
+        cls.notifications = [
+            Notification.objects.create(
+                user=cls.user, title=f'Notification {index}', message='Ticket updated', read=index % 2 == 0,
+            )
+            for index in range(5)
+        ]
+        # Pages have to split notifications created in the same instant
+        Notification.objects.filter(user=cls.user).update(created_at=created_at)
+        cls.expected = list(Notification.objects.order_by('-created_at', 'id').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [notification['id'] for notification in data['results']]
+            url = data['next']
+        return seen
+
+    def test_json_pages(self):
+        self.assertEqual(self.walk(reverse('notification_list_json')), self.expected)
+        unread = [notification.pk for notification in self.notifications if not notification.read]
+        self.assertEqual(self.walk(f"{reverse('notification_list_json')}?unread=1"), sorted(unread))
+        self.assertEqual(self.client.get(reverse('notification_list_json'), {'cursor': 'invalid'}).status_code, 404)
+
+    def test_list_page(self):
+        response = self.client.get(reverse('notification_list'))
+        self.assertEqual([notification.pk for notification in response.context['notifications']], self.expected[:2])
+        self.assertIsNone(response.context['previous_page_url'])
+
+        # Later pages cost the same
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(reverse('notification_list'))
+        with CaptureQueriesContext(connection) as later:
+            response = self.client.get(response.context['next_page_url'])
+        self.assertEqual(len(later), len(first))
+        self.assertEqual([notification.pk for notification in response.context['notifications']], self.expected[2:4])
+        self.assertTrue(response.context['next_json_url'].startswith(reverse('notification_list_json')))
+
+
+class ReadWatermarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('agent', 'agent@example.com', 'password')
+        cls.notifications = [
+            Notification.objects.create(user=cls.user, title=f'Notification {index}', message='Ticket updated')
+            for index in range(3)
+        ]
+        # Created a minute ago, before the watermark moves
+        Notification.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def unread_count(self):
+        return UnreadNotificationCount.objects.get(user=self.user).count
+
+    def test_mark_all_read_updates_one_row(self):
+        mark_read(self.user, [self.notifications[0].pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(mark_read(self.user), 2)
+        self.assertFalse([query['sql'] for query in queries if 'notifications_notification"' in query['sql']])
+        self.assertEqual(self.unread_count(), 0)
+        self.assertEqual(Notification.objects.filter(read=False).count(), 2)
+        self.assertFalse(Notification.objects.filter(unread_q(get_read_watermark(self.user))).exists())
+
+    def test_notifications_below_the_watermark_are_read(self):
+        mark_read(self.user)
+        new = Notification.objects.create(user=self.user, title='Notification 3', message='Ticket updated')
+        self.assertEqual(self.unread_count(), 1)
+        self.assertEqual(get_notification_summary(self.user)['unread'], 1)
+        self.assertEqual(
+            [notification.read for notification in get_notification_summary(self.user)['recent']],
+            [False, True, True, True],
+        )
+
+        # Marking, saving or deleting notifications below the watermark
+        # leaves the count alone
+        self.assertEqual(mark_read(self.user, [self.notifications[0].pk]), 0)
+        notification = Notification.objects.get(pk=self.notifications[1].pk)
+        notification.read = True
+        notification.save()
+        self.notifications[2].delete()
+        self.assertEqual(self.unread_count(), 1)
+
+        self.assertEqual(mark_read(self.user, [new.pk]), 1)
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_rebuild_honours_the_watermark(self):
+        mark_read(self.user)
+        Notification.objects.create(user=self.user, title='Notification 3', message='Ticket updated')
+        UnreadNotificationCount.objects.filter(user=self.user).update(count=0)
+        call_command('rebuild_unread_counts', stdout=StringIO())
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_mark_all_read_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('mark_notification_read'), {'all': 'true'})
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(self.unread_count(), 0)
@@ -0,0 +1,185 @@
+"""
+Unread notification counts.
+
+Every user's unread count is kept in UnreadNotificationCount and adjusted
+when notifications are created, marked read or deleted, so the navbar badge
+never counts rows. The count and the user's most recent notifications are
+cached per user for ``NOTIFICATION_SUMMARY_CACHE_TIMEOUT`` seconds and the
+entry is dropped whenever a change for that user commits. With a
+per-process cache other processes notice changes within that timeout; use a
+shared cache (Redis, Memcached) for immediate updates everywhere.
+
+Marking all notifications read doesn't touch the notifications: it moves
+the user's read watermark (UnreadNotificationCount.last_read_at) to now and
+zeroes the count, one row either way. Notifications created up to the
+watermark are read whatever their ``read`` flag says; the flag only records
+notifications read one at a time since. Use ``unread_q`` to filter for
+unread notifications and ``apply_read_watermark`` before showing loaded
+ones.
+
+Changes that bypass the functions here and the model signals (queryset
+update() or delete(), raw SQL) are not counted; ``manage.py
+rebuild_unread_counts`` recomputes all counts.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from tickets.counters import increment_rows
+
+from .models import Notification, UnreadNotificationCount
+
+SUMMARY_CACHE_KEY = 'notifications:summary:{}'
+
+# Notifications shown in the navbar dropdown
+RECENT_NOTIFICATIONS = 5
+
+
+def adjust_unread_counts(deltas):
+    """
+    Add ``{user_id: delta}`` to the users' unread counts.
+    """
+    rows = [((user_id,), (delta,)) for user_id, delta in deltas.items() if delta]
+    increment_rows(UnreadNotificationCount, ('user',), ('count',), rows)
+    invalidate_summaries(user_id for user_id, delta in deltas.items() if delta)
+
+
+def invalidate_summaries(user_ids):
+    """
+    Drop the users' cached summaries and wake their notification streams
+    (see notifications/push.py) once the current transaction commits, when
+    the change is visible to whoever reads the summary again.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    def changed():
+        from .push import broker
+
+        cache.delete_many([SUMMARY_CACHE_KEY.format(user_id) for user_id in user_ids])
+        broker.publish(user_ids)
+
+    transaction.on_commit(changed)
+
+
+def get_read_watermark(user):
+    return UnreadNotificationCount.objects.filter(user=user).values_list('last_read_at', flat=True).first()
+
+
+def is_read(read, created_at, last_read_at):
+    """
+    Whether a notification with the given read flag and creation time is
+    read under the watermark ``last_read_at``.
+    """
+    return read or (last_read_at is not None and created_at <= last_read_at)
+
+
+def unread_q(last_read_at):
+    """
+    Filter for the notifications that are unread under ``last_read_at``.
+    """
+    q = Q(read=False)
+    if last_read_at is not None:
+        q &= Q(created_at__gt=last_read_at)
+    return q
+
+
+def apply_read_watermark(notifications, last_read_at):
+    """
+    Set ``read`` on the loaded ``notifications`` that the watermark marks
+    read. Only the instances change; saving one keeps the count right.
+    """
+    for notification in notifications:
+        if not notification.read and is_read(False, notification.created_at, last_read_at):
+            notification.read = notification._loaded_read = True
+    return notifications
+
+
+def get_notification_summary(user):
+    """
+    Return ``{'unread': count, 'recent': [notifications], 'etag': str}``
+    for ``user``, from the cache when possible.
+    """
+    key = SUMMARY_CACHE_KEY.format(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        unread, last_read_at = UnreadNotificationCount.objects.filter(user=user).values_list(
+            'count', 'last_read_at',
+        ).first() or (0, None)
+        recent = list(Notification.objects.filter(user=user).order_by('-created_at', 'id')[:RECENT_NOTIFICATIONS])
+        apply_read_watermark(recent, last_read_at)
+        latest = max((notification.pk for notification in recent), default=0)
+        summary = {
+            'unread': max(unread, 0),
+            'recent': recent,
+            'etag': f'{unread}-{latest}',
+        }
+        cache.set(key, summary, getattr(settings, 'NOTIFICATION_SUMMARY_CACHE_TIMEOUT', 30))
+    return summary
+
+
+def mark_read(user, notification_ids=None):
+    """
+    Mark the given notifications of ``user`` read (all of them when None)
+    and return how many were unread.
+    """
+    if notification_ids is None:
+        return mark_all_read(user)
+    notifications = Notification.objects.filter(unread_q(get_read_watermark(user)), user=user, pk__in=notification_ids)
+    with transaction.atomic():
+        updated = notifications.update(read=True)
+        adjust_unread_counts({user.pk: -updated})
+    return updated
+
+
+def mark_all_read(user):
+    """
+    Move ``user``'s read watermark to now, which marks every notification
+    they have read, and return how many were unread.
+
+    A notification created by a transaction that was still open at this
+    moment can end up read but counted; rebuild_unread_counts() fixes that.
+    """
+    with transaction.atomic():
+        state, created = UnreadNotificationCount.objects.select_for_update().get_or_create(user=user)
+        unread = max(state.count, 0)
+        state.count = 0
+        state.last_read_at = timezone.now()
+        state.save(update_fields=['count', 'last_read_at'])
+        invalidate_summaries([user.pk])
+    return unread
+
+
+def rebuild_unread_counts():
+    """
+    Recompute every user's unread count from the notifications table and
+    the read watermarks. Returns the number of users with unread
+    notifications.
+    """
+    unread = Q(read=False) & (
+        Q(user__unread_notification_count__last_read_at__isnull=True)
+        | Q(created_at__gt=F('user__unread_notification_count__last_read_at'))
+    )
+    counts = (
+        Notification.objects.values('user_id')
+        .annotate(unread=Count('pk', filter=unread))
+        .filter(unread__gt=0)
+        .order_by()
+    )
+    with transaction.atomic():
+        stale = set(UnreadNotificationCount.objects.exclude(count=0).values_list('user_id', flat=True))
+        # Zero the counts rather than deleting the rows, which hold the
+        # watermarks
+        UnreadNotificationCount.objects.exclude(count=0).update(count=0)
+        rows = UnreadNotificationCount.objects.bulk_create(
+            [UnreadNotificationCount(user_id=row['user_id'], count=row['unread']) for row in counts],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['count'],
+        )
+        invalidate_summaries(stale | {row.user_id for row in rows})
+    return len(rows)
@@ -1,8 +1,14 @@
 from django.urls import path
-from .views import NotificationPreferencesView, notification_list, mark_notification_read
+from .views import (
+    NotificationPreferencesView, notification_list, notification_list_json, mark_notification_read,
+    unread_count, notification_stream,
+)
 
 urlpatterns = [
     path('list/', notification_list, name='notification_list'),
+    path('list/json/', notification_list_json, name='notification_list_json'),
     path('preferences/', NotificationPreferencesView.as_view(), name='notification_preferences'),
     path('mark-read/', mark_notification_read, name='mark_notification_read'),
+    path('unread-count/', unread_count, name='notification_unread_count'),
+    path('stream/', notification_stream, name='notification_stream'),
 ]
\ No newline at end of file
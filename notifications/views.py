@@ -2,12 +2,19 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.generic import UpdateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+
+from tickets.pagination import InvalidCursor, KeysetPaginator, keyset_page_links
 
 from .forms import NotificationPreferencesForm
 from .models import NotificationPreference, Notification
+from .push import notification_events, serialize_notification
+from .unread import apply_read_watermark, get_notification_summary, get_read_watermark, mark_read, unread_q
 
 @method_decorator(login_required, name='dispatch')
 class NotificationPreferencesView(UpdateView):
@@ -25,19 +32,64 @@ class NotificationPreferencesView(UpdateView):
         messages.success(self.request, "Notification preferences updated successfully.")
         return super().form_valid(form)
 
+NOTIFICATIONS_PER_PAGE = 20
+
+def get_notification_page(request):
+    """
+    Return the requested page of the user's notifications, newest first,
+    unread ones only with ``?unread=1``. Keyset pagination over the
+    (user, -created_at, id) indexes keeps every page equally cheap.
+    """
+    last_read_at = get_read_watermark(request.user)
+    notifications = Notification.objects.filter(user=request.user)
+    if request.GET.get('unread'):
+        notifications = notifications.filter(unread_q(last_read_at))
+    paginator = KeysetPaginator(ordering=('-created_at', 'id'), page_size=NOTIFICATIONS_PER_PAGE)
+    try:
+        page = paginator.paginate(notifications, request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404("Invalid page.")
+    apply_read_watermark(page.object_list, last_read_at)
+    return page
+
 @login_required
 def notification_list(request):
-    # Get user's notifications
-    notifications = request.user.notifications.all().order_by('-created_at')
-    
     # Mark all as read if requested
     if 'mark_all_read' in request.GET:
-        notifications.update(read=True)
+        mark_read(request.user)
         messages.success(request, "All notifications marked as read.")
         return redirect('notification_list')
     
+    page = get_notification_page(request)
+    first_url, previous_url, next_url = keyset_page_links(request, page)
+    
     return render(request, 'notifications/notification_list.html', {
-        'notifications': notifications
+        'notifications': page.object_list,
+        'unread_only': bool(request.GET.get('unread')),
+        'first_page_url': first_url,
+        'previous_page_url': previous_url,
+        'next_page_url': next_url,
+        'next_json_url': next_page_json_url(request, page),
+    })
+
+def next_page_json_url(request, page):
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return f"{reverse('notification_list_json')}?{params.urlencode()}"
+
+@login_required
+def notification_list_json(request):
+    """
+    A page of notifications as JSON for infinite scroll. Takes the same
+    ``cursor`` and ``unread`` parameters as the list page; ``next`` is the
+    URL of the following page or null.
+    """
+    page = get_notification_page(request)
+    return JsonResponse({
+        'results': [serialize_notification(notification) for notification in page],
+        'next': next_page_json_url(request, page),
     })
 
 @login_required
@@ -48,13 +100,56 @@ def mark_notification_read(request):
         
         if all_notifications:
             # Mark all notifications as read
-            request.user.notifications.all().update(read=True)
+            mark_read(request.user)
             return JsonResponse({'status': 'success', 'message': 'All notifications marked as read'})
         elif notification_id:
             # Mark specific notification as read
             notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-            notification.read = True
-            notification.save()
+            mark_read(request.user, [notification.pk])
             return JsonResponse({'status': 'success', 'message': 'Notification marked as read'})
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+
+def unread_count_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return get_notification_summary(request.user)['etag']
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@etag(unread_count_etag)
+def unread_count(request):
+    """
+    The unread notification count for polling clients. Send the ETag back
+    in If-None-Match to get a 304 while the count hasn't changed; both are
+    served from the cache.
+    """
+    summary = get_notification_summary(request.user)
+    return JsonResponse({'unread': summary['unread']})
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of new notifications and unread count
+    changes (see notifications/push.py). Only served by the ASGI
+    application: under WSGI every open stream would hold a worker, so it
+    answers 204, which tells EventSource clients not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)
+    
+    try:
+        last_event_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_event_id = None
+    
+    response = StreamingHttpResponse(
+        notification_events(user, last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -84,6 +84,50 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Keep the notification badge current: pushed over Server-Sent Events
+    // when the site is served over ASGI, otherwise polled. The browser
+    // revalidates the poll with If-None-Match, so unchanged counts come back
+    // as 304s from the cache.
+    function updateNotificationBadge(unread) {
+        var badge = document.querySelector('.notification-badge');
+        if (badge) {
+            badge.textContent = unread;
+            badge.style.display = unread ? '' : 'none';
+        }
+    }
+    
+    function pollUnreadCount() {
+        setInterval(function() {
+            fetch('/notifications/unread-count/', {credentials: 'same-origin'})
+                .then(function(response) {
+                    return response.ok ? response.json() : null;
+                })
+                .then(function(data) {
+                    if (data) {
+                        updateNotificationBadge(data.unread);
+                    }
+                })
+                .catch(function() {});
+        }, 60000);
+    }
+    
+    if (document.querySelector('.notification-badge')) {
+        if (window.EventSource) {
+            var notificationStream = new EventSource('/notifications/stream/');
+            notificationStream.addEventListener('unread', function(e) {
+                updateNotificationBadge(JSON.parse(e.data).unread);
+            });
+            notificationStream.addEventListener('error', function() {
+                // Closed for good (e.g. a 204 when not served over ASGI)
+                if (notificationStream.readyState === EventSource.CLOSED) {
+                    pollUnreadCount();
+                }
+            });
+        } else {
+            pollUnreadCount();
+        }
+    }
+    
     // Helper function to get CSRF token
     function getCookie(name) {
         let cookieValue = null;
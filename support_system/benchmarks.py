@@ -0,0 +1,287 @@
+"""
+Endpoint benchmarks with stored baselines.
+
+``manage.py benchmark_endpoints`` requests each endpoint in ENDPOINTS
+through the test client, as a user with the role the endpoint serves, and
+records per endpoint the p50/p95/p99 wall time of a request, the SQL
+queries it runs and the peak memory Python allocates while serving it
+(measured with tracemalloc in separate runs, since tracing slows everything
+down).
+
+Results are compared with a baseline file kept in the repository, which
+holds one set of results per database vendor because query counts and
+timings differ between SQLite and PostgreSQL. An endpoint regresses when its
+p50 or p95 time or its memory grows by more than the tolerance, or when it
+runs more queries. p99 is recorded but not checked; it is too noisy over a
+few dozen requests.
+
+The benchmark users are the busiest ones of each role in the database, so
+run it on data of the size you care about (see generate_synthetic_data).
+Everything happens in one transaction that is rolled back, including the
+tickets and comments the create endpoints make.
+"""
+import json
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.serializers import RoleTokenObtainPairSerializer
+from notifications.models import Notification
+from tickets.models import Category, Comment, Department, Ticket
+
+BASELINE_VERSION = 1
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Timing differences below this are noise, however fast the endpoint is
+MIN_TIME_SLACK_MS = 1.0
+
+
+class Endpoint:
+    """
+    One benchmarked request. ``url_kwargs`` and string values in ``data``
+    may refer to the benchmark context: ``{ticket}``, ``{category}``,
+    ``{department}`` and ``{username}`` (the user of ``role``). ``role`` None
+    sends the request anonymously.
+    """
+    def __init__(self, name, role, method, url_name, url_kwargs=None, data=None, status=200):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.url_name = url_name
+        self.url_kwargs = url_kwargs or {}
+        self.data = data
+        self.status = status
+
+    def url(self, context):
+        return reverse(self.url_name, kwargs={
+            key: value.format(**context) for key, value in self.url_kwargs.items()
+        })
+
+    def payload(self, context):
+        if self.data is None:
+            return None
+        return {
+            key: value.format(**context) if isinstance(value, str) else value
+            for key, value in self.data.items()
+        }
+
+
+ENDPOINTS = [
+    Endpoint('api-ticket-list-admin', 'admin', 'get', 'ticket-list'),
+    Endpoint('api-ticket-list-support', 'support', 'get', 'ticket-list'),
+    Endpoint('api-ticket-list-client', 'client', 'get', 'ticket-list'),
+    Endpoint('api-ticket-retrieve', 'client', 'get', 'ticket-detail', {'pk': '{ticket}'}),
+    Endpoint('api-ticket-create', 'client', 'post', 'ticket-list', data={
+        'title': 'Benchmark ticket',
+        'description': 'Created by benchmark_endpoints',
+        'priority': 'medium',
+        'category_id': '{category}',
+        'department_id': '{department}',
+    }, status=201),
+    Endpoint('api-comment-list', 'support', 'get', 'comment-list'),
+    Endpoint('api-comment-create', 'client', 'post', 'comment-list', data={
+        'ticket_id': '{ticket}',
+        'text': 'Benchmark comment',
+    }, status=201),
+    Endpoint('ticket-list-view', 'support', 'get', 'ticket_list'),
+    Endpoint('ticket-detail-view', 'client', 'get', 'ticket_detail', {'pk': '{ticket}'}),
+    Endpoint('home-admin', 'admin', 'get', 'home'),
+    Endpoint('home-support', 'support', 'get', 'home'),
+    Endpoint('home-client', 'client', 'get', 'home'),
+    Endpoint('notification-list', 'admin', 'get', 'notification_list'),
+    Endpoint('token-obtain', None, 'post', 'token_obtain_pair', data={
+        'username': '{username}',
+        'password': BENCHMARK_PASSWORD,
+    }),
+]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of ``values``.
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def busiest_user(role, **annotation):
+    users = User.objects.filter(profile__role=role, is_active=True)
+    if annotation:
+        users = users.annotate(**annotation).order_by(f'-{next(iter(annotation))}', 'pk')
+    else:
+        users = users.order_by('pk')
+    user = users.first()
+    if user is None:
+        raise BenchmarkError(f'No active {role} user; seed the database first (generate_synthetic_data)')
+    return user
+
+
+def get_benchmark_context():
+    """
+    Pick the benchmark users and objects: the admin with the most
+    notifications, the support user with the most assigned tickets, the
+    client with the most tickets and that client's latest ticket.
+    """
+    users = {
+        'admin': busiest_user('admin', activity=Count('notifications')),
+        'support': busiest_user('support', activity=Count('assigned_tickets')),
+        'client': busiest_user('client', activity=Count('created_tickets')),
+    }
+    ticket = Ticket.objects.filter(created_by=users['client']).order_by('-created_at', '-pk').first()
+    category = Category.objects.order_by('pk').first()
+    department = Department.objects.order_by('pk').first()
+    if ticket is None or category is None or department is None:
+        raise BenchmarkError('The database has no tickets, categories or departments; seed it first')
+    return users, {
+        'ticket': str(ticket.pk),
+        'category': str(category.pk),
+        'department': str(department.pk),
+    }
+
+
+def data_sizes():
+    return {
+        'users': User.objects.count(),
+        'tickets': Ticket.objects.count(),
+        'comments': Comment.objects.count(),
+        'notifications': Notification.objects.count(),
+    }
+
+
+def make_clients(users):
+    """
+    Return ``{role: Client}`` logged in for the template views and sending a
+    JWT for the API. Call it inside the benchmark transaction.
+    """
+    # The anonymous token request logs in as the client; update() skips
+    # the signal that would revoke the tokens issued below. The instance
+    # needs the new hash too, or its session is invalid.
+    client_user = users['client']
+    client_user.password = make_password(BENCHMARK_PASSWORD)
+    User.objects.filter(pk=client_user.pk).update(password=client_user.password)
+    clients = {None: Client()}
+    for role, user in users.items():
+        token = RoleTokenObtainPairSerializer.get_token(user).access_token
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        client.force_login(user)
+        clients[role] = client
+    return clients
+
+
+def send(client, endpoint, url, payload):
+    if endpoint.method == 'get':
+        response = client.get(url)
+    else:
+        response = getattr(client, endpoint.method)(url, payload, content_type='application/json')
+    if response.status_code != endpoint.status:
+        raise BenchmarkError(
+            f'{endpoint.name}: {endpoint.method.upper()} {url} answered {response.status_code}, '
+            f'expected {endpoint.status}'
+        )
+    return response
+
+
+def measure(client, endpoint, context, iterations, warmup=3, memory_runs=3):
+    """
+    Request ``endpoint`` ``warmup + iterations + memory_runs`` times and
+    return its metrics.
+    """
+    url = endpoint.url(context)
+    payload = endpoint.payload(context)
+    for _ in range(warmup):
+        send(client, endpoint, url, payload)
+
+    timings = []
+    queries = 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            send(client, endpoint, url, payload)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(memory_runs):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            send(client, endpoint, url, payload)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'queries': queries,
+        'memory_kb': round(percentile(peaks, 50) / 1024, 1) if peaks else 0,
+    }
+
+
+def compare(result, expected, time_tolerance, memory_tolerance, query_tolerance=0):
+    """
+    Return descriptions of the metrics of ``result`` that regressed against
+    ``expected``.
+    """
+    regressions = []
+    for metric in ('p50_ms', 'p95_ms'):
+        limit = expected[metric] * (1 + time_tolerance) + MIN_TIME_SLACK_MS
+        if result[metric] > limit:
+            regressions.append(f'{metric} {result[metric]} > {limit:.2f} (baseline {expected[metric]})')
+    if result['queries'] > expected['queries'] + query_tolerance:
+        regressions.append(f'queries {result["queries"]} > {expected["queries"] + query_tolerance}')
+    limit = expected['memory_kb'] * (1 + memory_tolerance)
+    if result['memory_kb'] > limit:
+        regressions.append(f'memory_kb {result["memory_kb"]} > {limit:.1f} (baseline {expected["memory_kb"]})')
+    return regressions
+
+
+def load_baseline(path):
+    """
+    Return the baseline file's content, or an empty baseline if it doesn't
+    exist yet.
+    """
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return {'version': BASELINE_VERSION, 'databases': {}}
+    if baseline.get('version') != BASELINE_VERSION:
+        raise BenchmarkError(
+            f'{path} has baseline version {baseline.get("version")}, expected {BASELINE_VERSION}; '
+            f're-record it with --update-baseline'
+        )
+    return baseline
+
+
+def save_baseline(path, baseline, vendor, results, sizes):
+    """
+    Store ``results`` as the baseline for ``vendor``, keeping the baselines
+    of endpoints that weren't run.
+    """
+    endpoints = baseline['databases'].get(vendor, {}).get('endpoints', {})
+    baseline['databases'][vendor] = {
+        'recorded_at': timezone.now().isoformat(timespec='seconds'),
+        'data': sizes,
+        'endpoints': {**endpoints, **results},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,467 @@
+"""
+Application metrics in the Prometheus text format.
+
+Counters and histograms are kept in process memory and served on
+``/metrics``. Recording a value takes a lock and a dict update, no I/O.
+
+Web servers run several worker processes, and management commands (the
+outbox worker, digests) run in processes of their own, so each process
+writes its values to ``METRICS_DIR/<pid>.json`` at most every
+``METRICS_FLUSH_INTERVAL`` seconds, from a background thread, and when it
+exits. ``/metrics`` adds up
+the files of all processes; values of other processes are therefore up to
+``METRICS_FLUSH_INTERVAL`` seconds old. Files of processes that have
+exited are merged into ``archive.json``, so counters never go back. The
+directory is shared through the file system, so all processes must run on
+one host (and in one PID namespace). Without ``METRICS_DIR`` every process
+serves only its own values.
+
+The metrics of the apps are defined at the end of this module, so that all
+of them are known in every process and the names are in one place.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+try:
+    import fcntl
+except ImportError:
+    # No locking; without concurrent writers the store is consistent anyway
+    fcntl = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ARCHIVE_FILE = 'archive.json'
+
+LOCK_FILE = '.lock'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def get_metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but someone else's
+        pass
+    return True
+
+
+@contextmanager
+def store_lock(directory):
+    """
+    Hold an exclusive lock on the metrics directory of all processes.
+    """
+    # Closing the file releases the lock
+    with open(directory / LOCK_FILE, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def read_store_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_store_file(path, values):
+    temporary = path.with_name(f'.{path.name}.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(values, f)
+    os.replace(temporary, path)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    """
+    A metric with a fixed set of label names. Values are kept per
+    combination of label values, as a tuple of strings.
+    """
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        registry.register(self)
+
+    def key(self, labels):
+        if len(labels) != len(self.labelnames) or not all(name in labels for name in self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labelnames) or "(none)"}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """
+        Return the values as JSON: ``[[label values, value]]``. Call it
+        holding the registry's lock.
+        """
+        raise NotImplementedError
+
+    def merge(self, totals, key, value):
+        """
+        Add a value read from a snapshot to ``totals``.
+        """
+        raise NotImplementedError
+
+    def samples(self, key, value):
+        """
+        Yield the ``(name, labels, value)`` samples of one series.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. the number of events. Name it ``..._total``.
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, totals, key, value):
+        totals[key] = totals.get(key, 0) + value
+
+    def samples(self, key, value):
+        yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values, e.g. durations, counted in buckets.
+    """
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # The first bucket whose upper bound is at least value; the last
+        # position stands for +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            # Counts per bucket (not cumulative), then the sum
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+        self.registry.changed()
+
+    def snapshot(self):
+        return [[list(key), list(state)] for key, state in self.values.items()]
+
+    def merge(self, totals, key, value):
+        if len(value) != len(self.buckets) + 2:
+            # Recorded with other buckets, by an older version
+            return
+        state = totals.get(key)
+        if state is None:
+            totals[key] = list(value)
+        else:
+            for index, count in enumerate(value):
+                state[index] += count
+
+    def samples(self, key, value):
+        labels = list(zip(self.labelnames, key))
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), value):
+            cumulative += count
+            yield f'{self.name}_bucket', labels + [('le', format_value(float(bound)))], cumulative
+        yield f'{self.name}_sum', labels, value[-1]
+        yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    """
+    The metrics of a process and their shared store; see the module
+    docstring.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        # The process that owns the values; a forked child starts over
+        self.pid = None
+        # The background thread that writes the values, and the process it
+        # runs in (threads don't survive a fork)
+        self.flusher_lock = threading.Lock()
+        self.flusher_pid = None
+        self.flush_requested = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return Counter(self, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, documentation, labelnames, buckets)
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.metrics.items() if metric.values}
+
+    def changed(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if time.monotonic() - self.last_flush >= interval and get_metrics_dir() is not None:
+            self.request_flush()
+
+    def request_flush(self):
+        """
+        Have the background thread write the values, starting it first in a
+        new process.
+        """
+        if self.flusher_pid != os.getpid():
+            with self.flusher_lock:
+                if self.flusher_pid != os.getpid():
+                    self.flush_requested = threading.Event()
+                    threading.Thread(
+                        target=self.run_flusher, args=(self.flush_requested,), name='metrics-flush', daemon=True,
+                    ).start()
+                    self.flusher_pid = os.getpid()
+        self.flush_requested.set()
+
+    def run_flusher(self, requested):
+        while True:
+            requested.wait()
+            requested.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write this process's values to the shared store.
+        """
+        directory = get_metrics_dir()
+        if directory is None or not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_flush = time.monotonic()
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f'{os.getpid()}.json'
+            if self.pid != os.getpid():
+                # A file of ours from before we started belongs to an
+                # exited process that had the same pid
+                with store_lock(directory):
+                    if path.exists():
+                        self.archive(directory, [path])
+                self.pid = os.getpid()
+            write_store_file(path, self.snapshot())
+        finally:
+            self.flush_lock.release()
+
+    def archive(self, directory, paths):
+        """
+        Move the values in ``paths`` into the archive. Call it holding the
+        store lock.
+        """
+        archive_path = directory / ARCHIVE_FILE
+        totals = self.merge([archive_path, *paths])
+        write_store_file(archive_path, {
+            name: [[list(key), value] for key, value in values.items()]
+            for name, values in totals.items()
+        })
+        for path in paths:
+            path.unlink()
+
+    def merge(self, paths):
+        """
+        Return ``{name: {label values: value}}`` with the values of all
+        ``paths`` added up.
+        """
+        totals = {}
+        for path in paths:
+            for name, series in read_store_file(path).items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    # Removed since
+                    continue
+                values = totals.setdefault(name, {})
+                for key, value in series:
+                    metric.merge(values, tuple(key), value)
+        return totals
+
+    def collect(self):
+        """
+        Return ``{name: {label values: value}}`` for all processes.
+        """
+        directory = get_metrics_dir()
+        if directory is None:
+            return self.merge_snapshot(self.snapshot())
+        self.flush()
+        with store_lock(directory):
+            paths = [path for path in directory.glob('*.json') if path.name != ARCHIVE_FILE]
+            exited = [path for path in paths if path.stem.isdigit() and not process_alive(int(path.stem))]
+            if exited:
+                self.archive(directory, exited)
+            return self.merge(directory.glob('*.json'))
+
+    def merge_snapshot(self, snapshot):
+        totals = {}
+        for name, series in snapshot.items():
+            values = totals.setdefault(name, {})
+            for key, value in series:
+                self.metrics[name].merge(values, tuple(key), value)
+        return totals
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text format.
+        """
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(totals.get(name, {}).items()):
+                for sample_name, labels, sample in metric.samples(key, value):
+                    lines.append(f'{sample_name}{format_labels(labels)} {format_value(sample)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+atexit.register(registry.flush)
+
+
+def metrics_view(request):
+    """
+    Serve the metrics to Prometheus, which must send ``METRICS_TOKEN`` as a
+    bearer token. Without a token nothing is served, except to local
+    requests with DEBUG on: behind a reverse proxy on the same host every
+    request comes from localhost.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG and request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts statements.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Record the duration and SQL query count of every request by URL name.
+    For streaming responses only the time until the response starts is
+    measured.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label, so random URLs can't create series
+        view = match.view_name if match else '<unresolved>'
+        HTTP_REQUEST_DURATION.observe(seconds, view=view, method=request.method, status=response.status_code)
+        HTTP_REQUEST_QUERIES.observe(queries.count, view=view, method=request.method)
+        return response
+
+
+# Metrics of the apps
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds',
+    'Time to respond to a request, by URL name.',
+    ['view', 'method', 'status'],
+)
+HTTP_REQUEST_QUERIES = registry.histogram(
+    'http_request_db_queries',
+    'SQL queries run by a request, by URL name.',
+    ['view', 'method'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+NOTIFICATION_FANOUT = registry.histogram(
+    'notification_fanout_recipients',
+    'In-app notifications created for one event.',
+    ['event'],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 5000),
+)
+EMAIL_SEND_DURATION = registry.histogram(
+    'email_send_duration_seconds',
+    'Time to send one email message, including opening the connection.',
+    ['outcome'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+EMAIL_SEND_FAILURES = registry.counter(
+    'email_send_failures_total',
+    'Email messages the backend failed to send, by error.',
+    ['error'],
+)
+TICKET_STATUS_TRANSITIONS = registry.counter(
+    'ticket_status_transitions_total',
+    'Committed ticket status changes; new tickets come from "none".',
+    ['from_status', 'to_status'],
+)
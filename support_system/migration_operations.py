@@ -0,0 +1,73 @@
+from django.db.migrations.operations import AddConstraint, AddIndex
+
+
+class AddIndexConcurrently(AddIndex):
+    """
+    AddIndex that builds the index with CREATE INDEX CONCURRENTLY on
+    PostgreSQL so the table stays writable while the index is built.
+
+    Unlike django.contrib.postgres.operations.AddIndexConcurrently this
+    falls back to a plain AddIndex on other backends (SQLite in local
+    development). Migrations using it must set ``atomic = False``.
+    """
+    atomic = False
+
+    def describe(self):
+        return 'Concurrently create index %s on field(s) %s of model %s' % (
+            self.index.name,
+            ', '.join(self.index.fields),
+            self.model_name,
+        )
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == 'postgresql':
+                schema_editor.add_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == 'postgresql':
+                schema_editor.remove_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.remove_index(model, self.index)
+
+
+class AddUniqueIndexConcurrently(AddConstraint):
+    """
+    AddConstraint for a UniqueConstraint that is backed by a unique index
+    (one with opclasses or a condition). On PostgreSQL the index is built
+    with CREATE UNIQUE INDEX CONCURRENTLY; other backends use AddConstraint.
+    Migrations using it must set ``atomic = False``.
+    """
+    atomic = False
+
+    def describe(self):
+        return 'Concurrently create unique index %s on model %s' % (self.constraint.name, self.model_name)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.add_constraint(model, self.constraint)
+            return
+        sql = str(self.constraint.create_sql(model, schema_editor))
+        if not sql.startswith('CREATE UNIQUE INDEX '):
+            raise ValueError('%s is not backed by a unique index' % self.constraint.name)
+        schema_editor.execute(sql.replace('CREATE UNIQUE INDEX ', 'CREATE UNIQUE INDEX CONCURRENTLY ', 1), params=None)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.remove_constraint(model, self.constraint)
+            return
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(self.constraint.name),
+            params=None,
+        )
@@ -0,0 +1,322 @@
+"""
+On-demand request profiling.
+
+An admin profiles a request by adding ``?profile=cpu``, ``?profile=memory``
+or ``?profile=cpu,memory`` to its URL, or, for API clients, by sending the
+same value in an ``X-Profile`` header. Independently of that,
+``PROFILING_SAMPLE_RATE`` of all requests are profiled with
+``PROFILING_SAMPLE_MODES``, whoever sends them.
+
+- cpu: the request runs under cProfile, saved as ``cpu.pstats``. Meanwhile a
+  sampler thread records the request thread's stack every
+  ``PROFILING_SAMPLE_INTERVAL`` seconds into ``cpu.collapsed``, one
+  ``frame;frame;frame count`` line per stack, which flamegraph.pl and
+  speedscope read.
+- memory: tracemalloc traces the request's allocations. ``memory.json``
+  holds the peak and the allocation sites holding the most memory when the
+  response is ready. tracemalloc is process-wide, so one request at a time
+  is memory-profiled; concurrent ones are profiled without it and list it
+  under ``skipped`` in their ``meta.json``.
+
+Each profile is a directory in ``PROFILING_DIR`` with a ``meta.json`` about
+the request, and the response carries its name in ``X-Profile-Id``.
+``manage.py request_profiles`` lists and summarizes them.
+
+A profiled request runs several times slower, so only admins can ask for
+one: the session user or, for API requests, the user of the bearer token.
+The role is checked here only when a profile is asked for, and never
+through ``request.role``, which must stay unresolved until DRF has
+authenticated the request.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from accounts.authentication import ProfileJWTAuthentication
+from accounts.roles import get_user_role
+
+MODES = ('cpu', 'memory')
+
+# Frames kept per traced allocation
+TRACEMALLOC_FRAMES = 10
+
+# Allocation sites kept in memory.json
+TOP_ALLOCATIONS = 50
+
+# Held by the request being memory-profiled: tracemalloc's traces and peak
+# are shared by every thread, and stopping it would cut short another
+# request's profile
+MEMORY_PROFILE_LOCK = threading.Lock()
+
+
+def get_profiling_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+def parse_modes(value):
+    return {mode.strip().lower() for mode in value.split(',')} & set(MODES)
+
+
+def short_path(filename):
+    """
+    Shorten a source path to what identifies it: the part below
+    site-packages, or the part below the project directory.
+    """
+    marker = f'site-packages{os.sep}'
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        return filename[len(base):]
+    return filename
+
+
+class StackSampler(threading.Thread):
+    """
+    Count the stacks of another thread, sampled every ``interval`` seconds.
+    With the GIL the effective interval is at least the interpreter's switch
+    interval (5ms by default).
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+class RequestProfiler:
+    """
+    Profile the code run inside ``with profiler:`` and write the results
+    with ``save()``.
+    """
+    def __init__(self, modes):
+        self.modes = set(modes)
+        self.profile = None
+        self.sampler = None
+        self.memory = None
+        self.skipped = set()
+        self.seconds = 0.0
+
+    def __enter__(self):
+        if 'memory' in self.modes and not MEMORY_PROFILE_LOCK.acquire(blocking=False):
+            self.modes.discard('memory')
+            self.skipped.add('memory')
+        if 'memory' in self.modes:
+            self.was_tracing = tracemalloc.is_tracing()
+            if not self.was_tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            self.memory_before = tracemalloc.get_traced_memory()[0]
+        if 'cpu' in self.modes:
+            self.sampler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.001))
+            self.sampler.start()
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+            self.sampler.stop()
+        if 'memory' in self.modes:
+            try:
+                peak = tracemalloc.get_traced_memory()[1] - self.memory_before
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ])
+                if not self.was_tracing:
+                    tracemalloc.stop()
+            finally:
+                MEMORY_PROFILE_LOCK.release()
+            self.memory = {
+                'peak_kb': round(peak / 1024, 1),
+                'top': [
+                    {
+                        'site': f'{short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}',
+                        'size_kb': round(stat.size / 1024, 1),
+                        'count': stat.count,
+                    }
+                    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                ],
+            }
+
+    def save(self, request, response, user=None):
+        """
+        Write the profile to a new directory in PROFILING_DIR and return its
+        name.
+        """
+        now = timezone.now()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', view or request.path).strip('-')[:60] or 'root'
+        profile_id = f'{now:%Y%m%d-%H%M%S}-{slug}-{uuid.uuid4().hex[:6]}'
+        directory = get_profiling_dir() / profile_id
+        directory.mkdir(parents=True)
+
+        if self.profile is not None:
+            self.profile.dump_stats(directory / 'cpu.pstats')
+            with open(directory / 'cpu.collapsed', 'w') as f:
+                for stack, count in self.sampler.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        if self.memory is not None:
+            with open(directory / 'memory.json', 'w') as f:
+                json.dump(self.memory, f, indent=2)
+
+        meta = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': view,
+            'status': response.status_code,
+            'user': user.get_username() if user is not None else None,
+            'modes': sorted(self.modes),
+            'skipped': sorted(self.skipped),
+            'duration_ms': round(self.seconds * 1000, 2),
+            'samples': sum(self.sampler.stacks.values()) if self.sampler else 0,
+            'pid': os.getpid(),
+        }
+        with open(directory / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+        return profile_id
+
+
+def get_profiling_user(request):
+    """
+    Return the user asking for a profile: the session user, or the user of
+    the request's bearer token. None when neither authenticates.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    if not request.META.get('HTTP_AUTHORIZATION'):
+        return None
+    try:
+        authenticated = ProfileJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests on demand; see the module docstring. Put it after
+    AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        modes, user = self.requested_modes(request)
+        if not modes:
+            return self.get_response(request)
+
+        profiler = RequestProfiler(modes)
+        with profiler:
+            response = self.get_response(request)
+        response['X-Profile-Id'] = profiler.save(request, response, user)
+        return response
+
+    def requested_modes(self, request):
+        """
+        Return ``(modes, user)`` for the request: the modes an admin asked
+        for, or the sampled modes, or an empty set.
+        """
+        requested = request.GET.get('profile') or request.META.get('HTTP_X_PROFILE')
+        if requested:
+            modes = parse_modes(requested)
+            if modes:
+                user = get_profiling_user(request)
+                if get_user_role(user) == 'admin':
+                    return modes, user
+        sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if sample_rate > 0 and random.random() < sample_rate:
+            return parse_modes(','.join(getattr(settings, 'PROFILING_SAMPLE_MODES', ('cpu',)))), None
+        return set(), None
+
+
+def list_profiles(directory=None):
+    """
+    Return the ``meta.json`` of every stored profile, newest first.
+    """
+    directory = directory or get_profiling_dir()
+    profiles = []
+    for meta_file in Path(directory).glob('*/meta.json'):
+        with open(meta_file) as f:
+            profiles.append(json.load(f))
+    return sorted(profiles, key=lambda meta: meta['created_at'], reverse=True)
+
+
+def hottest_frames(collapsed_file, limit=20):
+    """
+    Return ``[(frame, samples)]`` of the frames that were running (the
+    innermost frame of a stack) in most samples.
+    """
+    frames = Counter()
+    with open(collapsed_file) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            frames[stack.rpartition(';')[2]] += int(count)
+    return frames.most_common(limit)
+
+
+def get_profile_directory(profile_id, directory=None):
+    """
+    Return the directory of the profile ``profile_id``, or of the newest
+    profile for ``'latest'``. None if there is no such profile.
+    """
+    directory = Path(directory or get_profiling_dir())
+    if profile_id == 'latest':
+        profiles = list_profiles(directory)
+        return directory / profiles[0]['id'] if profiles else None
+    if not re.fullmatch(r'[A-Za-z0-9-]+', profile_id) or not (directory / profile_id / 'meta.json').exists():
+        return None
+    return directory / profile_id
+
+
+def delete_profiles(before, directory=None):
+    """
+    Delete the profiles created before the datetime ``before`` and return
+    how many there were.
+    """
+    directory = Path(directory or get_profiling_dir())
+    deleted = 0
+    for meta in list_profiles(directory):
+        if datetime.fromisoformat(meta['created_at']) < before:
+            shutil.rmtree(directory / meta['id'])
+            deleted += 1
+    return deleted
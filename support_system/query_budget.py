@@ -0,0 +1,78 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_exempt = threading.local()
+
+
+@contextmanager
+def exempt_from_query_budget():
+    """
+    Don't count the queries run inside this block against view budgets.
+    Meant for filling caches that are shared across requests, whose cost is
+    paid once per cache lifetime rather than per request.
+    """
+    depth = getattr(_exempt, 'depth', 0)
+    _exempt.depth = depth + 1
+    try:
+        yield
+    finally:
+        _exempt.depth = depth
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised in strict mode when a view runs more queries than its budget.
+    """
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts the statements it sees.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(_exempt, 'depth', 0):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """
+    Enforce a maximum number of SQL queries per viewset action.
+
+    Declare the budget on the viewset, e.g.::
+
+        query_budget = {'list': 3, 'retrieve': 4}
+
+    Actions without an entry are not checked. The count covers the whole
+    dispatch (authentication, permission checks, queryset and serializer).
+    Going over budget logs a warning, or raises QueryBudgetExceeded when
+    the ``QUERY_BUDGET_STRICT`` setting is enabled (as it should be in tests).
+    """
+    query_budget = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        self.check_query_budget(counter.count)
+        return response
+
+    def check_query_budget(self, count):
+        action = getattr(self, 'action', None)
+        budget = self.query_budget.get(action)
+        if budget is None or count <= budget:
+            return
+
+        message = '%s.%s ran %d queries (budget %d)' % (self.__class__.__name__, action, count, budget)
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,201 @@
+"""
+Per-request SQL instrumentation.
+
+QueryInstrumentationMiddleware times every statement a request runs and
+reports, per request:
+
+- the number of queries and the time spent in the database,
+- the slowest statements,
+- duplicated statements: the same SQL (apart from its parameters and the
+  length of IN lists) run more than once, the signature of an N+1 query.
+
+The totals go into a ``Server-Timing`` response header, which browser dev
+tools show next to the request, on responses to admins (or to anyone with
+DEBUG on): it tells how the database is doing. Requests slower than
+``SQL_INSTRUMENTATION_SLOW_REQUEST_MS`` are logged as one JSON object per
+line to the ``support_system.query_instrumentation`` logger, with the
+slowest and duplicated statements.
+
+The cost is two clock reads and a dict update per statement. Only
+``SQL_INSTRUMENTATION_SAMPLE_RATE`` of the requests are instrumented; the
+others run untouched. Queries run while a streaming response is consumed
+come after the middleware returns and are not seen.
+"""
+import json
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from accounts.roles import get_user_role
+
+logger = logging.getLogger(__name__)
+
+# Distinct statements tracked per request; a request running more than this
+# many different statements has bigger problems than these numbers show
+MAX_STATEMENTS = 1000
+
+# Slowest and duplicated statements included in a log line
+REPORTED_STATEMENTS = 3
+
+OTHER_STATEMENTS = '<other statements>'
+
+_placeholder_list = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def statement_signature(sql):
+    """
+    Return ``sql`` with placeholder lists collapsed, so that ``IN (%s, %s)``
+    and ``IN (%s, %s, %s)`` count as the same statement.
+    """
+    return _placeholder_list.sub('%s, ...', sql)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that times the statements it sees, grouped by
+    their SQL.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # sql -> [executions, total seconds, slowest execution]
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            stats = self.statements.get(sql)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    sql = OTHER_STATEMENTS
+                stats = self.statements.setdefault(sql, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+    def signatures(self):
+        """
+        Return ``{signature: [executions, total seconds, slowest]}``.
+        """
+        grouped = {}
+        for sql, (count, total, slowest) in self.statements.items():
+            stats = grouped.setdefault(statement_signature(sql), [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = max(stats[2], slowest)
+        return grouped
+
+    def slowest(self, limit=REPORTED_STATEMENTS):
+        """
+        Return ``[(sql, milliseconds)]`` of the slowest single executions.
+        """
+        statements = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+        return [(sql, round(stats[2] * 1000, 2)) for sql, stats in statements[:limit]]
+
+    def duplicates(self, limit=None):
+        """
+        Return ``[(signature, executions, total milliseconds)]`` of the
+        statements run more than once, most repeated first.
+        """
+        duplicated = sorted(
+            (
+                (signature, stats) for signature, stats in self.signatures().items()
+                if stats[0] > 1 and signature != OTHER_STATEMENTS
+            ),
+            key=lambda item: item[1][0],
+            reverse=True,
+        )
+        if limit is not None:
+            duplicated = duplicated[:limit]
+        return [(signature, stats[0], round(stats[1] * 1000, 2)) for signature, stats in duplicated]
+
+    def duplicate_count(self):
+        """
+        Executions beyond the first of each statement.
+        """
+        return sum(executions - 1 for signature, executions, total in self.duplicates())
+
+
+def server_timing(recorder, seconds):
+    """
+    Return the ``Server-Timing`` header value for a request that took
+    ``seconds``.
+    """
+    slowest = recorder.slowest(1)
+    metrics = [
+        f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"',
+        f'db-slowest;dur={slowest[0][1] if slowest else 0:.2f}',
+        f'db-duplicates;desc="{recorder.duplicate_count()}"',
+        f'total;dur={seconds * 1000:.2f}',
+    ]
+    return ', '.join(metrics)
+
+
+def truncate(sql, length=500):
+    return sql if len(sql) <= length else sql[:length] + '...'
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the SQL of a sample of requests; see the module docstring. Put it
+    first in MIDDLEWARE so that the queries of the other middleware
+    (sessions, authentication) are included.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'SQL_INSTRUMENTATION_SAMPLE_RATE', 1.0)
+        if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        if self.shows_server_timing(request):
+            timing = server_timing(recorder, seconds)
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+        if seconds * 1000 >= getattr(settings, 'SQL_INSTRUMENTATION_SLOW_REQUEST_MS', 500):
+            self.log_slow_request(request, response, recorder, seconds)
+        return response
+
+    def shows_server_timing(self, request):
+        if not getattr(settings, 'SQL_INSTRUMENTATION_SERVER_TIMING', True):
+            return False
+        # request.user is the API user too once DRF has authenticated it
+        return settings.DEBUG or get_user_role(getattr(request, 'user', None)) == 'admin'
+
+    def log_slow_request(self, request, response, recorder, seconds):
+        match = getattr(request, 'resolver_match', None)
+        entry = {
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(seconds * 1000, 2),
+            'db_ms': round(recorder.duration * 1000, 2),
+            'queries': recorder.count,
+            'duplicate_queries': recorder.duplicate_count(),
+            'slowest': [{'sql': truncate(sql), 'ms': ms} for sql, ms in recorder.slowest()],
+            'duplicates': [
+                {'sql': truncate(signature), 'count': count, 'ms': total}
+                for signature, count, total in recorder.duplicates(REPORTED_STATEMENTS)
+            ],
+        }
+        logger.warning(json.dumps(entry), extra={'sql_instrumentation': entry})
@@ -51,12 +51,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it sees the queries of all other middleware
+    'support_system.query_instrumentation.QueryInstrumentationMiddleware',
+    'support_system.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.RoleMiddleware',  # request.role
+    'support_system.profiling.ProfilingMiddleware',  # ?profile=cpu,memory
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'notifications.context_processors.notifications',
             ],
         },
     },
@@ -145,7 +151,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.ProfileJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -162,8 +168,18 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Tokens carry the username and role, and revoked tokens can't be
+    # refreshed (see accounts/tokens.py)
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.DenyListTokenRefreshSerializer',
 }
 
+# Authenticate API requests from the token claims instead of loading the
+# user. Views that read other user fields load them on first access.
+JWT_STATELESS_AUTH = False
+# Seconds each process may use its cached copy of the token deny-list
+JWT_DENY_LIST_CACHE_TIMEOUT = 30
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only, restrict in production
 
@@ -171,6 +187,105 @@ CORS_ALLOW_ALL_ORIGINS = True  # For development only, restrict in production
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Authentication settings
+# Load the profile together with the user. ModelBackend stays listed so that
+# sessions created before it was replaced remain valid.
+AUTHENTICATION_BACKENDS = [
+    'accounts.authentication.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
 LOGIN_URL = 'login'
+
+# Query budgets (see support_system/query_budget.py)
+# Raise instead of logging when a view runs more queries than its budget.
+# Enable this in tests so N+1 regressions fail the build.
+QUERY_BUDGET_STRICT = False
+
+# Ticket numbers (see tickets/numbering.py)
+# How many numbers each process reserves at a time per department prefix.
+TICKET_NUMBER_BLOCK_SIZE = 20
+
+# Dashboard ticket counters (see tickets/counters.py)
+# Each counter is spread over this many rows so concurrent ticket writes
+# don't all queue on the same row.
+TICKET_COUNTER_SHARDS = 8
+# Seconds each process may serve the admin dashboard's cached user count,
+# departments and categories. Changes clear the entry in the local cache at
+# once; with a per-process cache other processes notice within this timeout.
+DASHBOARD_LOOKUPS_CACHE_TIMEOUT = 300
+
+# Notification fan-out (see notifications/fanout.py)
+# Rows written per bulk INSERT when an event notifies many users.
+NOTIFICATION_FANOUT_CHUNK_SIZE = 1000
+
+# Email outbox (see notifications/outbox.py)
+# Notification emails are queued and delivered by
+# `python manage.py send_queued_email`.
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_CONCURRENCY = 4
+EMAIL_OUTBOX_POLL_INTERVAL = 5
+# Failed messages are retried after 1 minute, then 2, 4, ... up to 6 hours,
+# and dead-lettered after the last attempt.
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 6 * 60 * 60
+# Seconds a worker may take to send a claimed batch before another worker
+# claims the messages again.
+EMAIL_OUTBOX_LEASE_SECONDS = 300
+
+# Email delivery (see notifications/delivery.py)
+# Messages sent over one SMTP connection before it is replaced.
+EMAIL_MAX_MESSAGES_PER_CONNECTION = 100
+
+# Unread notification counts (see notifications/unread.py)
+# Seconds each process may serve a user's cached unread count and recent
+# notifications. Changes clear the entry in the local cache at once; with a
+# per-process cache other processes notice within this timeout.
+NOTIFICATION_SUMMARY_CACHE_TIMEOUT = 30
+
+# Notification push (see notifications/push.py)
+# Seconds between keepalive comments on idle notification streams.
+NOTIFICATION_STREAM_KEEPALIVE = 25
+
+# Notification retention (see notifications/retention.py)
+# `python manage.py purge_notifications` removes notifications older than
+# these.
+NOTIFICATION_RETENTION_READ_DAYS = 30
+NOTIFICATION_RETENTION_UNREAD_DAYS = 180
+
+# Per-request SQL instrumentation (see support_system/query_instrumentation.py)
+# Share of requests that are instrumented; 0 switches it off.
+SQL_INSTRUMENTATION_SAMPLE_RATE = 1.0
+# Report query count and database time in a Server-Timing header, to admins
+# only unless DEBUG is on.
+SQL_INSTRUMENTATION_SERVER_TIMING = True
+# Log instrumented requests that take at least this many milliseconds, with
+# their slowest and duplicated statements.
+SQL_INSTRUMENTATION_SLOW_REQUEST_MS = 500
+
+# Request profiling (see support_system/profiling.py)
+# Admins profile a request with ?profile=cpu,memory or an X-Profile header;
+# the results are written here.
+PROFILING_DIR = BASE_DIR / 'profiles'
+# Share of all requests that are profiled with PROFILING_SAMPLE_MODES; 0
+# profiles only the requests admins ask for.
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_SAMPLE_MODES = ('cpu',)
+# Seconds between the stack samples of a CPU profile.
+PROFILING_SAMPLE_INTERVAL = 0.001
+
+# Metrics (see support_system/metrics.py)
+# Processes share their metrics through files in this directory; /metrics
+# serves the sum. Give every deployment on a host its own directory. Without
+# one, /metrics serves the values of the process that answers it.
+METRICS_DIR = None
+# Seconds a process may keep new values to itself before writing them.
+METRICS_FLUSH_INTERVAL = 5
+# Bearer token Prometheus must send to read /metrics. Without one /metrics
+# is only served to requests from localhost while DEBUG is on.
+METRICS_TOKEN = None
+
+# Bulk ticket changes (see tickets/bulk.py)
+# Tickets one POST /api/tickets/bulk/ may change.
+TICKET_BULK_MAX_TICKETS = 1000
@@ -0,0 +1,472 @@
+"""
+Synthetic data for load and scaling tests.
+
+SyntheticDataGenerator fills the database with users (with their profile
+and notification preferences), departments, categories, tickets with their
+comments and search documents, and notifications, up to tens of millions of
+rows. Rows are generated and written one batch at a time, never all held in
+memory, with COPY on PostgreSQL (psycopg 3) and bulk_create() elsewhere.
+All randomness comes from one random.Random seeded with ``seed``, so the
+same options produce the same data; timestamps are relative to ``now``.
+
+Bulk inserts skip the model signals, so derived data is written along with
+the rows (search documents, ticket numbers, unread counts) or rebuilt at
+the end (dashboard counters, analytics rollups).
+
+Users and tickets get explicit ids after the current highest one. Don't run
+it while anything else writes to the database.
+"""
+import itertools
+import math
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from notifications.models import Notification, NotificationPreference, UnreadNotificationCount
+from tickets.analytics import rebuild_rollups
+from tickets.counters import rebuild_counters
+from tickets.models import Category, Comment, Department, Ticket, TicketSearchDocument
+from tickets.numbering import format_ticket_number, reserve_ticket_numbers, ticket_number_prefix
+
+try:
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+except ImportError:
+    is_psycopg3 = False
+
+TICKET_SUBJECTS = {
+    'technical': ['Application crashes on startup', 'Error 500 when saving a form', 'Pages load very slowly', 'Cannot upload attachments'],
+    'account': ['Cannot log in', 'Password reset email never arrives', 'Change the email on my account', 'Two-factor code is rejected'],
+    'billing': ['Charged twice this month', 'Invoice is missing', 'Update my payment method', 'Refund request'],
+    'product': ['How do I export reports', 'Feature does not work as documented', 'Help setting up the integration', 'Mobile app does not sync'],
+    'feedback': ['Suggestion for the dashboard', 'Thanks for the quick help', 'Please add a dark mode', 'Settings page is confusing'],
+    'security': ['Suspicious login alert', 'Reporting a phishing email', 'Need an export of the audit log', 'Account locked after failed logins'],
+    'other': ['General question', 'Question about my subscription', 'Need help', 'Something else'],
+}
+
+DESCRIPTION_SENTENCES = [
+    'This started happening after the latest update.',
+    'It happens every time I try, on both Chrome and Firefox.',
+    'Several people on my team are affected.',
+    'I already cleared the cache and logged in again.',
+    'The error message says that the request could not be completed.',
+    'It worked fine until yesterday afternoon.',
+    'We need this resolved before the end of the week.',
+    'I attached a screenshot of what I see.',
+    'Our account number is in the profile.',
+    'Please let me know if you need more details.',
+]
+
+COMMENT_SENTENCES = [
+    'Thanks for reporting this, we are looking into it.',
+    'Could you tell us which browser and version you are using?',
+    'I tried again and it still fails.',
+    'We deployed a fix, please check whether it works for you now.',
+    'It works now, thank you!',
+    'I have escalated this to the engineering team.',
+    'Can you send us the exact time it happened?',
+    'Still waiting for an update on this.',
+    'We could reproduce the problem on our side.',
+    'Closing this as the issue is resolved.',
+]
+
+# Notification title and message; {title} is a ticket title
+NOTIFICATION_TEMPLATES = [
+    ('New Ticket Created', 'A new ticket "{title}" has been created.'),
+    ('Ticket Assigned', 'Ticket "{title}" has been assigned to you.'),
+    ('Ticket Status Updated', 'The status of ticket "{title}" has been updated.'),
+    ('New Comment on Ticket', 'A new comment has been added to ticket "{title}".'),
+]
+
+FIRST_NAMES = ['Alex', 'Sam', 'Maria', 'Chen', 'Fatima', 'Olga', 'Kwame', 'Priya', 'Jonas', 'Lucia', 'Mehmet', 'Aiko']
+LAST_NAMES = ['Smith', 'Garcia', 'Kowalski', 'Nguyen', 'Okafor', 'Silva', 'Tanaka', 'Müller', 'Haddad', 'Ivanova']
+
+
+def copy_available():
+    return connection.vendor == 'postgresql' and is_psycopg3
+
+
+def next_id(model):
+    return (model.objects.aggregate(highest=Max('pk'))['highest'] or 0) + 1
+
+
+def field_defaults(model):
+    """
+    Return ``{attname: default}`` for the concrete fields of ``model`` other
+    than the primary key. COPY doesn't apply the model's defaults, so rows
+    start from these.
+    """
+    return {
+        field.attname: field.get_default()
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """
+    Switch off auto_now and auto_now_add on ``model`` so that bulk_create()
+    keeps the generated timestamps.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def write_rows(model, rows, use_copy=False):
+    """
+    Insert ``rows``, dicts of attname to value that all have the same keys,
+    into the table of ``model``.
+    """
+    if not rows:
+        return
+    with transaction.atomic():
+        if use_copy:
+            quote_name = connection.ops.quote_name
+            columns = ', '.join(quote_name(model._meta.get_field(attname).column) for attname in rows[0])
+            with connection.cursor() as cursor:
+                with cursor.cursor.copy(f'COPY {quote_name(model._meta.db_table)} ({columns}) FROM STDIN') as copy:
+                    for row in rows:
+                        copy.write_row(tuple(row.values()))
+        else:
+            with explicit_timestamps(model):
+                model.objects.bulk_create([model(**row) for row in rows], batch_size=1000)
+
+
+def skewed_picker(rng, population, skew):
+    """
+    Return a function that picks from ``population`` with Zipf weights: after
+    a shuffle, the item of rank r has weight 1 / r ** skew. A skew of 0 is
+    uniform; at 1 the busiest of 100 items gets about a fifth of the picks.
+    """
+    population = list(population)
+    rng.shuffle(population)
+    cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(population) + 1)))
+    return lambda: rng.choices(population, cum_weights=cum_weights)[0]
+
+
+def weighted_picker(rng, weights):
+    """
+    Return a function that picks a key of ``{value: weight}``.
+    """
+    population = list(weights)
+    cum_weights = list(itertools.accumulate(weights.values()))
+    return lambda: rng.choices(population, cum_weights=cum_weights)[0]
+
+
+class SyntheticDataGenerator:
+    STATUS_WEIGHTS = {'open': 15, 'in_progress': 10, 'resolved': 30, 'closed': 40, 'reopened': 5}
+    # Tickets of the last week are mostly still being worked on
+    RECENT_STATUS_WEIGHTS = {'open': 45, 'in_progress': 35, 'resolved': 12, 'closed': 3, 'reopened': 5}
+    PRIORITY_WEIGHTS = {'low': 30, 'medium': 45, 'high': 20, 'urgent': 5}
+    EMAIL_FREQUENCY_WEIGHTS = {
+        NotificationPreference.IMMEDIATE: 80,
+        NotificationPreference.HOURLY: 10,
+        NotificationPreference.DAILY: 10,
+    }
+    # Notifications received per role, relative to clients: admins hear
+    # about every ticket and comment
+    NOTIFICATION_ROLE_WEIGHTS = {'admin': 50, 'support': 5, 'client': 1}
+
+    def __init__(self, users=1000, support_fraction=0.05, admins=3, tickets=10000, comments_per_ticket=3.0,
+                 notifications_per_user=20.0, unassigned_fraction=0.2, assignee_skew=1.0, creator_skew=1.0,
+                 read_fraction=0.7, days=365, seed=42, batch_size=10000, prefix='synthetic', use_copy=True,
+                 now=None, log=None):
+        self.user_count = users
+        self.support_fraction = support_fraction
+        self.admin_count = min(admins, users)
+        self.ticket_count = tickets
+        self.comments_per_ticket = comments_per_ticket
+        self.notifications_per_user = notifications_per_user
+        self.unassigned_fraction = unassigned_fraction
+        self.assignee_skew = assignee_skew
+        self.creator_skew = creator_skew
+        self.read_fraction = read_fraction
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.use_copy = use_copy and copy_available()
+        self.now = now or timezone.now()
+        self.start = self.now - timedelta(days=days)
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+        self.written = Counter()
+        self.users_by_role = {'admin': [], 'support': [], 'client': []}
+        self.ticket_ids = range(0)
+
+    def run(self):
+        """
+        Generate everything and return the number of rows written per model.
+        """
+        self.create_departments_and_categories()
+        self.timed('users', self.create_users)
+        self.timed('tickets', self.create_tickets)
+        self.timed('notifications', self.create_notifications)
+        self.rebuild_derived()
+        return self.written
+
+    def timed(self, label, function):
+        started = time.perf_counter()
+        before = sum(self.written.values())
+        function()
+        seconds = time.perf_counter() - started
+        rows = sum(self.written.values()) - before
+        self.log(f'{label}: {rows} rows in {seconds:.1f}s ({rows / seconds if seconds else 0:.0f} rows/s)')
+
+    def write(self, model, rows):
+        write_rows(model, rows, self.use_copy)
+        self.written[model._meta.label] += len(rows)
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(start + self.batch_size, count))
+
+    def timestamp(self, index, count, start=None):
+        """
+        The time of item ``index`` of ``count`` spread evenly, with jitter,
+        from ``start`` to now. Later items are never earlier, so ids grow
+        with time as they do in production.
+        """
+        start = start or self.start
+        return start + (self.now - start) * ((index + self.rng.random()) / count)
+
+    def create_departments_and_categories(self):
+        self.departments = [
+            Department.objects.get_or_create(code=code, defaults={'name': name})[0]
+            for code, name in Department.DEPARTMENT_CHOICES
+        ]
+        self.categories = [
+            Category.objects.get_or_create(code=code, defaults={'name': name})[0]
+            for code, name in Category.CATEGORY_CHOICES
+        ]
+
+    def create_users(self):
+        rng = self.rng
+        first_id = next_id(User)
+        support_count = max(1, round(self.user_count * self.support_fraction)) if self.user_count > self.admin_count else 0
+        # One hash for everyone: hashing a password per user would take longer
+        # than generating everything else. The accounts can't log in.
+        password = make_password(None)
+        user_defaults = field_defaults(User)
+        profile_defaults = field_defaults(UserProfile)
+        preference_defaults = field_defaults(NotificationPreference)
+        pick_frequency = weighted_picker(rng, self.EMAIL_FREQUENCY_WEIGHTS)
+
+        for batch in self.batches(self.user_count):
+            users, profiles, preferences = [], [], []
+            for index in batch:
+                user_id = first_id + index
+                if index < self.admin_count:
+                    role = 'admin'
+                elif index < self.admin_count + support_count:
+                    role = 'support'
+                else:
+                    role = 'client'
+                self.users_by_role[role].append(user_id)
+                joined = self.timestamp(index, self.user_count, self.start - timedelta(days=365))
+                username = f'{self.prefix}-{user_id}'
+                users.append({
+                    **user_defaults,
+                    'id': user_id,
+                    'username': username,
+                    'password': password,
+                    'email': f'{username}@example.com',
+                    'first_name': rng.choice(FIRST_NAMES),
+                    'last_name': rng.choice(LAST_NAMES),
+                    'is_staff': role == 'admin',
+                    'date_joined': joined,
+                })
+                profiles.append({**profile_defaults, 'user_id': user_id, 'role': role, 'created_at': joined, 'updated_at': joined})
+                preferences.append({
+                    **preference_defaults,
+                    'user_id': user_id,
+                    'email_notifications': rng.random() < 0.9,
+                    'email_frequency': pick_frequency(),
+                    'created_at': joined,
+                    'updated_at': joined,
+                })
+            self.write(User, users)
+            self.write(UserProfile, profiles)
+            self.write(NotificationPreference, preferences)
+
+    def create_tickets(self):
+        rng = self.rng
+        clients = self.users_by_role['client'] or self.users_by_role['support'] or self.users_by_role['admin']
+        support = self.users_by_role['support'] or self.users_by_role['admin']
+        if not self.ticket_count or not clients:
+            return
+        pick_creator = skewed_picker(rng, clients, self.creator_skew)
+        pick_assignee = skewed_picker(rng, support, self.assignee_skew) if support else lambda: None
+        pick_status = weighted_picker(rng, self.STATUS_WEIGHTS)
+        pick_recent_status = weighted_picker(rng, self.RECENT_STATUS_WEIGHTS)
+        pick_priority = weighted_picker(rng, self.PRIORITY_WEIGHTS)
+        prefixes = {department.pk: ticket_number_prefix(department) for department in self.departments}
+        first_id = next_id(Ticket)
+        self.ticket_ids = range(first_id, first_id + self.ticket_count)
+        ticket_defaults = field_defaults(Ticket)
+        comment_defaults = field_defaults(Comment)
+        document_defaults = field_defaults(TicketSearchDocument)
+        recent = self.now - timedelta(days=7)
+
+        for batch in self.batches(self.ticket_count):
+            tickets, comments, documents = [], [], []
+            for index in batch:
+                ticket_id = first_id + index
+                created_at = self.timestamp(index, self.ticket_count)
+                status = pick_recent_status() if created_at > recent else pick_status()
+                category = rng.choice(self.categories)
+                assignee = None
+                if status not in ('open', 'reopened') or rng.random() >= self.unassigned_fraction:
+                    assignee = pick_assignee()
+                ticket = {
+                    **ticket_defaults,
+                    'id': ticket_id,
+                    'title': rng.choice(TICKET_SUBJECTS.get(category.code, TICKET_SUBJECTS['other'])),
+                    'description': ' '.join(rng.sample(DESCRIPTION_SENTENCES, rng.randint(1, 4))),
+                    'created_by_id': pick_creator(),
+                    'assigned_to_id': assignee,
+                    'category_id': category.pk,
+                    'department_id': rng.choice(self.departments).pk,
+                    'status': status,
+                    'priority': pick_priority(),
+                    'created_at': created_at,
+                }
+                self.add_timeline(ticket)
+                ticket_comments = self.comment_rows(ticket, comment_defaults)
+                if ticket_comments:
+                    ticket['updated_at'] = max(ticket['updated_at'], ticket_comments[-1]['created_at'])
+                tickets.append(ticket)
+                comments.extend(ticket_comments)
+                documents.append({
+                    **document_defaults,
+                    'ticket_id': ticket_id,
+                    'title': ticket['title'],
+                    'description': ticket['description'],
+                })
+            self.number_tickets(tickets, prefixes)
+            self.write(Ticket, tickets)
+            self.write(Comment, comments)
+            self.write(TicketSearchDocument, documents)
+
+    def add_timeline(self, ticket):
+        """
+        Set the assignment, resolution and closing times that go with the
+        ticket's status, and updated_at to the latest of them.
+        """
+        rng = self.rng
+        created_at = ticket['created_at']
+        latest = created_at
+        if ticket['assigned_to_id']:
+            ticket['assigned_at'] = latest = min(self.now, created_at + timedelta(seconds=rng.expovariate(1 / 7200)))
+        if ticket['status'] in Ticket.RESOLVED_STATUSES:
+            # Resolution times are roughly log-normal around a day
+            hours = rng.lognormvariate(math.log(24), 1)
+            ticket['resolved_at'] = latest = min(self.now, latest + timedelta(hours=hours))
+            if ticket['status'] == 'closed':
+                ticket['closed_at'] = latest = min(self.now, latest + timedelta(seconds=rng.expovariate(1 / 172800)))
+        elif ticket['status'] != 'open':
+            latest = min(self.now, latest + timedelta(hours=rng.expovariate(1 / 24)))
+        ticket['updated_at'] = latest
+
+    def comment_rows(self, ticket, defaults):
+        rng = self.rng
+        if self.comments_per_ticket <= 0:
+            return []
+        # Geometric, so most tickets have a few comments and some have many
+        p = 1 / (1 + self.comments_per_ticket)
+        count = int(math.log(1 - rng.random()) / math.log(1 - p))
+        start = ticket['created_at']
+        end = max(ticket['updated_at'], min(self.now, start + timedelta(days=3)))
+        authors = [ticket['created_by_id'], ticket['assigned_to_id'] or ticket['created_by_id']]
+        times = sorted(start + (end - start) * rng.random() for _ in range(count))
+        return [
+            {
+                **defaults,
+                'ticket_id': ticket['id'],
+                'author_id': authors[position % 2],
+                'text': rng.choice(COMMENT_SENTENCES),
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+            for position, created_at in enumerate(times)
+        ]
+
+    def number_tickets(self, tickets, prefixes):
+        # One block per prefix for the whole batch, as backfill_ticket_ids does
+        by_prefix = {}
+        for ticket in tickets:
+            by_prefix.setdefault(prefixes.get(ticket['department_id']), []).append(ticket)
+        for prefix, prefix_tickets in by_prefix.items():
+            start = reserve_ticket_numbers(prefix, len(prefix_tickets))
+            for offset, ticket in enumerate(prefix_tickets):
+                ticket['ticket_id'] = format_ticket_number(prefix, start + offset)
+
+    def create_notifications(self):
+        rng = self.rng
+        recipients = {
+            user_id: self.NOTIFICATION_ROLE_WEIGHTS[role]
+            for role, user_ids in self.users_by_role.items()
+            for user_id in user_ids
+        }
+        count = round(self.user_count * self.notifications_per_user)
+        if not count or not recipients:
+            return
+        pick_recipient = weighted_picker(rng, recipients)
+        subjects = [subject for category_subjects in TICKET_SUBJECTS.values() for subject in category_subjects]
+        # reverse() per row would dominate the run time
+        link = reverse('ticket_detail', kwargs={'pk': 987654321}).replace('987654321', '{}')
+        defaults = field_defaults(Notification)
+        unread = Counter()
+
+        for batch in self.batches(count):
+            notifications = []
+            for index in batch:
+                user_id = pick_recipient()
+                title, message = rng.choice(NOTIFICATION_TEMPLATES)
+                read = rng.random() < self.read_fraction
+                if not read:
+                    unread[user_id] += 1
+                ticket_id = rng.choice(self.ticket_ids) if self.ticket_ids else None
+                notifications.append({
+                    **defaults,
+                    'user_id': user_id,
+                    'title': title,
+                    'message': message.format(title=rng.choice(subjects)),
+                    'link': link.format(ticket_id) if ticket_id else None,
+                    'read': read,
+                    'created_at': self.timestamp(index, count),
+                })
+            self.write(Notification, notifications)
+
+        counts = [{'user_id': user_id, 'count': unread[user_id], 'last_read_at': None} for user_id in sorted(unread)]
+        for batch in self.batches(len(counts)):
+            self.write(UnreadNotificationCount, counts[batch.start:batch.stop])
+
+    def rebuild_derived(self):
+        # Explicit ids leave the PostgreSQL sequences behind
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Ticket]):
+                cursor.execute(sql)
+        started = time.perf_counter()
+        counters = rebuild_counters()
+        rollups = rebuild_rollups()
+        self.log(f'Rebuilt {counters} ticket counters and {rollups} rollup rows in {time.perf_counter() - started:.1f}s')
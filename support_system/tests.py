@@ -0,0 +1,222 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import UserProfile
+from notifications.models import Notification, UnreadNotificationCount
+from tickets.counters import counter_drift
+from tickets.models import Comment, Ticket, TicketSearchDocument
+
+from .metrics import ARCHIVE_FILE, Registry, metrics_view, read_store_file, write_store_file
+from .profiling import MEMORY_PROFILE_LOCK, list_profiles
+from .query_instrumentation import statement_signature
+from .synthetic import SyntheticDataGenerator
+
+
+@override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=1.0, SQL_INSTRUMENTATION_SERVER_TIMING=True)
+class QueryInstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'password')
+        UserProfile.objects.filter(user=cls.admin).update(role='admin')
+        cls.client_user = User.objects.create_user('client', 'client@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client.get('/api/tickets/')
+
+    def test_server_timing_is_only_sent_to_admins(self):
+        response = self.get(self.admin)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", db-slowest;dur=')
+        self.assertFalse(self.get(self.client_user).has_header('Server-Timing'))
+        self.assertFalse(self.get().has_header('Server-Timing'))
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_is_sent_to_everyone_with_debug_on(self):
+        self.assertTrue(self.get(self.client_user).has_header('Server-Timing'))
+
+    @override_settings(SQL_INSTRUMENTATION_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('support_system.query_instrumentation', 'WARNING') as logs:
+            self.get(self.client_user)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['event'], entry['path'], entry['status']), ('slow_request', '/api/tickets/', 200))
+        self.assertGreater(entry['queries'], 0)
+        self.assertTrue(entry['slowest'])
+
+    def test_statement_signature_ignores_the_length_of_in_lists(self):
+        self.assertEqual(
+            statement_signature('SELECT 1 FROM t WHERE id IN (%s, %s, %s)'),
+            statement_signature('SELECT 1 FROM t WHERE id IN (%s, %s)'),
+        )
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(METRICS_DIR=self.directory, METRICS_FLUSH_INTERVAL=0))
+        self.registry = Registry()
+        self.requests = self.registry.counter('requests_total', 'Requests', ['view'])
+        self.durations = self.registry.histogram('duration_seconds', 'Durations', buckets=(0.1, 1))
+
+    def write_process_file(self, pid, requests):
+        write_store_file(self.directory / f'{pid}.json', {'requests_total': [[['home'], requests]]})
+
+    def test_values_of_all_processes_are_added_up(self):
+        self.requests.inc(view='home')
+        self.durations.observe(0.5)
+        self.durations.observe(3)
+        # A live process (our parent) and one that has exited
+        self.write_process_file(os.getppid(), 2)
+        self.write_process_file(999999999, 4)
+
+        output = self.registry.render()
+        self.assertIn('requests_total{view="home"} 7', output)
+        self.assertIn('duration_seconds_bucket{le="1.0"} 1', output)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 2', output)
+        self.assertIn('duration_seconds_count 2', output)
+
+        # The exited process's values moved to the archive and still count
+        self.assertFalse((self.directory / '999999999.json').exists())
+        self.assertTrue((self.directory / ARCHIVE_FILE).exists())
+        self.assertIn('requests_total{view="home"} 7', self.registry.render())
+
+    def test_values_are_written_in_the_background(self):
+        self.requests.inc(view='home')
+        path = self.directory / f'{os.getpid()}.json'
+        for _ in range(100):
+            if path.exists():
+                break
+            time.sleep(0.01)
+        self.assertEqual(read_store_file(path), {'requests_total': [[['home'], 1]]})
+
+    def test_access(self):
+        factory = RequestFactory()
+        local = factory.get('/metrics', REMOTE_ADDR='127.0.0.1')
+        with override_settings(METRICS_TOKEN=None, DEBUG=False):
+            self.assertEqual(metrics_view(local).status_code, 403)
+        with override_settings(METRICS_TOKEN=None, DEBUG=True):
+            self.assertEqual(metrics_view(local).status_code, 200)
+            self.assertEqual(metrics_view(factory.get('/metrics', REMOTE_ADDR='10.0.0.1')).status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(metrics_view(local).status_code, 403)
+            response = metrics_view(factory.get('/metrics', HTTP_AUTHORIZATION='Bearer secret'))
+            self.assertEqual(response.status_code, 200)
+
+
+class SyntheticDataTests(TestCase):
+    def generate(self, **options):
+        options = {
+            'users': 20, 'admins': 2, 'tickets': 30, 'notifications_per_user': 3, 'batch_size': 7, 'seed': 1, **options,
+        }
+        return SyntheticDataGenerator(**options).run()
+
+    def test_generated_data_is_consistent(self):
+        written = self.generate()
+        labels = ('auth.User', 'accounts.UserProfile', 'tickets.Ticket', 'notifications.Notification')
+        self.assertEqual([written[label] for label in labels], [20, 20, 30, 60])
+        self.assertEqual(UserProfile.objects.filter(role='admin').count(), 2)
+        self.assertFalse(User.objects.filter(notification_preferences=None).exists())
+        self.assertFalse(Ticket.objects.filter(ticket_id=None).exists())
+        self.assertEqual(TicketSearchDocument.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), written['tickets.Comment'])
+        self.assertEqual(counter_drift(), {})
+        for user_id, count in UnreadNotificationCount.objects.values_list('user_id', 'count'):
+            self.assertEqual(count, Notification.objects.filter(user_id=user_id, read=False).count())
+
+        # New rows get ids after the generated ones
+        generated = max(User.objects.values_list('pk', flat=True))
+        self.assertGreater(User.objects.create_user('agent').pk, generated)
+
+    def test_the_same_seed_gives_the_same_data(self):
+        def tickets(prefix):
+            return list(
+                Ticket.objects.filter(created_by__username__startswith=prefix)
+                .order_by('pk').values_list('title', 'description', 'status', 'priority', 'created_at')
+            )
+
+        now = timezone.now()
+        self.generate(prefix='first', now=now)
+        self.generate(prefix='second', now=now)
+        self.assertEqual(tickets('first-'), tickets('second-'))
+        self.generate(prefix='third', now=now, seed=2)
+        self.assertNotEqual(tickets('first-'), tickets('third-'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_synthetic_data', users=5, tickets=5, notifications_per_user=1, stdout=out)
+        self.assertIn('Successfully generated', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', read_fraction=2, stdout=out)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'password')
+        UserProfile.objects.filter(user=cls.admin).update(role='admin')
+        cls.client_user = User.objects.create_user('client', 'client@example.com', 'password')
+
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+        cache.clear()
+
+    def get(self, user=None, **extra):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client.get('/api/tickets/', **extra)
+
+    def test_only_admins_can_ask_for_a_profile(self):
+        response = self.get(self.admin, data={'profile': 'cpu,memory'})
+        self.assertEqual(response.status_code, 200)
+        directory = self.directory / response['X-Profile-Id']
+        files = sorted(path.name for path in directory.iterdir())
+        self.assertEqual(files, ['cpu.collapsed', 'cpu.pstats', 'memory.json', 'meta.json'])
+        meta = json.loads((directory / 'meta.json').read_text())
+        self.assertEqual((meta['user'], meta['modes'], meta['view']), ('admin', ['cpu', 'memory'], 'ticket-list'))
+
+        self.assertIn('X-Profile-Id', self.get(self.admin, HTTP_X_PROFILE='cpu'))
+        self.assertNotIn('X-Profile-Id', self.get(self.client_user, data={'profile': 'cpu'}))
+        self.assertNotIn('X-Profile-Id', self.get(data={'profile': 'cpu'}))
+        self.assertEqual(len(list_profiles()), 2)
+
+    def test_one_request_at_a_time_is_memory_profiled(self):
+        with MEMORY_PROFILE_LOCK:
+            response = self.get(self.admin, data={'profile': 'memory'})
+        meta = json.loads((self.directory / response['X-Profile-Id'] / 'meta.json').read_text())
+        self.assertEqual((meta['modes'], meta['skipped']), ([], ['memory']))
+        self.assertFalse((self.directory / response['X-Profile-Id'] / 'memory.json').exists())
+        # The lock was left to its holder
+        self.assertTrue(MEMORY_PROFILE_LOCK.acquire(blocking=False))
+        MEMORY_PROFILE_LOCK.release()
+
+    def test_command(self):
+        profile_id = self.get(self.admin, data={'profile': 'cpu,memory'})['X-Profile-Id']
+        out = StringIO()
+        call_command('request_profiles', stdout=out)
+        self.assertIn(profile_id, out.getvalue())
+        out = StringIO()
+        call_command('request_profiles', show='latest', stdout=out)
+        self.assertIn('Functions by cumulative', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('request_profiles', show='../etc', stdout=out)
+        call_command('request_profiles', delete_older_than=0, stdout=out)
+        self.assertEqual(list_profiles(), [])
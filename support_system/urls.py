@@ -21,6 +21,8 @@ from django.conf.urls.static import static
 from rest_framework.documentation import include_docs_urls
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from .metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -35,6 +37,9 @@ path('notifications/', include('notifications.urls')),  # Include notifications
 
     # Swagger UI:
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve static files during development
@@ -19,9 +19,9 @@ class CommentInline(admin.TabularInline):
 
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_by', 'assigned_to', 'category', 'department', 'status', 'priority', 'created_at', 'updated_at')
+    list_display = ('ticket_id', 'title', 'created_by', 'assigned_to', 'category', 'department', 'status', 'priority', 'created_at', 'updated_at')
     list_filter = ('status', 'priority', 'category', 'department')
-    search_fields = ('title', 'description', 'created_by__username', 'assigned_to__username')
+    search_fields = ('=ticket_id', 'title', 'description', 'created_by__username', 'assigned_to__username')
     ordering = ('-created_at',)
     inlines = [CommentInline]
 
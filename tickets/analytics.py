@@ -0,0 +1,229 @@
+"""
+Time-bucketed ticket analytics.
+
+Ticket saves record events (see Ticket.stamp_transitions) into two rollup
+tables instead of reports scanning the tickets table:
+
+- TicketActivityRollup: tickets opened and resolved per department, in
+  hourly and daily buckets.
+- ResolutionTimeRollup: daily histograms of time-to-resolution per agent
+  and per category, with logarithmic bins so p50/p90 over any date range
+  come from summing the bins.
+
+Rollups are an event history: deleting or reassigning a ticket later does
+not rewrite past buckets. ``manage.py rebuild_ticket_rollups`` recomputes
+them from the tickets' current transition timestamps.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .counters import NONE, increment_rows
+from .models import ResolutionTimeRollup, Ticket, TicketActivityRollup
+
+GRANULARITIES = ('hour', 'day')
+
+# Each histogram bin is 10% wider than the one before it, so a percentile
+# read from the bins is within about 5% of the exact value.
+BIN_GROWTH = 1.1
+
+ACTIVITY_KEY = ('granularity', 'bucket_start', 'department_key')
+RESOLUTION_KEY = ('dimension', 'bucket_start', 'key', 'bin')
+
+
+def bucket_start(value, granularity):
+    """
+    Return the start of the hour or day (in the local TIME_ZONE) that
+    ``value`` falls into.
+    """
+    local = timezone.localtime(value)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    return timezone.make_aware(datetime.combine(local.date(), time.min))
+
+
+def next_bucket(bucket, granularity):
+    if granularity == 'hour':
+        return timezone.localtime(bucket + timedelta(hours=1))
+    day = timezone.localtime(bucket).date() + timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def resolution_bin(seconds):
+    """
+    Bin 0 holds durations under a second; bin n covers
+    [BIN_GROWTH ** (n - 1), BIN_GROWTH ** n) seconds.
+    """
+    if seconds < 1:
+        return 0
+    return 1 + int(math.log(seconds) / math.log(BIN_GROWTH))
+
+
+def bin_value(index):
+    """
+    Representative duration in seconds of a bin (the geometric middle of
+    its bounds).
+    """
+    if index == 0:
+        return 0.0
+    return BIN_GROWTH ** (index - 0.5)
+
+
+def event_rows(events, created_at, resolved_at, department, agent, category):
+    """
+    Return the ``(activity, resolutions)`` increments for a ticket's events
+    as ``{key: [opened, resolved]}`` and ``{key: count}``.
+    """
+    activity = defaultdict(lambda: [0, 0])
+    resolutions = Counter()
+    department = department or NONE
+    if 'opened' in events:
+        for granularity in GRANULARITIES:
+            activity[(granularity, bucket_start(created_at, granularity), department)][0] += 1
+    if 'resolved' in events and resolved_at:
+        for granularity in GRANULARITIES:
+            activity[(granularity, bucket_start(resolved_at, granularity), department)][1] += 1
+        day = bucket_start(resolved_at, 'day')
+        index = resolution_bin((resolved_at - created_at).total_seconds())
+        resolutions[('agent', day, agent or NONE, index)] += 1
+        resolutions[('category', day, category or NONE, index)] += 1
+    return activity, resolutions
+
+
+def record_ticket_events(ticket, events):
+    """
+    Add a saved ticket's events ('opened', 'resolved') to the rollups.
+    """
+    record_events([(ticket, events)])
+
+
+def record_events(ticket_events):
+    """
+    Add the events of several saved tickets, ``[(ticket, events)]``, to the
+    rollups with one statement per table.
+    """
+    activity = defaultdict(lambda: [0, 0])
+    resolutions = Counter()
+    for ticket, events in ticket_events:
+        ticket_activity, ticket_resolutions = event_rows(
+            events, ticket.created_at, ticket.resolved_at,
+            ticket.department_id, ticket.assigned_to_id, ticket.category_id,
+        )
+        for key, (opened, resolved) in ticket_activity.items():
+            activity[key][0] += opened
+            activity[key][1] += resolved
+        resolutions.update(ticket_resolutions)
+    increment_rows(
+        TicketActivityRollup, ACTIVITY_KEY, ('opened', 'resolved'),
+        [(key, tuple(values)) for key, values in activity.items()],
+    )
+    increment_rows(
+        ResolutionTimeRollup, RESOLUTION_KEY, ('count',),
+        [(key, (count,)) for key, count in resolutions.items()],
+    )
+
+
+def activity_series(granularity, start, end, department=None):
+    """
+    Return ``[(bucket_start, opened, resolved)]`` for every bucket between
+    ``start`` and ``end``, including empty ones.
+    """
+    first = bucket_start(start, granularity)
+    rows = TicketActivityRollup.objects.filter(
+        granularity=granularity, bucket_start__gte=first, bucket_start__lt=end,
+    )
+    if department is not None:
+        rows = rows.filter(department_key=department)
+    totals = {
+        row['bucket_start']: row
+        for row in rows.values('bucket_start').annotate(
+            total_opened=Sum('opened'), total_resolved=Sum('resolved'),
+        ).order_by()
+    }
+
+    series = []
+    bucket = first
+    while bucket < end:
+        row = totals.get(bucket)
+        if row:
+            series.append((bucket, row['total_opened'], row['total_resolved']))
+        else:
+            series.append((bucket, 0, 0))
+        bucket = next_bucket(bucket, granularity)
+    return series
+
+
+def resolution_percentiles(dimension, start, end, percentiles=(50, 90)):
+    """
+    Return ``{key: (resolved, {percentile: seconds})}`` for the tickets
+    resolved between ``start`` and ``end`` grouped by agent or category.
+    """
+    rows = ResolutionTimeRollup.objects.filter(
+        dimension=dimension, bucket_start__gte=bucket_start(start, 'day'), bucket_start__lt=end,
+    ).values('key', 'bin').annotate(total=Sum('count')).order_by('key', 'bin')
+
+    histograms = defaultdict(list)
+    for row in rows:
+        histograms[row['key']].append((row['bin'], row['total']))
+
+    results = {}
+    for key, bins in histograms.items():
+        resolved = sum(count for _, count in bins)
+        if not resolved:
+            continue
+        values = {}
+        for percentile in percentiles:
+            # Nearest-rank percentile over the histogram
+            rank = max(1, math.ceil(resolved * percentile / 100))
+            seen = 0
+            for index, count in bins:
+                seen += count
+                if seen >= rank:
+                    values[percentile] = bin_value(index)
+                    break
+        results[key] = (resolved, values)
+    return results
+
+
+def rebuild_rollups():
+    """
+    Replace both rollup tables with values computed from the tickets'
+    created_at and resolved_at. Returns the number of rows written.
+    """
+    activity = defaultdict(lambda: [0, 0])
+    resolutions = Counter()
+    tickets = Ticket.objects.values(
+        'created_at', 'resolved_at', 'department_id', 'assigned_to_id', 'category_id',
+    ).order_by().iterator(chunk_size=2000)
+    for ticket in tickets:
+        ticket_activity, ticket_resolutions = event_rows(
+            {'opened', 'resolved'}, ticket['created_at'], ticket['resolved_at'],
+            ticket['department_id'], ticket['assigned_to_id'], ticket['category_id'],
+        )
+        for key, (opened, resolved) in ticket_activity.items():
+            activity[key][0] += opened
+            activity[key][1] += resolved
+        resolutions.update(ticket_resolutions)
+
+    with transaction.atomic():
+        TicketActivityRollup.objects.all().delete()
+        ResolutionTimeRollup.objects.all().delete()
+        TicketActivityRollup.objects.bulk_create(
+            [
+                TicketActivityRollup(**dict(zip(ACTIVITY_KEY, key)), opened=opened, resolved=resolved)
+                for key, (opened, resolved) in activity.items()
+            ],
+            batch_size=1000,
+        )
+        ResolutionTimeRollup.objects.bulk_create(
+            [
+                ResolutionTimeRollup(**dict(zip(RESOLUTION_KEY, key)), count=count)
+                for key, count in resolutions.items()
+            ],
+            batch_size=1000,
+        )
+    return len(activity) + len(resolutions)
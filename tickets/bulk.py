@@ -0,0 +1,193 @@
+"""
+Bulk ticket changes.
+
+Triage staff assign, re-prioritize or close hundreds of tickets at a time.
+apply_bulk_change makes one change to a set of tickets with the effects of
+saving each of them (transition timestamps, dashboard counters, analytics
+rollups, status change notifications and emails, metrics) in a fixed
+number of statements, however many tickets there are: one
+``SELECT ... FOR UPDATE`` of the tickets, one UPDATE per combination of
+stamped timestamps, one counter upsert, one upsert per rollup table and
+bulk inserts for notifications and emails.
+
+The updates bypass the Ticket signals, so whatever the Ticket save
+receivers do for status, priority or assignee changes has to be done here
+as well. Title and description don't change, so the search documents stay
+as they are.
+
+Status change notifications are consolidated per recipient: a user with
+several changed tickets gets one notification and one email listing them
+instead of one per ticket.
+"""
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from notifications.email_utils import send_ticket_updates_notification
+from notifications.models import Notification
+from notifications.unread import adjust_unread_counts
+from support_system.metrics import NOTIFICATION_FANOUT, TICKET_STATUS_TRANSITIONS
+
+from . import analytics, counters
+from .models import Ticket
+from .search import filter_tickets
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+
+# Position of the status in a counter state
+STATUS = Ticket.COUNTER_FIELDS.index('status')
+
+# Ticket titles named in a notification about several tickets
+LISTED_TITLES = 5
+
+
+class BulkChangeError(ValueError):
+    pass
+
+
+def get_max_tickets():
+    return getattr(settings, 'TICKET_BULK_MAX_TICKETS', 1000)
+
+
+def filter_bulk_tickets(queryset, criteria):
+    """
+    Restrict a Ticket queryset by the ``filter`` of a bulk change: field
+    values (``status``, ``priority``, ``assigned_to_id``, ``department_id``,
+    ``category_id``, None matching unset ones) and an optional full-text
+    ``search``.
+    """
+    criteria = dict(criteria)
+    search = criteria.pop('search', None)
+    queryset = queryset.filter(**criteria)
+    if search:
+        queryset = filter_tickets(queryset, search)
+    return queryset
+
+
+def apply_bulk_change(tickets, changes, user):
+    """
+    Apply ``changes`` (``status``, ``priority`` and/or ``assigned_to``, a
+    User or None) to the tickets of the ``tickets`` queryset on behalf of
+    ``user``. Returns ``{pk: UPDATED or UNCHANGED}`` in pk order.
+
+    Raises BulkChangeError, before changing anything, when the queryset
+    holds more than TICKET_BULK_MAX_TICKETS tickets.
+    """
+    max_tickets = get_max_tickets()
+    now = timezone.now()
+    results = {}
+    updated = []
+    with transaction.atomic():
+        locked = list(
+            tickets.select_related(
+                'created_by__notification_preferences', 'assigned_to__notification_preferences',
+                'category', 'department',
+            ).select_for_update(of=('self',)).order_by('pk')[:max_tickets + 1]
+        )
+        if len(locked) > max_tickets:
+            raise BulkChangeError(f'At most {max_tickets} tickets can be changed at once.')
+
+        # Tickets by the timestamps the change stamps on them, one UPDATE each
+        groups = defaultdict(list)
+        for ticket in locked:
+            old_state = counters.ticket_state(ticket)
+            for field, value in changes.items():
+                setattr(ticket, field, value)
+            new_state = counters.ticket_state(ticket)
+            if new_state == old_state:
+                results[ticket.pk] = UNCHANGED
+                continue
+            stamped = ticket.stamp_transitions(old_state, set(changes), now=now)
+            ticket.updated_at = now
+            groups[tuple((field, getattr(ticket, field)) for field in stamped)].append(ticket.pk)
+            updated.append((ticket, old_state, new_state))
+            results[ticket.pk] = UPDATED
+        if not updated:
+            return results
+
+        for stamps, pks in groups.items():
+            Ticket.objects.filter(pk__in=pks).update(**changes, **dict(stamps), updated_at=now)
+
+        deltas = Counter()
+        for ticket, old_state, new_state in updated:
+            deltas.update(counters.ticket_deltas(old_state, new_state))
+        counters.apply_deltas(deltas)
+        analytics.record_events([(ticket, ticket._transitions) for ticket, _, _ in updated if ticket._transitions])
+
+        status_changes = [
+            (ticket, old_state[STATUS]) for ticket, old_state, new_state in updated
+            if old_state[STATUS] != new_state[STATUS]
+        ]
+        if status_changes:
+            record_status_changes(status_changes, user)
+    return results
+
+
+def record_status_changes(status_changes, user):
+    """
+    Notify the creators and assignees of the tickets whose status changed,
+    ``[(ticket, previous_status)]``, and count the transitions once they
+    commit.
+    """
+    status_names = dict(Ticket.STATUS_CHOICES)
+    updates = [(ticket, status_names.get(previous, previous)) for ticket, previous in status_changes]
+    send_ticket_updates_notification(updates)
+    notify_status_changes(updates, user)
+
+    transitions = Counter((previous, ticket.status) for ticket, previous in status_changes)
+
+    def count_transitions():
+        for (previous, status), count in transitions.items():
+            TICKET_STATUS_TRANSITIONS.inc(count, from_status=previous, to_status=status)
+
+    transaction.on_commit(count_transitions)
+
+
+def notify_status_changes(updates, user):
+    """
+    Create one in-app notification per recipient for the status changes
+    ``[(ticket, previous_status_display)]``: the ticket creators and, unless
+    they made the change, the assignees.
+    """
+    # user id -> {ticket pk: (ticket, previous_status_display, is_creator)}
+    recipients = defaultdict(dict)
+    for ticket, previous in updates:
+        recipients[ticket.created_by_id][ticket.pk] = (ticket, previous, True)
+        if ticket.assigned_to_id and ticket.assigned_to_id != user.pk:
+            recipients[ticket.assigned_to_id].setdefault(ticket.pk, (ticket, previous, False))
+
+    notifications = []
+    for user_id, tickets in recipients.items():
+        if len(tickets) == 1:
+            ticket, previous, is_creator = next(iter(tickets.values()))
+            subject = 'Your ticket' if is_creator else 'Ticket'
+            notifications.append(Notification(
+                user_id=user_id,
+                title='Ticket Status Updated',
+                message=f'{subject} "{ticket.title}" status has been changed from {previous} to {ticket.get_status_display()}.',
+                link=reverse('ticket_detail', kwargs={'pk': ticket.pk}),
+            ))
+            continue
+        titles = [f'"{ticket.title}"' for ticket, _, _ in tickets.values()]
+        listed = ', '.join(titles[:LISTED_TITLES])
+        if len(titles) > LISTED_TITLES:
+            listed += f' and {len(titles) - LISTED_TITLES} more'
+        new_status = next(iter(tickets.values()))[0].get_status_display()
+        notifications.append(Notification(
+            user_id=user_id,
+            title='Tickets Status Updated',
+            message=f'The status of {len(tickets)} tickets has been changed to {new_status}: {listed}.',
+            link=reverse('ticket_list'),
+        ))
+
+    Notification.objects.bulk_create(notifications)
+    adjust_unread_counts({notification.user_id: 1 for notification in notifications})
+    # Counted once the notifications commit, like the transitions
+    transaction.on_commit(partial(NOTIFICATION_FANOUT.observe, len(notifications), event='ticket_bulk_update'))
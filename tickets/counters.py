@@ -0,0 +1,268 @@
+"""
+Incrementally maintained ticket counts (see TicketCounter).
+
+Every ticket contributes to three rollup rows:
+
+- (status, priority, department, category, ANY, ANY) for the admin dashboard
+- (status, ANY, ANY, ANY, assignee, ANY) for support staff and the
+  unassigned pool (assignee NONE)
+- (status, ANY, ANY, ANY, ANY, creator) for clients
+
+so each dashboard reads its numbers with a single query on a leading prefix
+of the counter table's unique index. The admin dashboard's other numbers
+(users, departments, categories) are cached by get_dashboard_lookups. Writes are additive upserts into a
+random shard, applied in the same transaction as the ticket change.
+Deleting an assignee, category or department clears the reference with an
+UPDATE that sends no Ticket signals, so tickets/signals.py moves those
+tickets to the "not set" counters before the delete.
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import Category, Department, Ticket, TicketCounter
+
+ANY = -1
+ANY_CHOICE = '*'
+NONE = 0
+
+DIMENSIONS = ('status', 'priority', 'department_key', 'category_key', 'assignee_key', 'creator_key')
+
+DASHBOARD_LOOKUPS_CACHE_KEY = 'tickets:dashboard-lookups'
+
+
+def get_shard_count():
+    return getattr(settings, 'TICKET_COUNTER_SHARDS', 8)
+
+
+def ticket_state(ticket):
+    """
+    Return the ticket's counter fields (Ticket.COUNTER_FIELDS) as currently
+    held in memory.
+    """
+    return tuple(getattr(ticket, field) for field in Ticket.COUNTER_FIELDS)
+
+
+def state_dimensions(state):
+    status, priority, *keys = state
+    return (status, priority, *(key or NONE for key in keys))
+
+
+def rollup_keys(dimensions):
+    status, priority, department, category, assignee, creator = dimensions
+    return [
+        (status, priority, department, category, ANY, ANY),
+        (status, ANY_CHOICE, ANY, ANY, assignee, ANY),
+        (status, ANY_CHOICE, ANY, ANY, ANY, creator),
+    ]
+
+
+def ticket_deltas(old_state=None, new_state=None):
+    """
+    Return the counter deltas ``{key: delta}`` that move a ticket's
+    contribution from ``old_state`` to ``new_state``.
+    """
+    deltas = Counter()
+    if old_state is not None:
+        for key in rollup_keys(state_dimensions(old_state)):
+            deltas[key] -= 1
+    if new_state is not None:
+        for key in rollup_keys(state_dimensions(new_state)):
+            deltas[key] += 1
+    return deltas
+
+
+def record_ticket_change(old_state=None, new_state=None):
+    """
+    Move a ticket's contribution from ``old_state`` to ``new_state`` (tuples
+    of Ticket.COUNTER_FIELDS). Pass only new for a create, only old for a
+    delete.
+    """
+    apply_deltas(ticket_deltas(old_state, new_state))
+
+
+def record_cleared_field(tickets, field):
+    """
+    Move the tickets of the ``tickets`` queryset to the counters with
+    ``field`` (one of Ticket.COUNTER_FIELDS) unset. Call it before deleting
+    the object they refer to: SET_NULL clears the field with an UPDATE that
+    sends no Ticket signals.
+    """
+    index = Ticket.COUNTER_FIELDS.index(field)
+    deltas = Counter()
+    states = tickets.select_for_update().order_by('pk').values_list(*Ticket.COUNTER_FIELDS)
+    for old_state in states.iterator():
+        new_state = old_state[:index] + (None,) + old_state[index + 1:]
+        deltas.update(ticket_deltas(old_state, new_state))
+    apply_deltas(deltas)
+
+
+def apply_deltas(deltas, shard=None):
+    """
+    Add ``{key: delta}`` to the counters with one upsert statement.
+    """
+    if shard is None:
+        shard = random.randrange(get_shard_count())
+    rows = [(key + (shard,), (delta,)) for key, delta in deltas.items() if delta]
+    increment_rows(TicketCounter, DIMENSIONS + ('shard',), ('count',), rows)
+
+
+def increment_rows(model, key_fields, value_fields, rows):
+    """
+    Add ``rows`` of ``(key, values)`` to ``model`` with one
+    ``INSERT ... ON CONFLICT DO UPDATE`` statement. ``key_fields`` must be
+    covered by a unique constraint; missing rows are created with the values.
+    """
+    rows = sorted(rows)
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in key_fields + value_fields]
+    key_columns = [field.column for field in fields[:len(key_fields)]]
+    value_columns = [field.column for field in fields[len(key_fields):]]
+    columns = key_columns + value_columns
+    placeholders = ', '.join(['(%s)' % ', '.join(['%s'] * len(columns))] * len(rows))
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in value_columns)
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders} '
+        f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET {updates}'
+    )
+    params = []
+    # Rows are sorted by key so concurrent writers lock them in the same order
+    for key, values in rows:
+        params.extend(
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, tuple(key) + tuple(values))
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+class TicketCounts:
+    """
+    Counter rows summed over their shards, with helpers to add them up.
+    """
+    def __init__(self, queryset):
+        self.rows = list(queryset.values(*DIMENSIONS).annotate(total=Sum('count')).order_by())
+
+    def count(self, **match):
+        """
+        Sum the rows whose dimensions match. Values may be a single value or
+        a list/tuple/set of accepted values.
+        """
+        return sum(row['total'] for row in self.rows if self._matches(row, match))
+
+    def group_by(self, dimension, **match):
+        totals = Counter()
+        for row in self.rows:
+            if self._matches(row, match):
+                totals[row[dimension]] += row['total']
+        return dict(totals)
+
+    def _matches(self, row, match):
+        for field, value in match.items():
+            if isinstance(value, (list, tuple, set)):
+                if row[field] not in value:
+                    return False
+            elif row[field] != value:
+                return False
+        return True
+
+    @classmethod
+    def for_admin(cls):
+        # The full rollup (assignee ANY) plus the unassigned pool (NONE)
+        return cls(TicketCounter.objects.filter(creator_key=ANY, assignee_key__in=[ANY, NONE]))
+
+    @classmethod
+    def for_assignee(cls, user):
+        # The user's own tickets plus the unassigned pool
+        return cls(TicketCounter.objects.filter(creator_key=ANY, assignee_key__in=[user.pk, NONE]))
+
+    @classmethod
+    def for_creator(cls, user):
+        return cls(TicketCounter.objects.filter(creator_key=user.pk))
+
+
+def get_dashboard_lookups():
+    """
+    Return ``{'total_users': int, 'departments': [...], 'categories':
+    [...]}`` for the admin dashboard, from the cache when possible.
+    """
+    lookups = cache.get(DASHBOARD_LOOKUPS_CACHE_KEY)
+    if lookups is None:
+        lookups = {
+            'total_users': User.objects.count(),
+            'departments': list(Department.objects.all()),
+            'categories': list(Category.objects.all()),
+        }
+        cache.set(DASHBOARD_LOOKUPS_CACHE_KEY, lookups, getattr(settings, 'DASHBOARD_LOOKUPS_CACHE_TIMEOUT', 300))
+    return lookups
+
+
+def invalidate_dashboard_lookups():
+    """
+    Drop the cached lookups once the current transaction commits.
+    """
+    transaction.on_commit(lambda: cache.delete(DASHBOARD_LOOKUPS_CACHE_KEY))
+
+
+def expected_counts():
+    """
+    Compute what the counter table should contain from the tickets table.
+    """
+    expected = Counter()
+    rows = Ticket.objects.values(*Ticket.COUNTER_FIELDS).annotate(n=Count('id')).order_by()
+    for row in rows:
+        state = tuple(row[field] for field in Ticket.COUNTER_FIELDS)
+        for key in rollup_keys(state_dimensions(state)):
+            expected[key] += row['n']
+    return expected
+
+
+def stored_counts():
+    stored = Counter()
+    for row in TicketCounter.objects.values(*DIMENSIONS).annotate(total=Sum('count')).order_by():
+        if row['total']:
+            stored[tuple(row[dimension] for dimension in DIMENSIONS)] += row['total']
+    return stored
+
+
+def counter_drift():
+    """
+    Return ``{key: (stored, expected)}`` for every key whose stored count is
+    wrong.
+    """
+    expected = expected_counts()
+    stored = stored_counts()
+    return {
+        key: (stored[key], expected[key])
+        for key in set(expected) | set(stored)
+        if stored[key] != expected[key]
+    }
+
+
+def rebuild_counters():
+    """
+    Replace the counter table with counts computed from the tickets table.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Hold off ticket writes so no change lands between the count
+            # and the swap
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE %s IN SHARE MODE' % connection.ops.quote_name(Ticket._meta.db_table))
+        TicketCounter.objects.all().delete()
+        expected = expected_counts()
+        TicketCounter.objects.bulk_create(
+            [
+                TicketCounter(**dict(zip(DIMENSIONS, key)), shard=0, count=count)
+                for key, count in expected.items()
+            ],
+            batch_size=1000,
+        )
+    return len(expected)
@@ -15,7 +15,7 @@ class TicketForm(forms.ModelForm):
         }
     
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        role = kwargs.pop('role', None)
         super().__init__(*args, **kwargs)
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-select' if isinstance(field.widget, forms.Select) else 'form-control'})
@@ -33,13 +33,13 @@ class TicketForm(forms.ModelForm):
                 self.fields['department'].initial = self.instance.department.code
         
         # Customize fields based on user role
-        if user and user.profile.role == 'client':
+        if role == 'client':
             # Clients can't set status or assigned_to
             if 'status' in self.fields:
                 self.fields.pop('status')
             if 'assigned_to' in self.fields:
                 self.fields.pop('assigned_to')
-        elif user and user.profile.role == 'support':
+        elif role == 'support':
             # Support can set status but not assigned_to
             if 'assigned_to' in self.fields:
                 self.fields.pop('assigned_to')
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tickets.models import Ticket
+from tickets.numbering import format_ticket_number, reserve_ticket_numbers, ticket_number_prefix
+
+
+class Command(BaseCommand):
+    help = (
+        'Numbers existing tickets that have no ticket_id yet. Works through the '
+        'table in primary key order, one short transaction per batch, so it '
+        'never holds long locks and can be stopped and re-run at any time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tickets numbered per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+
+        while True:
+            with transaction.atomic():
+                tickets = list(
+                    Ticket.objects.filter(pk__gt=last_pk, ticket_id__isnull=True)
+                    .select_related('department')
+                    .only('pk', 'ticket_id', 'department__code')
+                    .order_by('pk')[:batch_size]
+                )
+                if not tickets:
+                    break
+                last_pk = tickets[-1].pk
+
+                # Reserve one block per prefix for the whole batch
+                by_prefix = {}
+                for ticket in tickets:
+                    by_prefix.setdefault(ticket_number_prefix(ticket.department), []).append(ticket)
+                for prefix, prefix_tickets in by_prefix.items():
+                    start = reserve_ticket_numbers(prefix, len(prefix_tickets))
+                    for offset, ticket in enumerate(prefix_tickets):
+                        ticket.ticket_id = format_ticket_number(prefix, start + offset)
+
+                Ticket.objects.bulk_update(tickets, ['ticket_id'])
+
+            total += len(tickets)
+            self.stdout.write(f'Numbered {total} tickets (up to id {last_pk})')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully numbered {total} tickets'))
@@ -0,0 +1,116 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from support_system.benchmarks import (
+    ENDPOINTS, BenchmarkError, compare, data_sizes, get_benchmark_context, load_baseline, make_clients,
+    measure, save_baseline,
+)
+from support_system.synthetic import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the main API and page endpoints (time percentiles, SQL '
+        'queries and memory per request) against the busiest users in the '
+        'database and compares the results with the stored baseline for this '
+        'database vendor. Exits with an error when an endpoint regressed past '
+        'the tolerance. Runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first')
+        parser.add_argument('--memory-runs', type=int, default=3, help='Requests per endpoint traced for memory')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help='Only benchmark this endpoint (repeatable)')
+        parser.add_argument(
+            '--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'),
+            help='Baseline file',
+        )
+        parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative growth of p50 and p95 time')
+        parser.add_argument('--memory-tolerance', type=float, default=0.25, help='Allowed relative growth of memory')
+        parser.add_argument('--query-tolerance', type=int, default=0, help='Allowed extra queries per request')
+        parser.add_argument('--generate', action='store_true', help='Seed synthetic data first (rolled back with the rest)')
+        parser.add_argument('--users', type=int, default=500, help='Users to generate with --generate')
+        parser.add_argument('--tickets', type=int, default=5000, help='Tickets to generate with --generate')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for --generate')
+
+    def handle(self, *args, **options):
+        endpoints = ENDPOINTS
+        if options['endpoints']:
+            known = {endpoint.name for endpoint in ENDPOINTS}
+            unknown = set(options['endpoints']) - known
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}. Known: {", ".join(sorted(known))}')
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in options['endpoints']]
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        path = Path(options['baseline'])
+        vendor = connection.vendor
+        try:
+            baseline = load_baseline(path)
+            # The test client talks to 'testserver'
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+                if options['generate']:
+                    SyntheticDataGenerator(
+                        users=options['users'], tickets=options['tickets'], seed=options['seed'],
+                        log=self.stdout.write,
+                    ).run()
+                sizes = data_sizes()
+                users, context = get_benchmark_context()
+                context['username'] = users['client'].username
+                clients = make_clients(users)
+
+                results = {}
+                for endpoint in endpoints:
+                    results[endpoint.name] = measure(
+                        clients[endpoint.role], endpoint, context,
+                        options['iterations'], options['warmup'], options['memory_runs'],
+                    )
+                    self.stdout.write(self.format_result(endpoint.name, results[endpoint.name]))
+
+                transaction.set_rollback(True)
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        if options['update_baseline']:
+            save_baseline(path, baseline, vendor, results, sizes)
+            self.stdout.write(self.style.SUCCESS(f'Successfully stored the {vendor} baseline in {path}'))
+            return
+
+        recorded = baseline['databases'].get(vendor)
+        if recorded is None:
+            self.stdout.write(self.style.WARNING(f'No {vendor} baseline in {path}; record one with --update-baseline'))
+            return
+        if recorded['data'] != sizes:
+            self.stdout.write(self.style.WARNING(
+                f'The baseline was recorded on different data ({recorded["data"]}, now {sizes}); '
+                f'timings may not be comparable'
+            ))
+
+        failed = 0
+        for name, result in results.items():
+            expected = recorded['endpoints'].get(name)
+            if expected is None:
+                self.stdout.write(f'{name}: no baseline')
+                continue
+            regressions = compare(
+                result, expected, options['tolerance'], options['memory_tolerance'], options['query_tolerance'],
+            )
+            if regressions:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'{name} regressed: {"; ".join(regressions)}'))
+        if failed:
+            raise CommandError(f'{failed} of {len(results)} endpoints regressed against {path}')
+        self.stdout.write(self.style.SUCCESS(f'Successfully benchmarked {len(results)} endpoints within the baseline'))
+
+    def format_result(self, name, result):
+        return (
+            f'{name:<26} p50 {result["p50_ms"]:>8.2f} ms  p95 {result["p95_ms"]:>8.2f} ms  '
+            f'p99 {result["p99_ms"]:>8.2f} ms  {result["queries"]:>3} queries  {result["memory_kb"]:>9.1f} KiB'
+        )
@@ -0,0 +1,137 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from tickets.models import Ticket
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the role-based ticket queries with and without the ticket '
+        'visibility indexes on a synthetic table. Everything runs inside one '
+        'transaction that is rolled back, so no data or schema change is kept. '
+        'Run it against a development database: the index drops lock the table '
+        'until the rollback.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=200000, help='Number of synthetic tickets to create')
+        parser.add_argument('--users', type=int, default=500, help='Number of synthetic users to create')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            support, client = self.create_data(options['tickets'], options['users'])
+            self.analyze()
+
+            queries = self.get_queries(support, client)
+            with_indexes = self.run_queries(queries, options['repeat'])
+
+            for index in Ticket._meta.indexes:
+                with connection.cursor() as cursor:
+                    cursor.execute('DROP INDEX %s' % connection.ops.quote_name(index.name))
+            self.analyze()
+            without_indexes = self.run_queries(queries, options['repeat'])
+
+            for name in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(
+                    '  without indexes: %.2f ms   with indexes: %.2f ms'
+                    % (without_indexes[name][0], with_indexes[name][0])
+                )
+                self.stdout.write('  plan without indexes:')
+                for line in without_indexes[name][1].splitlines():
+                    self.stdout.write('    ' + line)
+                self.stdout.write('  plan with indexes:')
+                for line in with_indexes[name][1].splitlines():
+                    self.stdout.write('    ' + line)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, synthetic data rolled back'))
+
+    def create_data(self, ticket_count, user_count):
+        self.stdout.write(f'Creating {user_count} users and {ticket_count} tickets...')
+        prefix = 'bench-%d' % random.randint(0, 10 ** 9)
+        User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(user_count)])
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+        # A tenth of the users are support staff, the rest are clients
+        support_ids = user_ids[:max(1, user_count // 10)]
+        client_ids = user_ids[len(support_ids):] or support_ids
+
+        statuses = [choice for choice, _ in Ticket.STATUS_CHOICES]
+        priorities = [choice for choice, _ in Ticket.PRIORITY_CHOICES]
+        now = timezone.now()
+
+        # Spread the timestamps over a year: switch off auto_now(_add) while
+        # inserting so the generated values are kept.
+        timestamp_fields = [Ticket._meta.get_field('created_at'), Ticket._meta.get_field('updated_at')]
+        saved = [(field.auto_now, field.auto_now_add) for field in timestamp_fields]
+        for field in timestamp_fields:
+            field.auto_now = field.auto_now_add = False
+        try:
+            batch = []
+            for i in range(ticket_count):
+                created_at = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+                batch.append(Ticket(
+                    title=f'Synthetic ticket {i}',
+                    description='Synthetic ticket for the index benchmark',
+                    created_by_id=random.choice(client_ids),
+                    # Roughly a fifth of the tickets wait in the unassigned pool
+                    assigned_to_id=None if random.random() < 0.2 else random.choice(support_ids),
+                    status=random.choice(statuses),
+                    priority=random.choice(priorities),
+                    created_at=created_at,
+                    updated_at=created_at + timedelta(minutes=random.randint(0, 60 * 24 * 7)),
+                ))
+                if len(batch) == 5000:
+                    Ticket.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                Ticket.objects.bulk_create(batch)
+        finally:
+            for field, (auto_now, auto_now_add) in zip(timestamp_fields, saved):
+                field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+        return User.objects.get(pk=support_ids[0]), User.objects.get(pk=client_ids[0])
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE %s' % connection.ops.quote_name(Ticket._meta.db_table))
+
+    def get_queries(self, support, client):
+        tickets = Ticket.objects.all()
+        return {
+            'admin list (newest first)': tickets.order_by('-created_at', 'id')[:10],
+            'admin open count': tickets.filter(status='open').values('pk'),
+            'admin unassigned count': tickets.filter(assigned_to=None).values('pk'),
+            'support list (assigned or unassigned)': tickets.filter(
+                Q(assigned_to=support) | Q(assigned_to=None)
+            ).order_by('-created_at', 'id')[:10],
+            'support open assigned count': tickets.filter(assigned_to=support, status='open').values('pk'),
+            'support unassigned pool': tickets.filter(assigned_to=None).order_by('-created_at')[:10],
+            'client open count': tickets.filter(
+                created_by=client, status__in=['open', 'in_progress', 'pending']
+            ).values('pk'),
+            'client recently updated': tickets.filter(created_by=client).order_by('-updated_at')[:5],
+        }
+
+    def run_queries(self, queries, repeat):
+        results = {}
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = (timings[len(timings) // 2], queryset.explain())
+        return results
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from support_system.synthetic import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with synthetic users, tickets, comments and '
+        'notifications for load and scaling tests, from thousands up to tens '
+        'of millions of rows. The same options and --seed give the same data. '
+        'Run it against a development or staging database that nothing else '
+        'writes to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create')
+        parser.add_argument('--support-fraction', type=float, default=0.05, help='Share of the users that are support staff')
+        parser.add_argument('--admins', type=int, default=3, help='Admins among the users')
+        parser.add_argument('--tickets', type=int, default=10000, help='Tickets to create')
+        parser.add_argument('--comments-per-ticket', type=float, default=3.0, help='Average comments per ticket')
+        parser.add_argument('--notifications-per-user', type=float, default=20.0, help='Average notifications per user; admins get the most')
+        parser.add_argument('--unassigned-fraction', type=float, default=0.2, help='Share of open tickets left unassigned')
+        parser.add_argument('--assignee-skew', type=float, default=1.0, help='Zipf exponent of the ticket load per support user (0 spreads it evenly)')
+        parser.add_argument('--creator-skew', type=float, default=1.0, help='Zipf exponent of the tickets opened per client (0 spreads them evenly)')
+        parser.add_argument('--read-fraction', type=float, default=0.7, help='Share of notifications that are read')
+        parser.add_argument('--days', type=int, default=365, help='Spread tickets and notifications over this many days')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows generated and written per batch')
+        parser.add_argument('--prefix', default='synthetic', help='Prefix of the generated usernames')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk INSERTs even where COPY is available')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'tickets', 'admins'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} must not be negative')
+        for name in ('support_fraction', 'unassigned_fraction', 'read_fraction'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be between 0 and 1')
+        if options['batch_size'] < 1 or options['days'] < 1:
+            raise CommandError('--batch-size and --days must be at least 1')
+        if options['tickets'] and not options['users']:
+            raise CommandError('Tickets need --users')
+
+        generator = SyntheticDataGenerator(
+            users=options['users'],
+            support_fraction=options['support_fraction'],
+            admins=options['admins'],
+            tickets=options['tickets'],
+            comments_per_ticket=options['comments_per_ticket'],
+            notifications_per_user=options['notifications_per_user'],
+            unassigned_fraction=options['unassigned_fraction'],
+            assignee_skew=options['assignee_skew'],
+            creator_skew=options['creator_skew'],
+            read_fraction=options['read_fraction'],
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            use_copy=not options['no_copy'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(f'Writing with {"COPY" if generator.use_copy else "bulk INSERT"}')
+        written = generator.run()
+
+        for label, rows in written.items():
+            self.stdout.write(f'  {label}: {rows}')
+        self.stdout.write(self.style.SUCCESS(f'Successfully generated {sum(written.values())} rows'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tickets.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the ticket analytics rollups (opened/resolved per bucket '
+        'and resolution-time histograms) from the tickets table. Run it once '
+        'after upgrading to fill in the history of existing tickets. Only the '
+        'latest resolution of each ticket is known, so reopened tickets count '
+        'once.'
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {rows} rollup rows'))
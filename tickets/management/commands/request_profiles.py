@@ -0,0 +1,86 @@
+import io
+import json
+import pstats
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from support_system.profiling import delete_profiles, get_profile_directory, hottest_frames, list_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        'Lists the request profiles in PROFILING_DIR, newest first, or '
+        'summarizes one with --show: the most expensive functions of its CPU '
+        'profile, the hottest sampled frames and the largest allocation '
+        'sites. Admins record profiles with ?profile=cpu,memory or an '
+        'X-Profile header; see support_system/profiling.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Profiles to list')
+        parser.add_argument('--show', metavar='ID', help="Summarize this profile ('latest' for the newest)")
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'tottime', 'ncalls'], default='cumulative',
+            help='Order of the functions in --show',
+        )
+        parser.add_argument('--top', type=int, default=20, help='Functions, frames and allocation sites in --show')
+        parser.add_argument('--delete-older-than', type=int, metavar='DAYS', help='Delete profiles older than DAYS days')
+
+    def handle(self, *args, **options):
+        if options['delete_older_than'] is not None:
+            deleted = delete_profiles(timezone.now() - timedelta(days=options['delete_older_than']))
+            self.stdout.write(self.style.SUCCESS(f'Successfully deleted {deleted} profiles'))
+        elif options['show']:
+            self.show(options['show'], options['sort'], options['top'])
+        else:
+            self.list(options['limit'])
+
+    def list(self, limit):
+        profiles = list_profiles()
+        if not profiles:
+            self.stdout.write('No profiles')
+            return
+        for meta in profiles[:limit]:
+            self.stdout.write(
+                f"{meta['id']}  {meta['method']} {meta['path']}  {meta['status']}  "
+                f"{meta['duration_ms']}ms  {','.join(meta['modes'])}  {meta['user'] or '(sampled)'}"
+            )
+        if len(profiles) > limit:
+            self.stdout.write(f'... and {len(profiles) - limit} older profiles')
+
+    def show(self, profile_id, sort, top):
+        directory = get_profile_directory(profile_id)
+        if directory is None:
+            raise CommandError(f'No profile {profile_id}')
+        with open(directory / 'meta.json') as f:
+            meta = json.load(f)
+        self.stdout.write(f"{meta['method']} {meta['path']}")
+        self.stdout.write(
+            f"view {meta['view']}, status {meta['status']}, {meta['duration_ms']}ms, "
+            f"user {meta['user'] or '(sampled)'}, recorded {meta['created_at']}"
+        )
+        if meta.get('skipped'):
+            self.stdout.write(self.style.WARNING(
+                f"Not profiled for {', '.join(meta['skipped'])}: another request was being profiled for it"
+            ))
+
+        if (directory / 'cpu.pstats').exists():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\nFunctions by {sort}'))
+            output = io.StringIO()
+            stats = pstats.Stats(str(directory / 'cpu.pstats'), stream=output)
+            stats.strip_dirs().sort_stats(sort).print_stats(top)
+            self.stdout.write(output.getvalue().strip('\n'))
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\nHottest frames ({meta['samples']} samples)"))
+            for frame, samples in hottest_frames(directory / 'cpu.collapsed', top):
+                self.stdout.write(f'{samples:>7}  {frame}')
+            self.stdout.write(f"Flame graph: flamegraph.pl {directory / 'cpu.collapsed'} > flame.svg")
+
+        if (directory / 'memory.json').exists():
+            with open(directory / 'memory.json') as f:
+                memory = json.load(f)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\nAllocations (peak {memory['peak_kb']} KiB)"))
+            for site in memory['top'][:top]:
+                self.stdout.write(f"{site['size_kb']:>10} KiB {site['count']:>7} blocks  {site['site']}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.counters import DIMENSIONS, counter_drift, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Checks or rebuilds the dashboard ticket counters. Changes that skip '
+        'the model signals (queryset.update(), SET_NULL when a user, department '
+        'or category is deleted, raw SQL) are not reflected in the counters; '
+        'run --verify to find drift and --rebuild to fix it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Report counters that differ from the tickets table')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute all counters from the tickets table')
+
+    def handle(self, *args, **options):
+        if not options['verify'] and not options['rebuild']:
+            raise CommandError('Pass --verify and/or --rebuild')
+
+        if options['verify']:
+            drift = counter_drift()
+            for key, (stored, expected) in sorted(drift.items(), key=lambda item: str(item[0])):
+                label = ', '.join(f'{name}={value}' for name, value in zip(DIMENSIONS, key))
+                self.stdout.write(f'{label}: stored {stored}, expected {expected}')
+            if drift:
+                self.stdout.write(self.style.WARNING(f'{len(drift)} counters are out of date'))
+            else:
+                self.stdout.write(self.style.SUCCESS('All ticket counters are correct'))
+
+        if options['rebuild']:
+            rows = rebuild_counters()
+            self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {rows} ticket counters'))
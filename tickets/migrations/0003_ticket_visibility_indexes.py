@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+from support_system.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('tickets', '0002_alter_category_code_alter_department_code'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(fields=['-created_at', 'id'], name='ticket_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(fields=['assigned_to', 'status'], name='ticket_assignee_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(fields=['created_by', 'status', 'updated_at'], name='ticket_creator_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(fields=['created_by', 'updated_at'], name='ticket_creator_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('assigned_to__isnull', True)), fields=['-created_at'], name='ticket_unassigned_idx'),
+        ),
+    ]
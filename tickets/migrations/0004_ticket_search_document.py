@@ -0,0 +1,164 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENT_TABLE = 'tickets_ticketsearchdocument'
+FTS_TABLE = 'tickets_ticketsearch_fts'
+COMMENT_TABLE = 'tickets_comment'
+COMMENT_FTS_TABLE = 'tickets_commentsearch_fts'
+
+# Comments are searched on their own rows rather than copied into the
+# ticket documents, so adding one doesn't rewrite its ticket's document.
+POSTGRES_FORWARDS = [
+    f"""
+    ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+]
+
+# An expression index on the comments instead of a stored tsvector column:
+# it is built without rewriting (and locking) the comment table. The
+# expression must match the one in tickets/search.py.
+POSTGRES_INDEXES = [
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ticket_search_vector_idx ON {DOCUMENT_TABLE} USING GIN (search_vector)',
+    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_search_vector_idx ON {COMMENT_TABLE} "
+    f"USING GIN (to_tsvector('english', text))",
+]
+
+POSTGRES_DROP_INDEXES = [
+    'DROP INDEX CONCURRENTLY IF EXISTS comment_search_vector_idx',
+]
+
+SQLITE_FORWARDS = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, description,
+        content='{DOCUMENT_TABLE}', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE VIRTUAL TABLE {COMMENT_FTS_TABLE} USING fts5(
+        text, content='{COMMENT_TABLE}', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {COMMENT_FTS_TABLE}_ai AFTER INSERT ON {COMMENT_TABLE} BEGIN
+        INSERT INTO {COMMENT_FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {COMMENT_FTS_TABLE}_ad AFTER DELETE ON {COMMENT_TABLE} BEGIN
+        INSERT INTO {COMMENT_FTS_TABLE}({COMMENT_FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {COMMENT_FTS_TABLE}_au AFTER UPDATE OF text ON {COMMENT_TABLE} BEGIN
+        INSERT INTO {COMMENT_FTS_TABLE}({COMMENT_FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO {COMMENT_FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    # Index the existing comments
+    f"INSERT INTO {COMMENT_FTS_TABLE}({COMMENT_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    f'DROP TRIGGER IF EXISTS {COMMENT_FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {COMMENT_FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {COMMENT_FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {COMMENT_FTS_TABLE}',
+    # The document triggers go away with the document table
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_search_structures(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = POSTGRES_FORWARDS if vendor == 'postgresql' else SQLITE_FORWARDS if vendor == 'sqlite' else []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_structures(apps, schema_editor):
+    # The tsvector column and its index go away with the table.
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_BACKWARDS:
+            schema_editor.execute(statement)
+
+
+def backfill_documents(apps, schema_editor):
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketSearchDocument = apps.get_model('tickets', 'TicketSearchDocument')
+    
+    last_pk = 0
+    while True:
+        tickets = list(
+            Ticket.objects.filter(pk__gt=last_pk).order_by('pk').values('pk', 'title', 'description')[:1000]
+        )
+        if not tickets:
+            break
+        last_pk = tickets[-1]['pk']
+        
+        TicketSearchDocument.objects.bulk_create([
+            TicketSearchDocument(ticket_id=ticket['pk'], title=ticket['title'], description=ticket['description'])
+            for ticket in tickets
+        ])
+
+
+def create_search_indexes(apps, schema_editor):
+    # Built after the backfill so the rows don't go through the GIN index
+    # one at a time.
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_DROP_INDEXES:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('tickets', '0003_ticket_visibility_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='tickets.ticket')),
+            ],
+        ),
+        migrations.RunPython(create_search_structures, drop_search_structures),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
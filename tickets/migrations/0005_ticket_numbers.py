@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+from support_system.migration_operations import AddUniqueIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # The column is added as NULL (no table rewrite) and its unique index is
+    # built concurrently; existing rows are numbered by backfill_ticket_ids.
+    atomic = False
+
+    dependencies = [
+        ('tickets', '0004_ticket_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=16, unique=True)),
+                ('next_number', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='ticket_id',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        AddUniqueIndexConcurrently(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(fields=('ticket_id',), name='ticket_number_uniq', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
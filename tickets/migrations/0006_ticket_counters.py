@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:52
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    """
+    Seed the counters from the existing tickets, mirroring
+    tickets.counters.rollup_keys (ANY = -1 / '*', NONE = 0).
+    """
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketCounter = apps.get_model('tickets', 'TicketCounter')
+    counts = Counter()
+    rows = Ticket.objects.values(
+        'status', 'priority', 'department_id', 'category_id', 'assigned_to_id', 'created_by_id'
+    ).annotate(n=Count('id')).order_by()
+    for row in rows:
+        department, category = row['department_id'] or 0, row['category_id'] or 0
+        assignee, creator = row['assigned_to_id'] or 0, row['created_by_id'] or 0
+        counts[(row['status'], row['priority'], department, category, -1, -1)] += row['n']
+        counts[(row['status'], '*', -1, -1, assignee, -1)] += row['n']
+        counts[(row['status'], '*', -1, -1, -1, creator)] += row['n']
+    TicketCounter.objects.bulk_create(
+        [
+            TicketCounter(
+                status=status, priority=priority, department_key=department, category_key=category,
+                assignee_key=assignee, creator_key=creator, shard=0, count=count,
+            )
+            for (status, priority, department, category, assignee, creator), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_ticket_numbers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('priority', models.CharField(max_length=10)),
+                ('department_key', models.BigIntegerField()),
+                ('category_key', models.BigIntegerField()),
+                ('assignee_key', models.BigIntegerField()),
+                ('creator_key', models.BigIntegerField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('creator_key', 'assignee_key', 'status', 'priority', 'department_key', 'category_key', 'shard'), name='ticket_counter_key_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:56
+
+from django.db import migrations, models, transaction
+from django.db.models import F, Max
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_transition_timestamps(apps, schema_editor):
+    """
+    The real transition times of existing tickets are unknown; their last
+    update is the closest estimate, for the assignment of the tickets
+    already assigned as well as for resolutions and closings.
+
+    Works through the table in primary key ranges, one short transaction
+    per batch, so it never holds long locks (see backfill_ticket_ids).
+    """
+    Ticket = apps.get_model('tickets', 'Ticket')
+    alias = schema_editor.connection.alias
+    last_pk = Ticket.objects.using(alias).aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    for start in range(0, last_pk, BACKFILL_BATCH_SIZE):
+        batch = Ticket.objects.using(alias).filter(pk__gt=start, pk__lte=start + BACKFILL_BATCH_SIZE)
+        with transaction.atomic(using=alias):
+            batch.filter(assigned_to__isnull=False, assigned_at__isnull=True).update(assigned_at=F('updated_at'))
+            batch.filter(status__in=['resolved', 'closed'], resolved_at__isnull=True).update(resolved_at=F('updated_at'))
+            batch.filter(status='closed', closed_at__isnull=True).update(closed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    # The backfill commits batch by batch instead of in one transaction
+    atomic = False
+
+    dependencies = [
+        ('tickets', '0006_ticket_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='assigned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ResolutionTimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('agent', 'Agent'), ('category', 'Category')], max_length=10)),
+                ('key', models.BigIntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('bin', models.PositiveSmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'bucket_start', 'key', 'bin'), name='resolution_time_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('department_key', models.BigIntegerField()),
+                ('opened', models.BigIntegerField(default=0)),
+                ('resolved', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start', 'department_key'), name='ticket_activity_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_transition_timestamps, migrations.RunPython.noop),
+    ]
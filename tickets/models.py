@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class Department(models.Model):
@@ -20,6 +21,11 @@ class Department(models.Model):
     
     def __str__(self):
         return self.name
+    
+    @property
+    def ticket_prefix(self):
+        # 'tech_support' -> 'TECH', 'customer_service' -> 'CUSTOMER'
+        return self.code.split('_')[0].upper()
 
 class Category(models.Model):
     CATEGORY_CHOICES = [ 
@@ -59,6 +65,8 @@ class Ticket(models.Model):
         ('urgent', 'Urgent'),
     )
     
+    # Human readable number such as TECH-000123, see tickets/numbering.py
+    ticket_id = models.CharField(max_length=32, null=True, blank=True, editable=False)
     title = models.CharField(max_length=200)
     description = models.TextField()
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tickets')
@@ -69,9 +77,177 @@ class Ticket(models.Model):
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Status transition timestamps, stamped by save()
+    assigned_at = models.DateTimeField(null=True, blank=True, editable=False)
+    resolved_at = models.DateTimeField(null=True, blank=True, editable=False)
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        # Tuned to the role-based visibility queries:
+        # - admins page through everything newest first
+        # - support sees their own tickets plus the unassigned pool
+        # - clients filter on created_by: status counts, and their recently
+        #   updated tickets, which are ordered by updated_at across statuses
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='ticket_created_id_idx'),
+            models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+            models.Index(fields=['assigned_to', 'status'], name='ticket_assignee_status_idx'),
+            models.Index(fields=['created_by', 'status', 'updated_at'], name='ticket_creator_status_idx'),
+            models.Index(fields=['created_by', 'updated_at'], name='ticket_creator_updated_idx'),
+            models.Index(
+                fields=['-created_at'],
+                name='ticket_unassigned_idx',
+                condition=models.Q(assigned_to__isnull=True),
+            ),
+        ]
+        constraints = [
+            # varchar_pattern_ops lets the same unique index serve prefix
+            # (LIKE 'TECH-00%') lookups on PostgreSQL
+            models.UniqueConstraint(
+                fields=['ticket_id'],
+                name='ticket_number_uniq',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
+    
+    # Fields that key the dashboard counters, see tickets/counters.py
+    COUNTER_FIELDS = ('status', 'priority', 'department_id', 'category_id', 'assigned_to_id', 'created_by_id')
+    
+    # Entering one of these from any other status counts as a resolution
+    RESOLVED_STATUSES = ('resolved', 'closed')
     
     def __str__(self):
         return f"{self.title} - {self.status}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the values as loaded so that saves can tell what changed,
+        # and move the ticket between counters, without reading it again
+        loaded = dict(zip(field_names, values))
+        instance._loaded_values = loaded
+        if all(field in loaded for field in cls.COUNTER_FIELDS):
+            instance._counter_state = tuple(loaded[field] for field in cls.COUNTER_FIELDS)
+        return instance
+    
+    def loaded_value(self, attname):
+        """
+        Return the value of ``attname`` as stored in the database, or None for
+        a ticket that hasn't been saved yet. Fields that weren't loaded with
+        the ticket are read on first use.
+        """
+        if self._state.adding:
+            return None
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        loaded = self._loaded_values
+        if attname not in loaded:
+            loaded[attname] = Ticket.objects.filter(pk=self.pk).values_list(attname, flat=True).first()
+        return loaded[attname]
+    
+    def changed_fields(self):
+        """
+        Return the names of the fields whose value differs from the one
+        loaded from the database, or None for a ticket that hasn't been saved
+        yet. Fields that weren't loaded count as changed once they are set.
+        """
+        if self._state.adding:
+            return None
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+            and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        }
+    
+    def save_changes(self):
+        """
+        Save only the fields changed since the ticket was loaded (bumping
+        updated_at), or nothing when no field changed. Returns the names of
+        the changed fields.
+        """
+        changed = self.changed_fields()
+        if changed is None:
+            self.save()
+        elif changed:
+            self.save(update_fields=changed | {'updated_at'})
+        return changed
+    
+    def saved_counter_state(self):
+        """
+        Return the COUNTER_FIELDS values as stored in the database, or None
+        for a ticket that hasn't been saved yet.
+        """
+        if self._state.adding:
+            return None
+        if getattr(self, '_counter_state', None) is None:
+            self._counter_state = Ticket.objects.filter(pk=self.pk).values_list(*self.COUNTER_FIELDS).first()
+        return self._counter_state
+    
+    def stamp_transitions(self, previous_state, saved_fields=None, now=None):
+        """
+        Set the transition timestamps for the change from ``previous_state``
+        and return the names of the fields that were stamped. Only
+        ``saved_fields`` are considered (all fields when None). The events
+        are kept on ``_transitions`` for the post_save analytics receiver.
+        """
+        previous = dict(zip(self.COUNTER_FIELDS, previous_state or (None,) * len(self.COUNTER_FIELDS)))
+        now = now or timezone.now()
+        stamped = []
+        self._transitions = set()
+        if previous_state is None:
+            self._transitions.add('opened')
+        
+        assignee_saved = saved_fields is None or {'assigned_to', 'assigned_to_id'} & saved_fields
+        if assignee_saved and self.assigned_to_id and self.assigned_to_id != previous['assigned_to_id']:
+            self.assigned_at = now
+            stamped.append('assigned_at')
+        
+        status_saved = saved_fields is None or 'status' in saved_fields
+        if status_saved and self.status != previous['status']:
+            if self.status in self.RESOLVED_STATUSES:
+                if previous['status'] not in self.RESOLVED_STATUSES:
+                    self.resolved_at = now
+                    stamped.append('resolved_at')
+                    self._transitions.add('resolved')
+                if self.status == 'closed':
+                    self.closed_at = now
+                    stamped.append('closed_at')
+            elif self.resolved_at or self.closed_at:
+                # Reopened: the next resolution starts a new measurement
+                self.resolved_at = self.closed_at = None
+                stamped.extend(['resolved_at', 'closed_at'])
+        return stamped
+    
+    def save(self, *args, **kwargs):
+        # The counters and rollups are updated from post_save and must
+        # commit or roll back together with the ticket row
+        with transaction.atomic(using=kwargs.get('using')):
+            update_fields = kwargs.get('update_fields')
+            saved_fields = None if update_fields is None else set(update_fields)
+            if saved_fields is None or {'status', 'assigned_to', 'assigned_to_id'} & saved_fields:
+                stamped = self.stamp_transitions(self.saved_counter_state(), saved_fields)
+                if saved_fields is not None and stamped:
+                    kwargs['update_fields'] = saved_fields | set(stamped)
+            else:
+                self._transitions = set()
+            super().save(*args, **kwargs)
+        
+        # The database now holds the saved values
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            deferred = self.get_deferred_fields()
+            saved = [field for field in self._meta.concrete_fields if field.attname not in deferred]
+        else:
+            saved = [
+                field for field in self._meta.concrete_fields
+                if field.name in update_fields or field.attname in update_fields
+            ]
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        self._loaded_values.update((field.attname, getattr(self, field.attname)) for field in saved)
 
 class Comment(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='comments')
@@ -82,3 +258,127 @@ class Comment(models.Model):
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.ticket.title}"
+    
+    def save(self, *args, **kwargs):
+        # Notifications and queued emails are written from post_save and
+        # must commit or roll back together with the comment
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+class TicketCounter(models.Model):
+    """
+    Denormalized ticket counts for the dashboards, maintained by
+    tickets/counters.py on every ticket create, update and delete.
+    
+    Rows are keyed by (status, priority, department, category, assignee,
+    creator). Dimensions use ANY (-1 / '*') for rollup rows and NONE (0)
+    for "not set", and each key is spread over several shards so that busy
+    keys don't become a single hot row. Read counts by summing the shards.
+    """
+    status = models.CharField(max_length=20)
+    priority = models.CharField(max_length=10)
+    department_key = models.BigIntegerField()
+    category_key = models.BigIntegerField()
+    assignee_key = models.BigIntegerField()
+    creator_key = models.BigIntegerField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            # Leading creator/assignee columns serve the per-role lookups
+            models.UniqueConstraint(
+                fields=['creator_key', 'assignee_key', 'status', 'priority',
+                        'department_key', 'category_key', 'shard'],
+                name='ticket_counter_key_uniq',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.status}/{self.priority}: {self.count}"
+
+class TicketActivityRollup(models.Model):
+    """
+    Tickets opened and resolved per department and time bucket, maintained
+    by tickets/analytics.py. Bucket starts are in the local TIME_ZONE;
+    department_key is 0 for tickets without a department.
+    """
+    GRANULARITY_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    department_key = models.BigIntegerField()
+    opened = models.BigIntegerField(default=0)
+    resolved = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'department_key'],
+                name='ticket_activity_bucket_uniq',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start}: +{self.opened} / -{self.resolved}"
+
+class ResolutionTimeRollup(models.Model):
+    """
+    Daily histograms of time-to-resolution per agent and per category,
+    maintained by tickets/analytics.py. Each row counts the resolutions
+    whose duration falls into one logarithmic ``bin``, so percentiles over a
+    date range are computed from the summed histograms.
+    """
+    DIMENSION_CHOICES = (
+        ('agent', 'Agent'),
+        ('category', 'Category'),
+    )
+    
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.BigIntegerField()
+    bucket_start = models.DateTimeField()
+    bin = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dimension', 'bucket_start', 'key', 'bin'],
+                name='resolution_time_bucket_uniq',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.dimension} {self.key} {self.bucket_start} bin {self.bin}: {self.count}"
+
+class TicketNumberSequence(models.Model):
+    """
+    Next free ticket number per prefix. Numbers are handed out in blocks
+    (see tickets/numbering.py) so this row is touched once per block rather
+    than once per ticket.
+    """
+    prefix = models.CharField(max_length=16, unique=True)
+    next_number = models.PositiveBigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.prefix}: {self.next_number}"
+
+class TicketSearchDocument(models.Model):
+    """
+    Denormalized text of a ticket used for full-text search. Comments are
+    indexed on their own rows, so adding one doesn't rewrite the document.
+    
+    Kept up to date by tickets/signals.py. The backend specific search
+    structures (a weighted tsvector column with a GIN index on PostgreSQL,
+    an FTS5 table on SQLite) are created by migrations and queried through
+    tickets/search.py.
+    """
+    ticket = models.OneToOneField(Ticket, on_delete=models.CASCADE, related_name='search_document')
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    
+    def __str__(self):
+        return f"Search document for {self.ticket_id}"
@@ -0,0 +1,149 @@
+"""
+Allocation of human readable ticket numbers such as ``TECH-000123``.
+
+Each prefix (derived from the ticket's department) has one
+TicketNumberSequence row. Instead of locking that row for every new ticket,
+a process reserves a block of numbers with one upsert and then hands them
+out from memory, so concurrent ticket creation only contends on the row once
+per block. The trade-off is that numbers are unique but not strictly
+sequential across processes, and a restart leaves gaps.
+
+Tickets are numbered inside the transaction that saves them, which also
+updates counters, rollups and notifications. On PostgreSQL the reservation
+therefore commits on a connection of its own: the sequence row stays locked
+for one statement rather than until the ticket commits. SQLite has a single
+writer anyway, and a second connection would wait for the first, so there
+the reservation joins the current transaction.
+"""
+import re
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .models import Ticket, TicketNumberSequence
+
+DEFAULT_PREFIX = 'GEN'
+NUMBER_WIDTH = 6
+
+TICKET_NUMBER_RE = re.compile(r'^([A-Z]+)-(\d+)$')
+TICKET_NUMBER_PREFIX_RE = re.compile(r'^[A-Z]+-\d*$')
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def get_block_size():
+    return getattr(settings, 'TICKET_NUMBER_BLOCK_SIZE', 20)
+
+
+def ticket_number_prefix(department):
+    return department.ticket_prefix if department else DEFAULT_PREFIX
+
+
+def format_ticket_number(prefix, number):
+    return f'{prefix}-{number:0{NUMBER_WIDTH}d}'
+
+
+def reserve_ticket_numbers(prefix, count):
+    """
+    Reserve ``count`` consecutive numbers for ``prefix`` and return the first.
+    """
+    return _reserve(prefix, count)[0]
+
+
+def _reserve(prefix, count):
+    """
+    Reserve the numbers and return ``(start, committed)``, where
+    ``committed`` is False when the reservation is part of the current
+    transaction and rolls back with it.
+    """
+    alias = router.db_for_write(TicketNumberSequence)
+    connection = connections[alias]
+    if connection.in_atomic_block and connection.vendor == 'postgresql':
+        reservation = connections.create_connection(alias)
+        try:
+            return _reserve_on(reservation, prefix, count), True
+        finally:
+            reservation.close()
+    return _reserve_on(connection, prefix, count), not connection.in_atomic_block
+
+
+def _reserve_on(connection, prefix, count):
+    # A single upsert: outside a transaction the row is locked for just
+    # this statement
+    table = connection.ops.quote_name(TicketNumberSequence._meta.db_table)
+    sql = (
+        f'INSERT INTO {table} (prefix, next_number) VALUES (%s, %s) '
+        f'ON CONFLICT (prefix) DO UPDATE SET next_number = {table}.next_number + excluded.next_number - 1 '
+        f'RETURNING next_number'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [prefix, count + 1])
+        next_number = cursor.fetchone()[0]
+    return next_number - count
+
+
+def allocate_ticket_number(department):
+    """
+    Return the next free ticket number for a ticket in ``department``.
+    """
+    prefix = ticket_number_prefix(department)
+    with _blocks_lock:
+        ranges = _blocks.get(prefix)
+        if ranges:
+            number, stop = ranges[0]
+            if number + 1 < stop:
+                ranges[0] = (number + 1, stop)
+            else:
+                ranges.pop(0)
+            return format_ticket_number(prefix, number)
+
+    block_size = get_block_size()
+    start, committed = _reserve(prefix, block_size)
+    if block_size > 1:
+        # Only reuse the rest of the block once the reservation is
+        # committed; if it rolls back with the surrounding transaction, the
+        # numbers must not be handed out.
+        release = partial(_release_block, prefix, start + 1, start + block_size)
+        if committed:
+            release()
+        else:
+            transaction.on_commit(release)
+    return format_ticket_number(prefix, start)
+
+
+def _release_block(prefix, start, stop):
+    with _blocks_lock:
+        _blocks.setdefault(prefix, []).append((start, stop))
+
+
+def ticket_number_filter(term):
+    """
+    Return a Q object matching ``term`` as a ticket number, or None if it
+    doesn't look like one.
+
+    ``TECH-123`` and ``tech-000123`` match exactly; ``TECH-00`` and ``TECH-``
+    match as prefixes, in the form the unique index serves: LIKE on
+    PostgreSQL, where it is built with varchar_pattern_ops, and a range
+    elsewhere.
+    """
+    term = term.strip().upper()
+    match = TICKET_NUMBER_RE.match(term)
+    if match and len(match.group(2)) >= NUMBER_WIDTH:
+        return Q(ticket_id=term)
+    if match and len(match.group(2)) < NUMBER_WIDTH:
+        exact = format_ticket_number(match.group(1), int(match.group(2)))
+        return Q(ticket_id=exact) | _prefix_range(term)
+    if TICKET_NUMBER_PREFIX_RE.match(term):
+        return _prefix_range(term)
+    return None
+
+
+def _prefix_range(prefix):
+    if connections[router.db_for_read(Ticket)].vendor == 'postgresql':
+        return Q(ticket_id__startswith=prefix)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(ticket_id__gte=prefix, ticket_id__lt=upper)
@@ -0,0 +1,266 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder truncates datetimes to milliseconds, which would make
+    cursors skip rows created within the same millisecond. Keep the full
+    precision instead.
+    """
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor cannot be decoded or doesn't match the ordering.
+    """
+
+
+class KeysetPage:
+    """
+    One page of results produced by KeysetPaginator.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Keyset (seek) pagination over a fixed ordering.
+
+    Instead of OFFSET/LIMIT plus a COUNT(*), each page is fetched with a
+    WHERE clause that continues after the last row of the previous page, so
+    every page costs the same no matter how deep the client has scrolled.
+    The ordering always ends with the primary key so that rows sharing the
+    same timestamp are never skipped or repeated.
+
+    Cursors are opaque url-safe strings holding the ordering values of the
+    row the page starts after (or before, when paging backwards).
+    """
+    def __init__(self, ordering=('-created_at', 'id'), page_size=10):
+        ordering = list(ordering)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def paginate(self, queryset, cursor=None, page_size=None):
+        page_size = page_size or self.page_size
+        reverse = False
+        position = None
+        if cursor:
+            position, reverse = self.decode_cursor(cursor)
+
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        # Fetch one extra row to find out whether there is another page
+        # in the direction we are travelling without counting the rest.
+        try:
+            if position is not None:
+                queryset = queryset.filter(self._seek_filter(ordering, position))
+            rows = list(queryset[:page_size + 1])
+        except ValidationError:
+            # A tampered cursor carrying values of the wrong type.
+            raise InvalidCursor('Invalid cursor')
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(self._position(rows[-1]), reverse=False)
+            if (has_more and reverse) or (cursor and not reverse):
+                previous_cursor = self.encode_cursor(self._position(rows[0]), reverse=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def encode_cursor(self, position, reverse=False):
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        data = json.dumps(payload, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise InvalidCursor('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise InvalidCursor('Invalid cursor')
+        return position, reverse
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+
+    def _position(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def _seek_filter(self, ordering, position):
+        # (a, b, c) > (x, y, z) expanded into
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+        # with the comparison flipped for descending fields.
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= equal & Q(**{name + lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    DRF pagination class backed by KeysetPaginator.
+
+    The ordering comes from the view's OrderingFilter (falling back to
+    ``ordering`` on this class) with the primary key appended as a
+    tie-breaker. Responses contain ``next``/``previous`` links and
+    ``results``; a total ``count`` is only computed when ``include_count``
+    is enabled.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', 'id')
+    include_count = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.count = queryset.count() if self.include_count else None
+
+        paginator = KeysetPaginator(self.get_ordering(request, queryset, view), self.get_page_size(request))
+        try:
+            self.page = paginator.paginate(queryset, request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.page)
+
+    def get_ordering(self, request, queryset, view):
+        ordering_filters = [
+            backend for backend in getattr(view, 'filter_backends', [])
+            if issubclass(backend, OrderingFilter)
+        ]
+        if ordering_filters:
+            ordering = ordering_filters[0]().get_ordering(request, queryset, view)
+            if ordering:
+                return ordering
+        return self.ordering
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    return min(page_size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+        return Response(OrderedDict(fields))
+
+    def get_paginated_response_schema(self, schema):
+        properties = {
+            'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+            'results': schema,
+        }
+        if self.include_count:
+            properties['count'] = {'type': 'integer'}
+        return {'type': 'object', 'required': ['results'], 'properties': properties}
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+def keyset_page_links(request, page, cursor_query_param='cursor'):
+    """
+    Build relative ``?...`` links for a KeysetPage that keep the other
+    query parameters (filters, search) of the current request.
+    """
+    url = request.get_full_path()
+    next_url = previous_url = None
+    if page.has_next:
+        next_url = replace_query_param(url, cursor_query_param, page.next_cursor)
+    if page.has_previous:
+        previous_url = replace_query_param(url, cursor_query_param, page.previous_cursor)
+    first_url = remove_query_param(url, cursor_query_param) if page.has_previous else None
+    return first_url, previous_url, next_url
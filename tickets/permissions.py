@@ -9,19 +9,16 @@ class CanViewTicket(permissions.BasePermission):
     - Clients can only view their own tickets
     """
     def has_object_permission(self, request, view, obj):
-        if not request.user or not hasattr(request.user, 'profile'):
-            return False
-            
         # Admin can view all tickets
-        if request.user.profile.role == 'admin':
+        if request.role == 'admin':
             return True
             
         # Support can view tickets assigned to them or unassigned
-        if request.user.profile.role == 'support':
+        if request.role == 'support':
             return obj.assigned_to == request.user or obj.assigned_to is None
             
         # Clients can only view their own tickets
-        if request.user.profile.role == 'client':
+        if request.role == 'client':
             return obj.created_by == request.user
             
         return False
@@ -34,19 +31,16 @@ class CanUpdateTicket(permissions.BasePermission):
     - Clients can update their own tickets but with limited fields
     """
     def has_object_permission(self, request, view, obj):
-        if not request.user or not hasattr(request.user, 'profile'):
-            return False
-            
         # Admin can update all tickets
-        if request.user.profile.role == 'admin':
+        if request.role == 'admin':
             return True
             
         # Support can update tickets assigned to them
-        if request.user.profile.role == 'support':
+        if request.role == 'support':
             return obj.assigned_to == request.user
             
         # Clients can update their own tickets but with limited fields
-        if request.user.profile.role == 'client':
+        if request.role == 'client':
             if obj.created_by != request.user:
                 return False
                 
@@ -65,19 +59,16 @@ class CanDeleteTicket(permissions.BasePermission):
     - Clients can only delete their own tickets if they are still open
     """
     def has_object_permission(self, request, view, obj):
-        if not request.user or not hasattr(request.user, 'profile'):
-            return False
-            
         # Admin can delete any ticket
-        if request.user.profile.role == 'admin':
+        if request.role == 'admin':
             return True
             
         # Support cannot delete tickets
-        if request.user.profile.role == 'support':
+        if request.role == 'support':
             return False
             
         # Clients can only delete their own tickets if they are still open
-        if request.user.profile.role == 'client':
+        if request.role == 'client':
             return obj.created_by == request.user and obj.status == 'open'
             
         return False
@@ -90,22 +81,19 @@ class CanCommentOnTicket(permissions.BasePermission):
     - Clients can comment on their own tickets
     """
     def has_permission(self, request, view):
-        return request.user and hasattr(request.user, 'profile')
+        return bool(request.role)
         
     def has_object_permission(self, request, view, obj):
-        if not request.user or not hasattr(request.user, 'profile'):
-            return False
-            
         # Admin can comment on any ticket
-        if request.user.profile.role == 'admin':
+        if request.role == 'admin':
             return True
             
         # Support can comment on tickets assigned to them
-        if request.user.profile.role == 'support':
+        if request.role == 'support':
             return obj.ticket.assigned_to == request.user
             
         # Clients can comment on their own tickets
-        if request.user.profile.role == 'client':
+        if request.role == 'client':
             return obj.ticket.created_by == request.user
             
         return False
\ No newline at end of file
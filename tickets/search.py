@@ -0,0 +1,331 @@
+"""
+Full-text search over tickets and their comments.
+
+Every ticket has a TicketSearchDocument holding its title and description,
+and every comment is indexed on its own row, so adding a comment indexes
+that comment only. A ticket matches when its document or one of its
+comments matches; it ranks by its best match, and its snippet comes from
+the document or, failing that, from its best matching comment. The
+backends below search with the database's own full-text engine:
+
+- PostgreSQL: a stored, weighted ``search_vector`` tsvector column with a GIN
+  index on the documents and a GIN expression index on the comment text,
+  ranked with ts_rank and highlighted with ts_headline.
+- SQLite: external-content FTS5 tables on the documents and the comments
+  kept in sync by triggers, ranked with bm25() and highlighted with
+  snippet().
+
+Other databases fall back to a case-insensitive scan of the documents and
+comments.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from rest_framework import filters
+
+from .models import Comment, Ticket, TicketSearchDocument
+from .numbering import ticket_number_filter
+
+# Highlight markers used inside the database; they are swapped for <mark>
+# tags after the snippet text has been HTML-escaped.
+START_MARK = '\x02'
+STOP_MARK = '\x03'
+
+DOCUMENT_TABLE = TicketSearchDocument._meta.db_table
+COMMENT_TABLE = Comment._meta.db_table
+FTS_TABLE = 'tickets_ticketsearch_fts'
+COMMENT_FTS_TABLE = 'tickets_commentsearch_fts'
+
+
+class SearchHit:
+    def __init__(self, ticket_id, rank):
+        self.ticket_id = ticket_id
+        self.rank = rank
+
+
+class BaseSearchBackend:
+    def match_sql(self, query):
+        """
+        Return ``(sql, params)`` selecting the ids of matching tickets.
+        """
+        raise NotImplementedError
+
+    def rank_sql(self, query, visible_sql, visible_params, limit, offset):
+        """
+        Return ``(sql, params)`` selecting ``(ticket_id, rank)`` of the best
+        matches among the visible tickets, best first.
+        """
+        raise NotImplementedError
+
+    def snippet_sql(self, query, ticket_ids):
+        """
+        Return ``(sql, params)`` selecting ``(ticket_id, snippet)`` for the
+        given tickets, the preferred snippet of each ticket first.
+        """
+        raise NotImplementedError
+
+    def prepare_query(self, query):
+        return query
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    config = 'english'
+
+    def comment_vector(self, alias):
+        # The expression of the comment_search_vector_idx GIN index; the
+        # config is inlined so the planner can match it
+        return f"to_tsvector('{self.config}', {alias}.text)"
+
+    def match_sql(self, query):
+        sql = (
+            f'SELECT ticket_id FROM {DOCUMENT_TABLE} '
+            f'WHERE search_vector @@ websearch_to_tsquery(%s::regconfig, %s) '
+            f'UNION ALL '
+            f'SELECT c.ticket_id FROM {COMMENT_TABLE} c '
+            f"WHERE {self.comment_vector('c')} @@ websearch_to_tsquery(%s::regconfig, %s)"
+        )
+        return sql, [self.config, query, self.config, query]
+
+    def rank_sql(self, query, visible_sql, visible_params, limit, offset):
+        sql = (
+            f'SELECT ticket_id, max(rank) AS rank FROM ('
+            f'SELECT d.ticket_id, ts_rank(d.search_vector, q.query) AS rank '
+            f'FROM {DOCUMENT_TABLE} d, websearch_to_tsquery(%s::regconfig, %s) AS q(query) '
+            f'WHERE d.search_vector @@ q.query '
+            f'UNION ALL '
+            f"SELECT c.ticket_id, ts_rank(setweight({self.comment_vector('c')}, 'C'), q.query) "
+            f'FROM {COMMENT_TABLE} c, websearch_to_tsquery(%s::regconfig, %s) AS q(query) '
+            f"WHERE {self.comment_vector('c')} @@ q.query"
+            f') AS matches WHERE ticket_id IN ({visible_sql}) '
+            f'GROUP BY ticket_id ORDER BY rank DESC, ticket_id DESC LIMIT %s OFFSET %s'
+        )
+        return sql, [self.config, query, self.config, query, *visible_params, limit, offset]
+
+    def snippet_sql(self, query, ticket_ids):
+        placeholders = ', '.join(['%s'] * len(ticket_ids))
+        options = (
+            f'StartSel={START_MARK}, StopSel={STOP_MARK}, MaxWords=30, MinWords=10, '
+            f'MaxFragments=2, FragmentDelimiter=" ... "'
+        )
+        # The document's snippet if it matches, else the best matching
+        # comment's; ts_headline runs once per ticket and source
+        sql = (
+            f"SELECT ticket_id, snippet FROM ("
+            f"SELECT d.ticket_id, 0 AS source, "
+            f"ts_headline(%s::regconfig, concat_ws(' ', d.title, d.description), q.query, %s) AS snippet "
+            f'FROM {DOCUMENT_TABLE} d, websearch_to_tsquery(%s::regconfig, %s) AS q(query) '
+            f'WHERE d.ticket_id IN ({placeholders}) AND d.search_vector @@ q.query '
+            f'UNION ALL '
+            f'SELECT best.ticket_id, 1, ts_headline(%s::regconfig, best.text, q.query, %s) FROM ('
+            f'SELECT DISTINCT ON (c.ticket_id) c.ticket_id, c.text '
+            f'FROM {COMMENT_TABLE} c, websearch_to_tsquery(%s::regconfig, %s) AS q(query) '
+            f"WHERE c.ticket_id IN ({placeholders}) AND {self.comment_vector('c')} @@ q.query "
+            f"ORDER BY c.ticket_id, ts_rank({self.comment_vector('c')}, q.query) DESC, c.id"
+            f') AS best, websearch_to_tsquery(%s::regconfig, %s) AS q(query)'
+            f') AS snippets ORDER BY source'
+        )
+        return sql, [
+            self.config, options, self.config, query, *ticket_ids,
+            self.config, options, self.config, query, *ticket_ids, self.config, query,
+        ]
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    # bm25() column weights: title and description of the documents, and
+    # the comment text
+    weights = (10.0, 4.0)
+    comment_weight = 1.0
+
+    def prepare_query(self, query):
+        # Turn free text into an FTS5 query of quoted terms so that user
+        # input can never be parsed as FTS5 syntax. The last term is a
+        # prefix match to support search-as-you-type.
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        terms = ['"%s"' % term for term in terms]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def match_sql(self, query):
+        sql = (
+            f'SELECT d.ticket_id FROM {FTS_TABLE} '
+            f'JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'UNION ALL '
+            f'SELECT c.ticket_id FROM {COMMENT_FTS_TABLE} '
+            f'JOIN {COMMENT_TABLE} c ON c.id = {COMMENT_FTS_TABLE}.rowid '
+            f'WHERE {COMMENT_FTS_TABLE} MATCH %s'
+        )
+        return sql, [query, query]
+
+    def rank_sql(self, query, visible_sql, visible_params, limit, offset):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        sql = (
+            f'SELECT ticket_id, max(rank) AS rank FROM ('
+            f'SELECT d.ticket_id, -bm25({FTS_TABLE}, {weights}) AS rank FROM {FTS_TABLE} '
+            f'JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'UNION ALL '
+            f'SELECT c.ticket_id, -bm25({COMMENT_FTS_TABLE}, {self.comment_weight}) FROM {COMMENT_FTS_TABLE} '
+            f'JOIN {COMMENT_TABLE} c ON c.id = {COMMENT_FTS_TABLE}.rowid '
+            f'WHERE {COMMENT_FTS_TABLE} MATCH %s'
+            f') WHERE ticket_id IN ({visible_sql}) '
+            f'GROUP BY ticket_id ORDER BY rank DESC, ticket_id DESC LIMIT %s OFFSET %s'
+        )
+        return sql, [query, query, *visible_params, limit, offset]
+
+    def snippet_sql(self, query, ticket_ids):
+        placeholders = ', '.join(['%s'] * len(ticket_ids))
+        sql = (
+            f'SELECT ticket_id, snippet FROM ('
+            f"SELECT d.ticket_id, 0 AS source, 0.0 AS rank, snippet({FTS_TABLE}, -1, %s, %s, ' ... ', 16) AS snippet "
+            f'FROM {FTS_TABLE} JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND d.ticket_id IN ({placeholders}) '
+            f'UNION ALL '
+            f"SELECT c.ticket_id, 1, bm25({COMMENT_FTS_TABLE}), snippet({COMMENT_FTS_TABLE}, 0, %s, %s, ' ... ', 16) "
+            f'FROM {COMMENT_FTS_TABLE} JOIN {COMMENT_TABLE} c ON c.id = {COMMENT_FTS_TABLE}.rowid '
+            f'WHERE {COMMENT_FTS_TABLE} MATCH %s AND c.ticket_id IN ({placeholders})'
+            f') ORDER BY source, rank'
+        )
+        return sql, [START_MARK, STOP_MARK, query, *ticket_ids, START_MARK, STOP_MARK, query, *ticket_ids]
+
+
+class FallbackSearchBackend(BaseSearchBackend):
+    """
+    Unindexed LIKE search for databases without a supported full-text engine.
+    """
+    def match_sql(self, query):
+        pattern = '%%%s%%' % query.lower()
+        sql = (
+            f'SELECT ticket_id FROM {DOCUMENT_TABLE} '
+            f'WHERE LOWER(title) LIKE %s OR LOWER(description) LIKE %s '
+            f'UNION ALL '
+            f'SELECT ticket_id FROM {COMMENT_TABLE} WHERE LOWER(text) LIKE %s'
+        )
+        return sql, [pattern, pattern, pattern]
+
+    def rank_sql(self, query, visible_sql, visible_params, limit, offset):
+        match_sql, match_params = self.match_sql(query)
+        sql = (
+            f'SELECT ticket_id, 1.0 AS rank FROM {DOCUMENT_TABLE} '
+            f'WHERE ticket_id IN ({match_sql}) AND ticket_id IN ({visible_sql}) '
+            f'ORDER BY ticket_id DESC LIMIT %s OFFSET %s'
+        )
+        return sql, [*match_params, *visible_params, limit, offset]
+
+    def snippet_sql(self, query, ticket_ids):
+        placeholders = ', '.join(['%s'] * len(ticket_ids))
+        sql = f'SELECT ticket_id, title FROM {DOCUMENT_TABLE} WHERE ticket_id IN ({placeholders})'
+        return sql, list(ticket_ids)
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    return FallbackSearchBackend()
+
+
+def filter_tickets(queryset, query):
+    """
+    Restrict a Ticket queryset to tickets matching ``query``, keeping its
+    ordering (the match runs as an indexed subquery). Queries that look like
+    a ticket number (``TECH-000123``, ``TECH-00``) are looked up by number.
+    """
+    number_filter = ticket_number_filter(query)
+    if number_filter is not None:
+        return queryset.filter(number_filter)
+    
+    backend = get_search_backend()
+    query = backend.prepare_query(query)
+    if not query:
+        return queryset.none()
+    sql, params = backend.match_sql(query)
+    pk_column = '%s.%s' % (
+        connection.ops.quote_name(Ticket._meta.db_table),
+        connection.ops.quote_name(Ticket._meta.pk.column),
+    )
+    return queryset.filter(RawSQL(f'{pk_column} IN ({sql})', params, output_field=BooleanField()))
+
+
+def get_snippets(query, ticket_ids):
+    """
+    Return ``{ticket_id: snippet}`` with matched terms wrapped in <mark>.
+    The snippets are HTML-escaped and safe to render.
+    """
+    backend = get_search_backend()
+    query = backend.prepare_query(query)
+    ticket_ids = list(ticket_ids)
+    if not query or not ticket_ids:
+        return {}
+    sql, params = backend.snippet_sql(query, ticket_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        snippets = {}
+        for ticket_id, snippet in cursor.fetchall():
+            if ticket_id not in snippets:
+                snippets[ticket_id] = _render_snippet(snippet)
+        return snippets
+
+
+def search_tickets(queryset, query, limit=20, offset=0):
+    """
+    Rank the tickets in ``queryset`` against ``query``.
+
+    Returns a list of tickets, best match first, each with ``search_rank``
+    and ``search_snippet`` attributes set.
+    """
+    number_filter = ticket_number_filter(query)
+    if number_filter is not None:
+        tickets = list(queryset.filter(number_filter).order_by('ticket_id')[offset:offset + limit])
+        for ticket in tickets:
+            ticket.search_rank = 1.0
+            ticket.search_snippet = ''
+        return tickets
+    
+    backend = get_search_backend()
+    prepared = backend.prepare_query(query)
+    if not prepared:
+        return []
+
+    visible_sql, visible_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql, params = backend.rank_sql(prepared, visible_sql, visible_params, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        hits = [SearchHit(ticket_id, rank) for ticket_id, rank in cursor.fetchall()]
+    if not hits:
+        return []
+
+    tickets = queryset.in_bulk([hit.ticket_id for hit in hits])
+    snippets = get_snippets(query, tickets.keys())
+    results = []
+    for hit in hits:
+        ticket = tickets.get(hit.ticket_id)
+        if ticket is None:
+            continue
+        ticket.search_rank = hit.rank
+        ticket.search_snippet = snippets.get(hit.ticket_id, '')
+        results.append(ticket)
+    return results
+
+
+def _render_snippet(snippet):
+    snippet = escape(snippet or '')
+    return mark_safe(snippet.replace(START_MARK, '<mark>').replace(STOP_MARK, '</mark>'))
+
+
+class TicketSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` filter backed by the full-text index instead of LIKE scans.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return filter_tickets(queryset, query)
@@ -1,6 +1,11 @@
+from datetime import timedelta
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Department, Category, Ticket, Comment
+from django.utils import timezone
+from accounts.roles import get_user_role
+from .bulk import get_max_tickets
+from .models import Department, Category, Ticket, Comment, TicketActivityRollup, ResolutionTimeRollup
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -57,11 +62,11 @@ class TicketListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = [
-            'id', 'title', 'description', 'created_by', 'assigned_to',
+            'id', 'ticket_id', 'title', 'description', 'created_by', 'assigned_to',
             'category', 'department', 'status', 'status_display',
             'priority', 'priority_display', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
+        read_only_fields = ['id', 'ticket_id', 'created_at', 'updated_at', 'created_by']
 
 class TicketDetailSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
@@ -78,11 +83,15 @@ class TicketDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = [
-            'id', 'title', 'description', 'created_by', 'assigned_to', 'assigned_to_id',
+            'id', 'ticket_id', 'title', 'description', 'created_by', 'assigned_to', 'assigned_to_id',
             'category', 'category_id', 'department', 'department_id', 'status', 'status_display',
-            'priority', 'priority_display', 'created_at', 'updated_at', 'comments'
+            'priority', 'priority_display', 'created_at', 'updated_at',
+            'assigned_at', 'resolved_at', 'closed_at', 'comments'
+        ]
+        read_only_fields = [
+            'id', 'ticket_id', 'created_at', 'updated_at', 'created_by',
+            'assigned_at', 'resolved_at', 'closed_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
     
     def create(self, validated_data):
         # Get the current user from the context
@@ -126,4 +135,96 @@ class TicketDetailSerializer(serializers.ModelSerializer):
                 department = Department.objects.get(pk=department_id)
                 validated_data['department'] = department
             except Department.DoesNotExist:
-                raise serializers.ValidationError({"department_id": "Department does not exist"})
\ No newline at end of file
+                raise serializers.ValidationError({"department_id": "Department does not exist"})
+
+class TicketBulkFilterSerializer(serializers.Serializer):
+    """
+    Selects the tickets of a bulk change by field values (null matching
+    unset fields) and full-text search.
+    """
+    status = serializers.ChoiceField(choices=Ticket.STATUS_CHOICES, required=False)
+    priority = serializers.ChoiceField(choices=Ticket.PRIORITY_CHOICES, required=False)
+    assigned_to_id = serializers.IntegerField(required=False, allow_null=True)
+    department_id = serializers.IntegerField(required=False, allow_null=True)
+    category_id = serializers.IntegerField(required=False, allow_null=True)
+    search = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Give at least one filter.")
+        return data
+
+class TicketBulkUpdateSerializer(serializers.Serializer):
+    """
+    Validates a bulk change: the tickets, by ``ids`` or by ``filter``, and
+    the change to make to all of them. The change ends up in ``changes``,
+    with the assignee as a User.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = TicketBulkFilterSerializer(required=False)
+    status = serializers.ChoiceField(choices=Ticket.STATUS_CHOICES, required=False)
+    priority = serializers.ChoiceField(choices=Ticket.PRIORITY_CHOICES, required=False)
+    assigned_to_id = serializers.IntegerField(required=False, allow_null=True)
+    
+    def validate_ids(self, ids):
+        # Keep the first of duplicated ids
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > get_max_tickets():
+            raise serializers.ValidationError(f"At most {get_max_tickets()} tickets can be changed at once.")
+        return ids
+    
+    def validate_assigned_to_id(self, assigned_to_id):
+        if assigned_to_id is None:
+            return None
+        # Emails to the assignee need the preferences
+        assigned_to = User.objects.select_related('profile', 'notification_preferences').filter(pk=assigned_to_id).first()
+        if assigned_to is None:
+            raise serializers.ValidationError("User does not exist")
+        if get_user_role(assigned_to) != 'support':
+            raise serializers.ValidationError("Only support users can be assigned tickets.")
+        return assigned_to
+    
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Give either ids or filter.")
+        changes = {field: data[field] for field in ('status', 'priority') if field in data}
+        if 'assigned_to_id' in data:
+            changes['assigned_to'] = data['assigned_to_id']
+        if not changes:
+            raise serializers.ValidationError("Give at least one of status, priority and assigned_to_id.")
+        data['changes'] = changes
+        return data
+
+class AnalyticsRangeSerializer(serializers.Serializer):
+    """
+    Validates the ``start``/``end`` query parameters of the analytics
+    reports. The range defaults to the last 30 days.
+    """
+    default_days = 30
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    
+    def validate(self, data):
+        data['end'] = data.get('end') or timezone.now()
+        data['start'] = data.get('start') or data['end'] - timedelta(days=self.default_days)
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError("start must be before end.")
+        return data
+
+class TicketActivityQuerySerializer(AnalyticsRangeSerializer):
+    # Upper bound on the buckets in one response (about three months hourly)
+    max_buckets = 2500
+    granularity = serializers.ChoiceField(choices=TicketActivityRollup.GRANULARITY_CHOICES, default='day')
+    department = serializers.IntegerField(required=False)
+    
+    def validate(self, data):
+        data = super().validate(data)
+        bucket = timedelta(hours=1) if data['granularity'] == 'hour' else timedelta(days=1)
+        if (data['end'] - data['start']) / bucket > self.max_buckets:
+            raise serializers.ValidationError(
+                f"The range covers more than {self.max_buckets} {data['granularity']} buckets."
+            )
+        return data
+
+class ResolutionTimeQuerySerializer(AnalyticsRangeSerializer):
+    group_by = serializers.ChoiceField(choices=ResolutionTimeRollup.DIMENSION_CHOICES, default='agent')
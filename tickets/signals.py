@@ -0,0 +1,167 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from support_system.metrics import TICKET_STATUS_TRANSITIONS
+
+from . import analytics, counters
+from .models import Category, Department, Ticket, TicketSearchDocument
+from .numbering import allocate_ticket_number
+
+
+@receiver(pre_save, sender=Ticket)
+def assign_ticket_number(sender, instance, raw=False, **kwargs):
+    """
+    Give new tickets a human readable number such as TECH-000123.
+    """
+    if not instance.ticket_id and not raw:
+        instance.ticket_id = allocate_ticket_number(instance.department)
+
+
+def saved_counter_fields(update_fields):
+    """
+    Return the Ticket.COUNTER_FIELDS written by a save, given its
+    ``update_fields`` (None meaning every field).
+    """
+    if update_fields is None:
+        return set(Ticket.COUNTER_FIELDS)
+    attnames = {Ticket._meta.get_field(name).attname for name in update_fields}
+    return attnames & set(Ticket.COUNTER_FIELDS)
+
+
+@receiver(pre_save, sender=Ticket)
+def remember_counter_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Work out which counters the ticket contributes to before it is saved.
+    Tickets loaded with all counter fields already know; others are looked up.
+    """
+    instance._previous_counter_state = None
+    if raw or not saved_counter_fields(update_fields):
+        return
+    instance._previous_counter_state = instance.saved_counter_state()
+
+
+@receiver(post_save, sender=Ticket)
+def update_ticket_counters(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Move the ticket between counters in the same transaction as the save
+    (Ticket.save is atomic).
+    """
+    saved_fields = saved_counter_fields(update_fields)
+    if raw or not saved_fields:
+        return
+    old_state = instance._previous_counter_state
+    new_state = counters.ticket_state(instance)
+    if old_state is not None:
+        # Only the saved fields changed in the database
+        new_state = tuple(
+            new if field in saved_fields else old
+            for field, old, new in zip(Ticket.COUNTER_FIELDS, old_state, new_state)
+        )
+    if new_state != old_state:
+        counters.record_ticket_change(old_state, new_state)
+    instance._counter_state = new_state
+
+
+@receiver(post_save, sender=Ticket)
+def record_status_transition(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Count the status change in the metrics once it commits.
+    """
+    if raw or 'status' not in saved_counter_fields(update_fields):
+        return
+    old_state = instance._previous_counter_state
+    previous_status = old_state[Ticket.COUNTER_FIELDS.index('status')] if old_state else 'none'
+    if previous_status == instance.status:
+        return
+    status = instance.status
+    transaction.on_commit(lambda: TICKET_STATUS_TRANSITIONS.inc(from_status=previous_status, to_status=status))
+
+
+@receiver(post_delete, sender=Ticket)
+def remove_ticket_counters(sender, instance, **kwargs):
+    state = getattr(instance, '_counter_state', None) or counters.ticket_state(instance)
+    counters.record_ticket_change(old_state=state)
+
+
+@receiver(pre_delete, sender=User)
+def clear_assignee_counters(sender, instance, origin=None, **kwargs):
+    """
+    Move the tickets assigned to a deleted user to the unassigned counters.
+    Tickets created by the deleted users go away with them and leave their
+    counters in remove_ticket_counters.
+    """
+    deleted_users = origin if isinstance(origin, QuerySet) and origin.model is User else [instance]
+    tickets = Ticket.objects.filter(assigned_to=instance).exclude(created_by__in=deleted_users)
+    counters.record_cleared_field(tickets, 'assigned_to_id')
+
+
+@receiver(pre_delete, sender=Category)
+def clear_category_counters(sender, instance, **kwargs):
+    counters.record_cleared_field(Ticket.objects.filter(category=instance), 'category_id')
+
+
+@receiver(pre_delete, sender=Department)
+def clear_department_counters(sender, instance, **kwargs):
+    counters.record_cleared_field(Ticket.objects.filter(department=instance), 'department_id')
+
+
+@receiver(post_save, sender=User)
+def invalidate_dashboard_user_count(sender, instance, created, raw=False, **kwargs):
+    # Logins save the user too; only new users change the count
+    if created:
+        counters.invalidate_dashboard_lookups()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_dashboard_lookups(sender, **kwargs):
+    counters.invalidate_dashboard_lookups()
+
+
+@receiver(post_save, sender=Ticket)
+def record_ticket_analytics(sender, instance, raw=False, **kwargs):
+    """
+    Add the transitions stamped by Ticket.save to the analytics rollups.
+    """
+    events = getattr(instance, '_transitions', None)
+    if raw or not events:
+        return
+    analytics.record_ticket_events(instance, events)
+    instance._transitions = set()
+
+
+@receiver(post_save, sender=Ticket)
+def update_ticket_search_document(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the ticket's full-text search document in step with its title and
+    description.
+    """
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    if created:
+        TicketSearchDocument.objects.create(
+            ticket=instance,
+            title=instance.title,
+            description=instance.description,
+        )
+        return
+    
+    updated = TicketSearchDocument.objects.filter(ticket=instance).update(
+        title=instance.title,
+        description=instance.description,
+    )
+    if not updated:
+        rebuild_ticket_search_document(instance)
+
+
+def rebuild_ticket_search_document(ticket):
+    TicketSearchDocument.objects.update_or_create(
+        ticket=ticket,
+        defaults={'title': ticket.title, 'description': ticket.description},
+    )
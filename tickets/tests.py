@@ -1,3 +1,532 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import UserProfile
+from accounts.tokens import get_deny_list
+from notifications.models import Notification
+from support_system.metrics import NOTIFICATION_FANOUT
+
+from . import numbering
+from .analytics import activity_series, bucket_start, rebuild_rollups, resolution_percentiles
+from .counters import counter_drift
+from .models import (
+    Category, Comment, Department, ResolutionTimeRollup, Ticket, TicketActivityRollup, TicketNumberSequence,
+    TicketSearchDocument,
+)
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import filter_tickets, get_snippets, search_tickets
+from .views import TicketListView
+
+
+def create_user(username, role):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    # An update rather than a save: a role change revokes the user's tokens
+    UserProfile.objects.filter(user=user).update(role=role)
+    user.profile.refresh_from_db()
+    return user
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class TicketApiQueryTests(TestCase):
+    """
+    The ticket and comment endpoints run a fixed number of queries however
+    many rows they return, for every role. A missing select_related or
+    prefetch fails both the strict query budget and the exact counts here.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', 'admin')
+        cls.agents = [create_user(f'agent{index}', 'support') for index in range(2)]
+        cls.clients = [create_user(f'client{index}', 'client') for index in range(2)]
+        departments = [
+            Department.objects.create(name='Technical Support', code='tech_support'),
+            Department.objects.create(name='Billing & Accounts', code='billing'),
+        ]
+        categories = [
+            Category.objects.create(name='Technical Issues', code='technical'),
+            Category.objects.create(name='Account Issues', code='account'),
+        ]
+        assignees = [cls.agents[0], cls.agents[1], None]
+        cls.tickets = []
+        for index in range(9):
+            ticket = Ticket.objects.create(
+                title=f'Printer {index} is jammed',
+                description='The printer on the third floor jams on every page.',
+                created_by=cls.clients[index % 2],
+                assigned_to=assignees[index % 3],
+                category=categories[index % 2],
+                department=departments[index % 2],
+            )
+            for author in {ticket.created_by, ticket.assigned_to or cls.admin, cls.admin}:
+                Comment.objects.create(ticket=ticket, author=author, text='Replaced the printer toner.')
+            cls.tickets.append(ticket)
+        cls.users = {'admin': cls.admin, 'support': cls.agents[0], 'client': cls.clients[0]}
+
+    def setUp(self):
+        # The JWT deny-list is cached across requests; load it up front so
+        # every request below runs the same queries
+        cache.clear()
+        get_deny_list()
+
+    def api_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def visible_ticket(self, user):
+        return next(
+            ticket for ticket in self.tickets
+            if user == self.admin or user in (ticket.created_by, ticket.assigned_to)
+        )
+
+    def test_ticket_list(self):
+        for role, user in self.users.items():
+            client = self.api_client(user)
+            with self.subTest(role=role), self.assertNumQueries(2):
+                response = client.get('/api/tickets/')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.data['results']), 1)
+
+    def test_ticket_retrieve(self):
+        for role, user in self.users.items():
+            client = self.api_client(user)
+            ticket = self.visible_ticket(user)
+            with self.subTest(role=role), self.assertNumQueries(3):
+                response = client.get(f'/api/tickets/{ticket.pk}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.data['comments']), 1)
+
+    def test_ticket_search(self):
+        for role, user in self.users.items():
+            client = self.api_client(user)
+            with self.subTest(role=role), self.assertNumQueries(4):
+                response = client.get('/api/tickets/search/', {'q': 'toner'})
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.data['results']), 1)
+
+    def test_ticket_bulk(self):
+        ids = [ticket.pk for ticket in self.tickets]
+        # Admin: auth, savepoint, lock, update, counters, emails,
+        # notifications, unread counts, release. Support changes no status
+        # (no notifications) and looks up which of the other ids are
+        # forbidden.
+        for role, change, queries in [('admin', {'status': 'in_progress'}, 9), ('support', {'priority': 'high'}, 7)]:
+            client = self.api_client(self.users[role])
+            with self.subTest(role=role), self.assertNumQueries(queries):
+                response = client.post('/api/tickets/bulk/', {'ids': ids, **change}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(response.data['updated'], 1)
+
+        client = self.api_client(self.users['client'])
+        with self.assertNumQueries(1):
+            response = client.post('/api/tickets/bulk/', {'ids': ids, 'status': 'closed'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_ticket_bulk_is_constant_in_the_number_of_tickets(self):
+        client = self.api_client(self.admin)
+        with CaptureQueriesContext(connection) as one:
+            client.post('/api/tickets/bulk/', {'ids': [self.tickets[0].pk], 'status': 'resolved'}, format='json')
+        with CaptureQueriesContext(connection) as many:
+            ids = [ticket.pk for ticket in self.tickets[1:]]
+            response = client.post('/api/tickets/bulk/', {'ids': ids, 'status': 'resolved'}, format='json')
+        self.assertEqual(response.data['updated'], len(ids))
+        self.assertEqual(len(many), len(one))
+
+    def test_ticket_bulk_counts_the_fanout_once_committed(self):
+        def observed():
+            state = NOTIFICATION_FANOUT.values.get(('ticket_bulk_update',))
+            return sum(state[:-1]) if state else 0
+
+        client = self.api_client(self.admin)
+        before = observed()
+        ids = [ticket.pk for ticket in self.tickets]
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            client.post('/api/tickets/bulk/', {'ids': ids, 'status': 'in_progress'}, format='json')
+            raise RuntimeError
+        self.assertEqual(observed(), before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/tickets/bulk/', {'ids': ids, 'status': 'in_progress'}, format='json')
+        self.assertEqual(observed(), before + 1)
+
+    def test_comment_list(self):
+        for role, user in self.users.items():
+            client = self.api_client(user)
+            with self.subTest(role=role), self.assertNumQueries(2):
+                response = client.get('/api/comments/')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.data['results']), 1)
+
+    def test_comment_retrieve(self):
+        for role, user in self.users.items():
+            client = self.api_client(user)
+            comment = self.visible_ticket(user).comments.first()
+            with self.subTest(role=role), self.assertNumQueries(2):
+                response = client.get(f'/api/comments/{comment.pk}/')
+            self.assertEqual(response.status_code, 200)
+
+
+class TicketSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = create_user('client', 'client')
+        cls.printer = Ticket.objects.create(
+            title='Printer is jammed', description='Paper is stuck in the tray.', created_by=cls.client_user,
+        )
+        cls.login = Ticket.objects.create(
+            title='Cannot log in', description='The password is rejected.', created_by=cls.client_user,
+        )
+
+    def search(self, query):
+        return [ticket.pk for ticket in search_tickets(Ticket.objects.all(), query)]
+
+    def test_comments_are_searched_on_their_own_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            comment = Comment.objects.create(ticket=self.login, author=self.client_user, text='The VPN token expired.')
+        self.assertFalse(any(TicketSearchDocument._meta.db_table in query['sql'] for query in queries))
+        self.assertEqual(self.search('vpn token'), [self.login.pk])
+        self.assertEqual(list(filter_tickets(Ticket.objects.all(), 'vpn')), [self.login])
+
+        comment.text = 'Resetting the password helped.'
+        comment.save()
+        self.assertEqual(self.search('vpn'), [])
+        self.assertEqual(self.search('resetting'), [self.login.pk])
+
+        comment.delete()
+        self.assertEqual(self.search('resetting'), [])
+
+    def test_ticket_ranks_by_its_best_match(self):
+        Comment.objects.create(ticket=self.login, author=self.client_user, text='Is this about the printer too?')
+        self.assertEqual(self.search('printer'), [self.printer.pk, self.login.pk])
+
+    def test_snippet_comes_from_the_document_or_the_best_comment(self):
+        Comment.objects.create(ticket=self.login, author=self.client_user, text='The tray of the scanner is fine.')
+        snippets = get_snippets('tray', [self.printer.pk, self.login.pk])
+        self.assertIn('<mark>tray</mark>', snippets[self.printer.pk])
+        self.assertIn('stuck', snippets[self.printer.pk])
+        self.assertIn('scanner', snippets[self.login.pk])
+
+
+class TicketCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = create_user('client', 'client')
+        cls.agents = [create_user(f'agent{index}', 'support') for index in range(2)]
+        cls.department = Department.objects.create(name='Technical Support', code='tech_support')
+        cls.category = Category.objects.create(name='Technical Issues', code='technical')
+        for creator, assignee in [
+            (cls.client_user, cls.agents[0]),
+            (cls.client_user, cls.agents[1]),
+            (cls.agents[0], cls.agents[1]),
+            (cls.agents[1], cls.agents[0]),
+        ]:
+            Ticket.objects.create(
+                title='Printer is jammed', description='Paper is stuck.', created_by=creator,
+                assigned_to=assignee, category=cls.category, department=cls.department,
+            )
+
+    def test_deleting_an_assignee(self):
+        self.agents[0].delete()
+        self.assertEqual(Ticket.objects.filter(assigned_to=None).count(), 2)
+        self.assertEqual(counter_drift(), {})
+
+    def test_deleting_assignees_that_created_tickets_of_each_other(self):
+        User.objects.filter(pk__in=[agent.pk for agent in self.agents]).delete()
+        self.assertEqual(Ticket.objects.count(), 2)
+        self.assertEqual(counter_drift(), {})
+
+    def test_deleting_a_category_or_department(self):
+        self.category.delete()
+        self.department.delete()
+        self.assertEqual(Ticket.objects.filter(category=None, department=None).count(), 4)
+        self.assertEqual(counter_drift(), {})
+
+    def test_admin_dashboard(self):
+        self.client.force_login(create_user('admin', 'admin'))
+        cache.clear()
+        self.client.get(reverse('home'))
+        # Session, user and profile, counters; the other lookups are cached
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_tickets'], 4)
+        self.assertEqual(response.context['total_users'], 4)
+        self.assertEqual([department.ticket_count for department in response.context['departments']], [4])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Billing and Payments', code='billing')
+        response = self.client.get(reverse('home'))
+        self.assertEqual([category.ticket_count for category in response.context['categories']], [4, 0])
+
+
+class TicketChangeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = create_user('client', 'client')
+        cls.agent = create_user('agent', 'support')
+        cls.ticket = Ticket.objects.create(title='Printer is jammed', description='Paper is stuck.', created_by=cls.client_user)
+
+    def test_changed_fields(self):
+        self.assertIsNone(Ticket(title='Printer is jammed').changed_fields())
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertEqual(ticket.changed_fields(), set())
+        ticket.status = 'in_progress'
+        ticket.assigned_to = self.agent
+        self.assertEqual(ticket.changed_fields(), {'status', 'assigned_to'})
+
+        ticket = Ticket.objects.only('title').get(pk=self.ticket.pk)
+        ticket.title = 'Scanner is jammed'
+        self.assertEqual(ticket.changed_fields(), {'title'})
+
+    def test_save_changes_writes_only_the_changed_columns_without_reading_the_ticket(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.status = 'in_progress'
+        ticket.updated_by = self.agent
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ticket.save_changes(), {'status'})
+        ticket_queries = [
+            query['sql'] for query in queries
+            if 'FROM "tickets_ticket"' in query['sql'] or query['sql'].startswith('UPDATE "tickets_ticket"')
+        ]
+        self.assertEqual(len(ticket_queries), 1)
+        self.assertIn('"status"', ticket_queries[0])
+        self.assertNotIn('"description"', ticket_queries[0])
+
+        self.assertEqual(ticket.changed_fields(), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(ticket.save_changes(), set())
+
+    def test_status_change_notifies_with_the_previous_status(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.status = 'resolved'
+        ticket.updated_by = self.agent
+        ticket.save_changes()
+        notification = Notification.objects.get(user=self.client_user, title='Ticket Status Updated')
+        self.assertIn('from Open to Resolved', notification.message)
+
+        # Saves that don't touch the status notify nobody
+        ticket.priority = 'high'
+        ticket.save_changes()
+        self.assertEqual(Notification.objects.filter(title='Ticket Status Updated').count(), 1)
+
+
+class TicketAnalyticsTests(TestCase):
+    """
+    Three tickets opened at 9:00 on 10 March (local time), two of them
+    resolved by the same agent after one and ten hours.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.OPENED = timezone.make_aware(datetime(2026, 3, 10, 9))
+        cls.admin = create_user('admin', 'admin')
+        cls.agent = create_user('agent', 'support')
+        cls.department = Department.objects.create(name='Technical Support', code='tech_support')
+        cls.category = Category.objects.create(name='Technical Issues', code='technical')
+        cls.tickets = [cls.create_ticket() for _ in range(3)]
+        for ticket, hours in zip(cls.tickets, [1, 10]):
+            with patch('django.utils.timezone.now', return_value=cls.OPENED + timedelta(hours=hours)):
+                ticket.status = 'resolved'
+                ticket.save()
+
+    @classmethod
+    def create_ticket(cls):
+        with patch('django.utils.timezone.now', return_value=cls.OPENED):
+            return Ticket.objects.create(
+                title='Printer is jammed', description='Paper is stuck.', created_by=cls.admin,
+                assigned_to=cls.agent, category=cls.category, department=cls.department,
+            )
+
+    def setUp(self):
+        cache.clear()
+        get_deny_list()
+
+    def rollups(self):
+        return (
+            sorted(TicketActivityRollup.objects.values_list('granularity', 'bucket_start', 'department_key', 'opened', 'resolved')),
+            sorted(ResolutionTimeRollup.objects.values_list('dimension', 'bucket_start', 'key', 'bin', 'count')),
+        )
+
+    def test_transitions_are_stamped(self):
+        ticket = Ticket.objects.get(pk=self.tickets[0].pk)
+        self.assertEqual(ticket.assigned_at, self.OPENED)
+        self.assertEqual(ticket.resolved_at, self.OPENED + timedelta(hours=1))
+        self.assertIsNone(ticket.closed_at)
+
+        ticket.status = 'in_progress'
+        ticket.save(update_fields=['status'])
+        ticket.refresh_from_db()
+        self.assertIsNone(ticket.resolved_at)
+
+    def test_activity_series(self):
+        day = bucket_start(self.OPENED, 'day')
+        series = activity_series('day', day - timedelta(days=1), day + timedelta(days=2), self.department.pk)
+        self.assertEqual([(opened, resolved) for _, opened, resolved in series], [(0, 0), (3, 2), (0, 0)])
+
+        series = activity_series('hour', self.OPENED, self.OPENED + timedelta(hours=12))
+        self.assertEqual(len(series), 12)
+        self.assertEqual(series[0][1:], (3, 0))
+        self.assertEqual([hour for hour, (_, _, resolved) in enumerate(series) if resolved], [1, 10])
+
+    def test_resolution_percentiles_are_within_five_percent(self):
+        start, end = self.OPENED, self.OPENED + timedelta(days=1)
+        for dimension, key in [('agent', self.agent.pk), ('category', self.category.pk)]:
+            resolved, values = resolution_percentiles(dimension, start, end)[key]
+            self.assertEqual(resolved, 2)
+            self.assertAlmostEqual(values[50], 3600, delta=3600 * 0.05)
+            self.assertAlmostEqual(values[90], 36000, delta=36000 * 0.05)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_api(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+        day = bucket_start(self.OPENED, 'day')
+        params = {'start': day - timedelta(days=1), 'end': day + timedelta(days=2)}
+        with self.assertNumQueries(2):
+            response = client.get('/api/analytics/activity/', params)
+        self.assertEqual([row['opened'] for row in response.data['results']], [0, 3, 0])
+
+        response = client.get('/api/analytics/resolution-times/', {**params, 'group_by': 'agent'})
+        self.assertEqual(
+            [(row['name'], row['resolved']) for row in response.data['results']], [('agent', 2)],
+        )
+
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.agent).access_token}')
+        self.assertEqual(client.get('/api/analytics/activity/').status_code, 403)
+
+
+@override_settings(TICKET_NUMBER_BLOCK_SIZE=3)
+class TicketNumberTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = create_user('client', 'client')
+        cls.department = Department.objects.create(name='Technical Support', code='tech_support')
+
+    def setUp(self):
+        numbering._blocks.clear()
+
+    def create_ticket(self, department=None):
+        # The rest of a reserved block is handed out once the ticket commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(
+                title='Printer is jammed', description='Paper is stuck.',
+                created_by=self.client_user, department=department,
+            )
+
+    def next_number(self, prefix):
+        return TicketNumberSequence.objects.get(prefix=prefix).next_number
+
+    def test_numbers_come_from_blocks(self):
+        tickets = [self.create_ticket(self.department) for _ in range(4)] + [self.create_ticket()]
+        self.assertEqual(
+            [ticket.ticket_id for ticket in tickets],
+            ['TECH-000001', 'TECH-000002', 'TECH-000003', 'TECH-000004', 'GEN-000001'],
+        )
+        # Two blocks of 3 for TECH, one for GEN
+        self.assertEqual(self.next_number('TECH'), 7)
+        self.assertEqual(self.next_number('GEN'), 4)
+
+    def test_rolled_back_reservation_is_not_handed_out(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            ticket = Ticket.objects.create(
+                title='Printer is jammed', description='Paper is stuck.',
+                created_by=self.client_user, department=self.department,
+            )
+            self.assertEqual(ticket.ticket_id, 'TECH-000001')
+            raise RuntimeError
+        self.assertFalse(TicketNumberSequence.objects.filter(prefix='TECH').exists())
+        self.assertEqual(numbering._blocks, {})
+
+        self.assertEqual(self.create_ticket(self.department).ticket_id, 'TECH-000001')
+        self.assertEqual(self.create_ticket(self.department).ticket_id, 'TECH-000002')
+        self.assertEqual(self.next_number('TECH'), 4)
+
+    def test_reserve_ticket_numbers(self):
+        self.assertEqual(numbering.reserve_ticket_numbers('BILLING', 5), 1)
+        self.assertEqual(numbering.reserve_ticket_numbers('BILLING', 2), 6)
+        self.assertEqual(self.next_number('BILLING'), 8)
+
+    def test_search_by_number_and_prefix(self):
+        tickets = [self.create_ticket(self.department) for _ in range(2)] + [self.create_ticket()]
+        self.assertEqual(list(filter_tickets(Ticket.objects.all(), 'tech-2')), [tickets[1]])
+        self.assertEqual(list(filter_tickets(Ticket.objects.all(), 'TECH-000001')), [tickets[0]])
+        self.assertEqual(list(filter_tickets(Ticket.objects.order_by('pk'), 'TECH-')), tickets[:2])
+        self.assertIsNone(numbering.ticket_number_filter('printer'))
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Seven tickets, the first five created in the same instant, so pages have
+    to split runs of equal timestamps on the primary key.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', 'admin')
+        created_at = timezone.now()
+        cls.tickets = [
+            Ticket.objects.create(title=f'Printer {index} is jammed', description='Paper is stuck.', created_by=cls.admin)
+            for index in range(7)
+        ]
+        Ticket.objects.filter(pk__in=[ticket.pk for ticket in cls.tickets[:5]]).update(created_at=created_at)
+        cls.expected = list(Ticket.objects.order_by('-created_at', 'id').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_never_skip_or_repeat_rows(self):
+        paginator = KeysetPaginator(page_size=3)
+        pages = [paginator.paginate(Ticket.objects.all())]
+        while pages[-1].has_next:
+            pages.append(paginator.paginate(Ticket.objects.all(), pages[-1].next_cursor))
+        self.assertEqual([[ticket.pk for ticket in page] for page in pages], [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertFalse(pages[0].has_previous)
+
+        # And back again from the last page
+        previous = paginator.paginate(Ticket.objects.all(), pages[-1].previous_cursor)
+        self.assertEqual([ticket.pk for ticket in previous], self.expected[3:6])
+        previous = paginator.paginate(Ticket.objects.all(), previous.previous_cursor)
+        self.assertEqual([ticket.pk for ticket in previous], self.expected[:3])
+        self.assertFalse(previous.has_previous)
+        self.assertTrue(previous.has_next)
+
+    def test_invalid_cursors(self):
+        paginator = KeysetPaginator()
+        for cursor in ['not a cursor', paginator.encode_cursor([1]), paginator.encode_cursor(['yesterday', 1])]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.paginate(Ticket.objects.all(), cursor)
+
+    def test_api_walks_every_page_without_a_count(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+        url, seen = '/api/tickets/?page_size=2', []
+        while url:
+            response = client.get(url)
+            self.assertNotIn('count', response.data)
+            seen += [ticket['id'] for ticket in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(client.get('/api/tickets/?cursor=invalid').status_code, 404)
+
+    @patch.object(TicketListView, 'page_size', 3)
+    def test_ticket_list_links_keep_the_filters(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('ticket_list'), {'status': 'open'})
+        self.assertEqual([ticket.pk for ticket in response.context['tickets']], self.expected[:3])
+        self.assertIsNone(response.context['previous_page_url'])
+
+        response = self.client.get(response.context['next_page_url'])
+        self.assertEqual([ticket.pk for ticket in response.context['tickets']], self.expected[3:6])
+        self.assertEqual(response.context['first_page_url'], f"{reverse('ticket_list')}?status=open")
+        self.assertEqual(self.client.get(reverse('ticket_list'), {'cursor': 'invalid'}).status_code, 404)
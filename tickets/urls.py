@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     # API ViewSets
-    DepartmentViewSet, CategoryViewSet, TicketViewSet, CommentViewSet,
+    DepartmentViewSet, CategoryViewSet, TicketViewSet, CommentViewSet, TicketAnalyticsViewSet,
     # Template Views
     TicketListView, TicketDetailView, TicketCreateView, TicketUpdateView, TicketDeleteView,
     add_comment, home_view, ticket_assign, ticket_update_status
@@ -14,6 +14,7 @@ router.register(r'api/departments', DepartmentViewSet)
 router.register(r'api/categories', CategoryViewSet)
 router.register(r'api/tickets', TicketViewSet)
 router.register(r'api/comments', CommentViewSet)
+router.register(r'api/analytics', TicketAnalyticsViewSet, basename='ticket-analytics')
 
 # Template URLs
 template_urlpatterns = [
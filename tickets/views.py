@@ -1,7 +1,7 @@
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q, Count
+from django.db.models import Q, Prefetch
 from django.contrib.auth.models import User
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
@@ -9,15 +9,25 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, Http404
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
 
 from .models import Department, Category, Ticket, Comment
 from .serializers import (
     DepartmentSerializer, CategorySerializer,
-    TicketListSerializer, TicketDetailSerializer, CommentSerializer
+    TicketListSerializer, TicketDetailSerializer, CommentSerializer,
+    TicketActivityQuerySerializer, ResolutionTimeQuerySerializer, TicketBulkUpdateSerializer
 )
 from .forms import TicketForm, CommentForm, TicketFilterForm, TicketAssignForm, TicketStatusUpdateForm
+from .analytics import activity_series, resolution_percentiles
+from .bulk import FORBIDDEN, NOT_FOUND, UPDATED, BulkChangeError, apply_bulk_change, filter_bulk_tickets
+from .counters import ANY, NONE, TicketCounts, get_dashboard_lookups
+from .pagination import KeysetPagination, KeysetPaginator, InvalidCursor, keyset_page_links
+from .search import TicketSearchFilter, filter_tickets, get_snippets, search_tickets
+from accounts.roles import get_user_role
 from accounts.permissions import IsAdmin, IsAdminOrSupport
+from support_system.query_budget import QueryBudgetMixin
 from .permissions import CanViewTicket, CanUpdateTicket, CanDeleteTicket, CanCommentOnTicket
 
 class DepartmentViewSet(viewsets.ModelViewSet):
@@ -38,22 +48,26 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Ticket.objects.all()
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description']
+    pagination_class = KeysetPagination
+    # auth user with profile + tickets (+ comments with authors for detail,
+    # + ranking and snippets for search); bulk is constant in the number
+    # of tickets
+    query_budget = {'list': 2, 'retrieve': 3, 'search': 4, 'bulk': 20}
+    filter_backends = [TicketSearchFilter, filters.OrderingFilter]
     ordering_fields = ['created_at', 'updated_at', 'priority', 'status']
     ordering = ['-created_at']
     
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ['list', 'search']:
             return TicketListSerializer
         return TicketDetailSerializer
     
     def get_permissions(self):
         if self.action == 'create':
             permission_classes = [permissions.IsAuthenticated]
-        elif self.action == 'list':
+        elif self.action in ['list', 'search']:
             permission_classes = [permissions.IsAuthenticated]
         elif self.action in ['retrieve', 'update', 'partial_update', 'destroy']:
             if self.action == 'retrieve':
@@ -69,26 +83,62 @@ class TicketViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         
+        # Load the nested serializer relations up front instead of per row
+        queryset = Ticket.objects.select_related('created_by', 'assigned_to', 'category', 'department')
+        if self.action not in ['list', 'search', 'bulk']:
+            queryset = queryset.prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.select_related('author'))
+            )
+        
         # Admin can see all tickets
-        if user.profile.role == 'admin':
-            return Ticket.objects.all()
+        if self.request.role == 'admin':
+            return queryset
         
         # Support can see tickets assigned to them or unassigned
-        if user.profile.role == 'support':
-            return Ticket.objects.filter(Q(assigned_to=user) | Q(assigned_to=None))
+        if self.request.role == 'support':
+            return queryset.filter(Q(assigned_to=user) | Q(assigned_to=None))
         
         # Client can only see their own tickets
-        return Ticket.objects.filter(created_by=user)
+        return queryset.filter(created_by=user)
     
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over ticket title, description and comments.
+        Returns the best matches first with a highlighted snippet each.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"detail": "Query parameter 'q' is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response(
+                {"detail": "limit and offset must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        tickets = search_tickets(self.get_queryset(), query, limit=limit, offset=offset)
+        results = self.get_serializer(tickets, many=True).data
+        for data, ticket in zip(results, tickets):
+            data['rank'] = ticket.search_rank
+            data['snippet'] = ticket.search_snippet
+        return Response({'results': results})
+    
     @action(detail=True, methods=['post'])
     def assign(self, request, pk=None):
         ticket = self.get_object()
         
         # Only admin can assign tickets
-        if request.user.profile.role != 'admin':
+        if request.role != 'admin':
             return Response(
                 {"detail": "You do not have permission to assign tickets."},
                 status=status.HTTP_403_FORBIDDEN
@@ -103,16 +153,17 @@ class TicketViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            user = User.objects.get(pk=user_id)
+            user = User.objects.select_related('profile').get(pk=user_id)
             # Only support users can be assigned tickets
-            if not hasattr(user, 'profile') or user.profile.role != 'support':
+            if get_user_role(user) != 'support':
                 return Response(
                     {"detail": "Only support users can be assigned tickets."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
             ticket.assigned_to = user
-            ticket.save()
+            ticket.updated_by = request.user
+            ticket.save_changes()
             
             serializer = self.get_serializer(ticket)
             return Response(serializer.data)
@@ -122,31 +173,144 @@ class TicketViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @extend_schema(request=TicketBulkUpdateSerializer, responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Make one change (``status``, ``priority`` and/or ``assigned_to_id``)
+        to many tickets, given as a list of ``ids`` or as a ``filter``.
+        Returns the result for each ticket: updated, unchanged, forbidden
+        (visible but not yours to change) or not_found.
+        """
+        # Admins change any ticket, support staff the status and priority
+        # of tickets assigned to them
+        if request.role not in ['admin', 'support']:
+            return Response(
+                {"detail": "You do not have permission to change tickets in bulk."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = TicketBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        changes = data['changes']
+        if 'assigned_to' in changes and request.role != 'admin':
+            return Response(
+                {"detail": "You do not have permission to assign tickets."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        visible = self.get_queryset()
+        changeable = visible if request.role == 'admin' else visible.filter(assigned_to=request.user)
+        
+        if 'ids' in data:
+            tickets = changeable.filter(pk__in=data['ids'])
+        else:
+            tickets = filter_bulk_tickets(changeable, data['filter'])
+        try:
+            results = apply_bulk_change(tickets, changes, request.user)
+        except BulkChangeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if 'ids' in data:
+            missing = [pk for pk in data['ids'] if pk not in results]
+            forbidden = set(visible.filter(pk__in=missing).values_list('pk', flat=True)) if missing else set()
+            results = {
+                pk: results.get(pk) or (FORBIDDEN if pk in forbidden else NOT_FOUND)
+                for pk in data['ids']
+            }
+        return Response({
+            'updated': sum(result == UPDATED for result in results.values()),
+            'results': [{'id': pk, 'result': result} for pk, result in results.items()],
+        })
+
+class CommentViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    # auth user with profile + comments
+    query_budget = {'list': 2, 'retrieve': 2}
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at']
     ordering = ['-created_at']
     
     def get_queryset(self):
         user = self.request.user
+        queryset = Comment.objects.select_related('author')
         
         # Filter comments based on user role
-        if user.profile.role == 'admin':
+        if self.request.role == 'admin':
             # Admin can see all comments
-            return Comment.objects.all()
-        elif user.profile.role == 'support':
+            return queryset
+        elif self.request.role == 'support':
             # Support can see comments on tickets assigned to them
-            return Comment.objects.filter(ticket__assigned_to=user)
+            return queryset.filter(ticket__assigned_to=user)
         else:  # client
             # Client can only see comments on their own tickets
-            return Comment.objects.filter(ticket__created_by=user)
+            return queryset.filter(ticket__created_by=user)
     
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+class TicketAnalyticsViewSet(QueryBudgetMixin, viewsets.ViewSet):
+    """
+    Admin-only ticket reports. They read the analytics rollups (see
+    tickets/analytics.py), so their cost depends on the number of buckets
+    in the range and not on the number of tickets.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    # auth user with profile + rollups (+ agent or category names)
+    query_budget = {'activity': 2, 'resolution_times': 3}
+    
+    @extend_schema(parameters=[TicketActivityQuerySerializer], responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['get'])
+    def activity(self, request):
+        """
+        Tickets opened and resolved per hour or day, optionally for one
+        department.
+        """
+        params = TicketActivityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        
+        series = activity_series(query['granularity'], query['start'], query['end'], query.get('department'))
+        return Response({
+            'granularity': query['granularity'],
+            'results': [
+                {'bucket': bucket, 'opened': opened, 'resolved': resolved}
+                for bucket, opened, resolved in series
+            ],
+        })
+    
+    @extend_schema(parameters=[ResolutionTimeQuerySerializer], responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['get'], url_path='resolution-times')
+    def resolution_times(self, request):
+        """
+        Median and 90th percentile time to resolution (in seconds) per agent
+        or per category for the tickets resolved in the range.
+        """
+        params = ResolutionTimeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        
+        percentiles = resolution_percentiles(query['group_by'], query['start'], query['end'])
+        if query['group_by'] == 'agent':
+            names = dict(User.objects.filter(pk__in=percentiles).values_list('pk', 'username'))
+        else:
+            names = dict(Category.objects.filter(pk__in=percentiles).values_list('pk', 'name'))
+        
+        results = [
+            {
+                # 0 stands for unassigned / uncategorized tickets
+                'id': key or None,
+                'name': names.get(key),
+                'resolved': resolved,
+                'p50_seconds': round(values[50]),
+                'p90_seconds': round(values[90]),
+            }
+            for key, (resolved, values) in sorted(percentiles.items())
+        ]
+        return Response({'group_by': query['group_by'], 'results': results})
+
 
 # Template-based views
 @method_decorator(login_required, name='dispatch')
@@ -154,22 +318,23 @@ class TicketListView(ListView):
     model = Ticket
     template_name = 'tickets/ticket_list.html'
     context_object_name = 'tickets'
-    paginate_by = 10
+    # Keyset pagination instead of paginate_by: no OFFSET scan and no COUNT(*)
+    page_size = 10
     
     def get_queryset(self):
         user = self.request.user
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('created_by', 'assigned_to', 'category')
         
         # Filter based on user role
-        if user.profile.role == 'admin':
+        if self.request.role == 'admin':
             # Admin can see all tickets
-            queryset = Ticket.objects.all()
-        elif user.profile.role == 'support':
+            pass
+        elif self.request.role == 'support':
             # Support can see tickets assigned to them or unassigned
-            queryset = Ticket.objects.filter(Q(assigned_to=user) | Q(assigned_to=None))
+            queryset = queryset.filter(Q(assigned_to=user) | Q(assigned_to=None))
         else:  # client
             # Client can only see their own tickets
-            queryset = Ticket.objects.filter(created_by=user)
+            queryset = queryset.filter(created_by=user)
         
         # Apply filters from form
         form = TicketFilterForm(self.request.GET)
@@ -182,23 +347,40 @@ class TicketListView(ListView):
                 category_code = form.cleaned_data['category']
                 queryset = queryset.filter(category__code=category_code)
             if form.cleaned_data.get('search'):
-                search_term = form.cleaned_data['search']
-                queryset = queryset.filter(
-                    Q(title__icontains=search_term) | 
-                    Q(description__icontains=search_term) |
-                    Q(ticket_id__icontains=search_term)
-                )
+                queryset = filter_tickets(queryset, form.cleaned_data['search'])
         
         return queryset.order_by('-created_at')
     
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+        paginator = KeysetPaginator(ordering=('-created_at', 'id'), page_size=self.page_size)
+        try:
+            page = paginator.paginate(self.object_list, self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid page.")
+        
+        # Highlight the matched text for the tickets on this page only
+        search_term = self.request.GET.get('search', '').strip()
+        if search_term:
+            snippets = get_snippets(search_term, [ticket.pk for ticket in page])
+            for ticket in page:
+                ticket.search_snippet = snippets.get(ticket.pk, '')
+        
+        first_url, previous_url, next_url = keyset_page_links(self.request, page)
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context['page'] = page
+        context['is_paginated'] = page.has_next or page.has_previous
+        context['first_page_url'] = first_url
+        context['previous_page_url'] = previous_url
+        context['next_page_url'] = next_url
         context['filter_form'] = TicketFilterForm(self.request.GET)
         return context
 
 @method_decorator(login_required, name='dispatch')
 class TicketDetailView(DetailView):
     model = Ticket
+    queryset = Ticket.objects.select_related(
+        'created_by', 'assigned_to', 'category', 'department'
+    ).prefetch_related(Prefetch('comments', queryset=Comment.objects.select_related('author')))
     template_name = 'tickets/ticket_detail.html'
     context_object_name = 'ticket'
     
@@ -207,11 +389,11 @@ class TicketDetailView(DetailView):
         user = self.request.user
         
         # Check if user has permission to view this ticket
-        if user.profile.role == 'admin':
+        if self.request.role == 'admin':
             return obj
-        elif user.profile.role == 'support' and (obj.assigned_to == user or obj.assigned_to is None):
+        elif self.request.role == 'support' and (obj.assigned_to == user or obj.assigned_to is None):
             return obj
-        elif user.profile.role == 'client' and obj.created_by == user:
+        elif self.request.role == 'client' and obj.created_by == user:
             return obj
         else:
             messages.error(self.request, "You don't have permission to view this ticket.")
@@ -220,15 +402,15 @@ class TicketDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['comment_form'] = CommentForm()
-        context['comments'] = self.object.comments.all().order_by('-created_at')
+        context['comments'] = self.object.comments.select_related('author').order_by('-created_at')
         
         # Add assign form for admins
-        if self.request.user.profile.role == 'admin':
+        if self.request.role == 'admin':
             context['assign_form'] = TicketAssignForm()
         
         # Add status update form for admins and assigned support staff
-        if self.request.user.profile.role == 'admin' or \
-           (self.request.user.profile.role == 'support' and self.object.assigned_to == self.request.user):
+        if self.request.role == 'admin' or \
+           (self.request.role == 'support' and self.object.assigned_to == self.request.user):
             context['status_form'] = TicketStatusUpdateForm(initial={'status': self.object.status})
         
         return context
@@ -248,31 +430,33 @@ class TicketDetailView(DetailView):
                 return redirect('ticket_detail', pk=self.object.pk)
         
         # Handle ticket assignment (admin only)
-        elif 'assign_submit' in request.POST and request.user.profile.role == 'admin':
+        elif 'assign_submit' in request.POST and request.role == 'admin':
             assign_form = TicketAssignForm(request.POST)
             if assign_form.is_valid():
                 self.object.assigned_to = assign_form.cleaned_data['assigned_to']
-                self.object.save()
+                self.object.updated_by = request.user
+                self.object.save_changes()
                 messages.success(request, f"Ticket assigned to {self.object.assigned_to.username}.")
                 return redirect('ticket_detail', pk=self.object.pk)
         
         # Handle status update (admin or assigned support)
         elif 'status_submit' in request.POST and \
-             (request.user.profile.role == 'admin' or \
-              (request.user.profile.role == 'support' and self.object.assigned_to == request.user)):
+             (request.role == 'admin' or \
+              (request.role == 'support' and self.object.assigned_to == request.user)):
             status_form = TicketStatusUpdateForm(request.POST)
             if status_form.is_valid():
                 old_status = self.object.status
                 new_status = status_form.cleaned_data['status']
                 self.object.status = new_status
-                self.object.save()
+                self.object.updated_by = request.user
+                self.object.save_changes()
                 
                 # Add a system comment about the status change
                 if old_status != new_status:
                     Comment.objects.create(
                         ticket=self.object,
                         author=request.user,
-                        content=f"Status changed from {dict(Ticket.STATUS_CHOICES)[old_status]} to {dict(Ticket.STATUS_CHOICES)[new_status]}"
+                        text=f"Status changed from {dict(Ticket.STATUS_CHOICES)[old_status]} to {dict(Ticket.STATUS_CHOICES)[new_status]}"
                     )
                     messages.success(request, "Ticket status updated successfully.")
                 
@@ -289,14 +473,14 @@ class TicketCreateView(CreateView):
     
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['user'] = self.request.user
+        kwargs['role'] = self.request.role
         return kwargs
     
     def form_valid(self, form):
         form.instance.created_by = self.request.user
         form.instance.status = 'open'
         
-        if self.request.user.profile.role == 'client':
+        if self.request.role == 'client':
             form.instance.assigned_to = None
         
         category_obj = form.cleaned_data.get('category')
@@ -323,7 +507,7 @@ class TicketUpdateView(UpdateView):
     
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['user'] = self.request.user
+        kwargs['role'] = self.request.role
         return kwargs
     
     def get_object(self, queryset=None):
@@ -331,11 +515,11 @@ class TicketUpdateView(UpdateView):
         user = self.request.user
         
         # Check if user has permission to update this ticket
-        if user.profile.role == 'admin':
+        if self.request.role == 'admin':
             return obj
-        elif user.profile.role == 'support' and obj.assigned_to == user:
+        elif self.request.role == 'support' and obj.assigned_to == user:
             return obj
-        elif user.profile.role == 'client' and obj.created_by == user and obj.status == 'open':
+        elif self.request.role == 'client' and obj.created_by == user and obj.status == 'open':
             # Clients can only edit their own open tickets
             return obj
         else:
@@ -343,8 +527,9 @@ class TicketUpdateView(UpdateView):
             return redirect('ticket_list')
     
     def form_valid(self, form):
-    # If needed, update fields here (e.g., set updated_by, or other logic)
-    
+        # Lets the status notification skip the user making the change
+        form.instance.updated_by = self.request.user
+        
         category_obj = form.cleaned_data.get('category')
         department_obj = form.cleaned_data.get('department')
         
@@ -369,9 +554,9 @@ class TicketDeleteView(DeleteView):
         user = self.request.user
         
         # Check if user has permission to delete this ticket
-        if user.profile.role == 'admin':
+        if self.request.role == 'admin':
             return obj
-        elif user.profile.role == 'client' and obj.created_by == user and obj.status == 'open':
+        elif self.request.role == 'client' and obj.created_by == user and obj.status == 'open':
             # Clients can only delete their own open tickets
             return obj
         else:
@@ -386,7 +571,7 @@ class TicketDeleteView(DeleteView):
 def ticket_assign(request, pk):
     if request.method == 'POST':
         ticket = get_object_or_404(Ticket, pk=pk)
-        if request.user.profile.role != 'admin':
+        if request.role != 'admin':
             messages.error(request, 'You do not have permission to assign tickets.')
             return redirect('ticket_detail', pk=pk)
 
@@ -394,7 +579,8 @@ def ticket_assign(request, pk):
         if assigned_to_id:
             assigned_user = get_object_or_404(User, pk=assigned_to_id)
             ticket.assigned_to = assigned_user
-            ticket.save()
+            ticket.updated_by = request.user
+            ticket.save_changes()
             messages.success(request, 'Ticket assigned successfully.')
         else:
             messages.error(request, 'Please select a support agent to assign.')
@@ -410,14 +596,15 @@ def ticket_update_status(request, pk):
     if request.method == 'POST':
         ticket = get_object_or_404(Ticket, pk=pk)
 
-        if request.user.profile.role not in ['admin', 'support']:
+        if request.role not in ['admin', 'support']:
             messages.error(request, 'You do not have permission to update ticket status.')
             return redirect('ticket_detail', pk=pk)
 
         new_status = request.POST.get('status')
         if new_status in dict(Ticket.STATUS_CHOICES).keys():
             ticket.status = new_status
-            ticket.save()
+            ticket.updated_by = request.user
+            ticket.save_changes()
             messages.success(request, 'Ticket status updated successfully.')
         else:
             messages.error(request, 'Invalid status.')
@@ -431,11 +618,11 @@ def add_comment(request, ticket_id):
     
     # Check if user has permission to comment on this ticket
     user = request.user
-    if user.profile.role == 'admin':
+    if request.role == 'admin':
         pass  # Admin can comment on any ticket
-    elif user.profile.role == 'support' and (ticket.assigned_to == user or ticket.assigned_to is None):
+    elif request.role == 'support' and (ticket.assigned_to == user or ticket.assigned_to is None):
         pass  # Support can comment on assigned tickets or unassigned tickets
-    elif user.profile.role == 'client' and ticket.created_by == user:
+    elif request.role == 'client' and ticket.created_by == user:
         pass  # Client can comment on their own tickets
     else:
         messages.error(request, "You don't have permission to comment on this ticket.")
@@ -457,31 +644,42 @@ def home_view(request):
     user = request.user
     context = {}
     
-    # Add statistics for admin dashboard
-    if user.profile.role == 'admin':
-        context['total_tickets'] = Ticket.objects.count()
-        context['total_users'] = User.objects.count()
-        context['open_tickets'] = Ticket.objects.filter(status='open').count()
-        context['resolved_tickets'] = Ticket.objects.filter(status='resolved').count()
+    # Ticket numbers come from the counter table, one query per dashboard
+    # (see tickets/counters.py); the admin's other numbers are cached
+    if request.role == 'admin':
+        counts = TicketCounts.for_admin()
+        lookups = get_dashboard_lookups()
+        context['total_tickets'] = counts.count(assignee_key=ANY)
+        context['total_users'] = lookups['total_users']
+        context['open_tickets'] = counts.count(assignee_key=ANY, status='open')
+        context['resolved_tickets'] = counts.count(assignee_key=ANY, status='resolved')
         
         # Tickets by department
-        departments = Department.objects.annotate(ticket_count=Count('tickets'))
+        department_counts = counts.group_by('department_key', assignee_key=ANY)
+        departments = lookups['departments']
+        for department in departments:
+            department.ticket_count = department_counts.get(department.pk, 0)
         context['departments'] = departments
         
         # Tickets by category
-        categories = Category.objects.annotate(ticket_count=Count('tickets'))
+        category_counts = counts.group_by('category_key', assignee_key=ANY)
+        categories = lookups['categories']
+        for category in categories:
+            category.ticket_count = category_counts.get(category.pk, 0)
         context['categories'] = categories
     
     # For support staff
-    elif user.profile.role == 'support':
-        context['assigned_tickets'] = Ticket.objects.filter(assigned_to=user).count()
-        context['open_assigned_tickets'] = Ticket.objects.filter(assigned_to=user, status='open').count()
-        context['unassigned_tickets'] = Ticket.objects.filter(assigned_to=None).count()
+    elif request.role == 'support':
+        counts = TicketCounts.for_assignee(user)
+        context['assigned_tickets'] = counts.count(assignee_key=user.pk)
+        context['open_assigned_tickets'] = counts.count(assignee_key=user.pk, status='open')
+        context['unassigned_tickets'] = counts.count(assignee_key=NONE)
     
     # For clients
     else:
-        context['my_tickets'] = Ticket.objects.filter(created_by=user).count()
-        context['open_tickets'] = Ticket.objects.filter(created_by=user, status='open').count()
-        context['resolved_tickets'] = Ticket.objects.filter(created_by=user, status='resolved').count()
+        counts = TicketCounts.for_creator(user)
+        context['my_tickets'] = counts.count()
+        context['open_tickets'] = counts.count(status='open')
+        context['resolved_tickets'] = counts.count(status='resolved')
     
     return render(request, 'home.html', context)